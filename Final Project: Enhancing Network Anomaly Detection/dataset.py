@@ -0,0 +1,286 @@
+# cached float32 loading of the N-BaIoT CSVs used by the notebook
+#
+# benign = load("9.benign.csv")                     # parses once, memory maps afterwards
+# X_train, X_test0 = split_benign(benign)
+# attacks = load_attacks(data_dir=".")              # {"mirai.scan": array, ...}
+# for chunk in FeatureCache().chunks("9.gafgyt.udp.csv", rows=65536): ...
+#
+# python dataset.py --data-dir . --cache-dir .feature_cache    # builds every cache up front
+#
+# each CSV is parsed once, in chunks, into a column-major float32 .npy file with a JSON
+# sidecar recording the source file's size, mtime, SHA-256 and column names. later loads
+# memory map the .npy, so only the pages touched are read and nothing is reparsed. a
+# source whose size or mtime changed is rehashed, and reparsed if its contents changed.
+# caches are named after the CSV and a hash of its absolute path, so same-named CSVs in
+# different directories get their own, and are written to temporary files that replace
+# the old ones whole, so processes building the same cache at once do not mix their rows
+import argparse
+import csv
+import hashlib
+import json
+import math
+import os
+import tempfile
+
+import numpy as np
+
+# pandas parses faster, the csv module is the fallback
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
+
+# device 9 of N-BaIoT: benign traffic and the 10 attacks the notebook loads
+DEVICE = 9
+ATTACKS = (
+    "mirai.scan", "mirai.ack", "mirai.syn", "mirai.udp", "mirai.udpplain",
+    "gafgyt.combo", "gafgyt.junk", "gafgyt.scan", "gafgyt.tcp", "gafgyt.udp",
+)
+
+# rows parsed, or returned by chunks(), at a time
+CHUNK_ROWS = 65536
+
+# share of the benign rows the notebook trains on, the rest is its benign test set
+TRAIN_FRACTION = 2 / 3
+
+CACHE_DIR = ".feature_cache"
+
+# bumped whenever the cache layout changes, older caches are rebuilt
+CACHE_VERSION = 1
+
+_HASH_BLOCK = 1 << 20
+
+
+def csv_name(dataset: str, device: int = DEVICE) -> str:
+    return "%d.%s.csv" % (device, dataset)
+
+
+# SHA-256 of a file, read in blocks
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(_HASH_BLOCK), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# data rows of a CSV with a header line, counted without parsing; blank lines are
+# skipped, as both parsers skip them
+def _count_rows(path: str) -> int:
+    with open(path, "rb") as f:
+        lines = sum(1 for line in f if not line.isspace())
+    return max(lines - 1, 0)
+
+
+# (column names, iterator of float32 row blocks) of a CSV
+def _parse(path: str, chunk_rows: int):
+    if pd is not None:
+        reader = pd.read_csv(path, dtype=np.float32, chunksize=chunk_rows)
+        first = next(reader, None)
+        if first is None:
+            return [], iter(())
+        columns = list(first.columns)
+
+        def blocks():
+            yield first.to_numpy(dtype=np.float32)
+            for frame in reader:
+                yield frame.to_numpy(dtype=np.float32)
+
+        return columns, blocks()
+
+    f = open(path, newline="")
+    rows = csv.reader(f)
+    columns = next(rows, [])
+
+    def blocks():
+        with f:
+            while True:
+                block = [row for _, row in zip(range(chunk_rows), rows) if any(field.strip() for field in row)]
+                if not block:
+                    return
+                yield np.array(block, dtype=np.float32)
+
+    return columns, blocks()
+
+
+class FeatureCache:
+    """Column-major float32 copies of CSV files, memory mapped once built.
+
+    Parameters
+    ----------
+    directory : str, optional
+        Where the .npy files and their .json sidecars are kept, created if missing.
+        The default is CACHE_DIR.
+
+    chunk_rows : int, optional
+        Rows parsed at a time when a cache is built and returned at a time by
+        chunks(). Memory use is bounded by a chunk, not by the file. The default
+        is CHUNK_ROWS.
+    """
+
+    def __init__(self, directory: str = CACHE_DIR, chunk_rows: int = CHUNK_ROWS):
+        self.directory = directory
+        self.chunk_rows = chunk_rows
+        os.makedirs(directory, exist_ok=True)
+
+    def _paths(self, csv_path: str) -> tuple[str, str]:
+        name = os.path.splitext(os.path.basename(csv_path))[0]
+        location = hashlib.sha256(os.path.abspath(csv_path).encode()).hexdigest()[:12]
+        stem = os.path.join(self.directory, "%s-%s" % (name, location))
+        return stem + ".npy", stem + ".json"
+
+    # an empty temporary file next to the caches, renamed over path once written
+    def _temporary(self, path: str) -> str:
+        fd, temporary = tempfile.mkstemp(suffix=".tmp", prefix=os.path.basename(path) + ".", dir=self.directory)
+        os.close(fd)
+        return temporary
+
+    # sidecar of a current cache of csv_path, None when it has to be (re)built
+    def _current(self, csv_path: str) -> dict or None:
+        data_path, meta_path = self._paths(csv_path)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if meta.get("version") != CACHE_VERSION or not os.path.exists(data_path):
+            return None
+        if not os.path.exists(csv_path):
+            # only the cache was shipped, there is nothing to check it against
+            return meta
+
+        stat = os.stat(csv_path)
+        if (meta["size"], meta["mtime_ns"]) == (stat.st_size, stat.st_mtime_ns):
+            return meta
+        if meta["size"] != stat.st_size or meta["sha256"] != file_hash(csv_path):
+            return None
+        # touched but unchanged, remember the new mtime so it is not hashed again
+        meta["mtime_ns"] = stat.st_mtime_ns
+        self._write_meta(meta_path, meta)
+        return meta
+
+    def _write_meta(self, meta_path: str, meta: dict):
+        temporary = self._temporary(meta_path)
+        with open(temporary, "w") as f:
+            json.dump(meta, f)
+        os.replace(temporary, meta_path)
+
+    # parses csv_path chunk by chunk straight into a memory mapped .npy
+    def build(self, csv_path: str) -> dict:
+        data_path, meta_path = self._paths(csv_path)
+        stat = os.stat(csv_path)
+        sha256 = file_hash(csv_path)
+        rows = _count_rows(csv_path)
+        columns, blocks = _parse(csv_path, self.chunk_rows)
+
+        temporary = self._temporary(data_path)
+        try:
+            data = np.lib.format.open_memmap(temporary, mode="w+", dtype=np.float32,
+                                             shape=(rows, len(columns)), fortran_order=True)
+            start = 0
+            for block in blocks:
+                if block.shape[1] != len(columns):
+                    raise ValueError("%s: row %d has %d values, the header %d"
+                                     % (csv_path, start + 1, block.shape[1], len(columns)))
+                if start + len(block) > rows:
+                    raise ValueError("%s: counted %d rows, parsed more" % (csv_path, rows))
+                data[start:start + len(block)] = block
+                start += len(block)
+            data.flush()
+            del data
+            if start != rows:
+                raise ValueError("%s: counted %d rows, parsed %d" % (csv_path, rows, start))
+            os.replace(temporary, data_path)
+        except BaseException:
+            os.remove(temporary)
+            raise
+
+        meta = {
+            "version": CACHE_VERSION, "source": os.path.basename(csv_path), "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns, "sha256": sha256, "rows": rows, "columns": columns,
+        }
+        self._write_meta(meta_path, meta)
+        return meta
+
+    def _ensure(self, csv_path: str) -> dict:
+        meta = self._current(csv_path)
+        if meta is None:
+            meta = self.build(csv_path)
+        return meta
+
+    def load(self, csv_path: str) -> np.ndarray:
+        """Read-only (rows, features) float32 memory map of csv_path, built if needed.
+
+        The array is column-major: columns are contiguous, and np.ascontiguousarray()
+        of a row slice gives the row-major block a model takes.
+        """
+        self._ensure(csv_path)
+        return np.load(self._paths(csv_path)[0], mmap_mode="r")
+
+    def columns(self, csv_path: str) -> list[str]:
+        return self._ensure(csv_path)["columns"]
+
+    # SHA-256 of the CSV the cache was built from
+    def sha256(self, csv_path: str) -> str:
+        return self._ensure(csv_path)["sha256"]
+
+    def chunks(self, csv_path: str, rows: int = None, start: int = 0, stop: int = None):
+        """Yield row-major float32 copies of consecutive row blocks of csv_path.
+
+        Only one block is in memory at a time, so files larger than RAM can be
+        streamed. start and stop select a range of rows.
+        """
+        data = self.load(csv_path)
+        rows = rows or self.chunk_rows
+        stop = len(data) if stop is None else min(stop, len(data))
+        for first in range(start, stop, rows):
+            yield np.ascontiguousarray(data[first:min(first + rows, stop)])
+
+
+# default cache, shared by the module level functions
+_default_cache = None
+
+
+def _cache(cache: FeatureCache = None) -> FeatureCache:
+    global _default_cache
+    if cache is not None:
+        return cache
+    if _default_cache is None:
+        _default_cache = FeatureCache()
+    return _default_cache
+
+
+# read-only float32 array of one CSV, see FeatureCache.load
+def load(csv_path: str, cache: FeatureCache = None) -> np.ndarray:
+    return _cache(cache).load(csv_path)
+
+
+# the benign rows split as the notebook does: the first 2/3 to train on, the rest to test
+def split_benign(benign: np.ndarray, train_fraction: float = TRAIN_FRACTION) -> tuple[np.ndarray, np.ndarray]:
+    split = math.floor(train_fraction * len(benign))
+    return benign[:split], benign[split:]
+
+
+# {attack name: array} for the attacks of device, from the CSVs in data_dir
+def load_attacks(data_dir: str = ".", device: int = DEVICE, attacks=ATTACKS, cache: FeatureCache = None) -> dict:
+    return {name: load(os.path.join(data_dir, csv_name(name, device)), cache) for name in attacks}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the float32 caches of the N-BaIoT CSVs.")
+    parser.add_argument("--data-dir", default=".", help="directory of the CSVs")
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    parser.add_argument("--device", type=int, default=DEVICE)
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    args = parser.parse_args(argv)
+
+    cache = FeatureCache(args.cache_dir, args.chunk_rows)
+    for name in ("benign",) + ATTACKS:
+        path = os.path.join(args.data_dir, csv_name(name, args.device))
+        data = cache.load(path)
+        print("%-24s %9d rows %4d columns %8.1f MB" % (os.path.basename(path), data.shape[0], data.shape[1],
+                                                    data.nbytes / 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+# evaluation of the detector over every dataset from reconstruction errors computed once
+#
+# errors = compute_errors(detector.score, data_dir=".", path="errors.npz")   # keyed by detector.fingerprint()
+# threshold = mean_std_threshold(errors["benign.train"])          # the notebook's mean + std
+# results = evaluate(errors, threshold)                           # {"mirai.scan": {...}, ..., "all": {...}}
+# curve = sweep(*labelled(errors))                                # every threshold at once
+# curve.best("f1").threshold, curve.roc_auc, curve.average_precision
+#
+# python evaluate.py detector.npz --data-dir .
+#
+# an anomaly is the positive class: a row is flagged when its loss is at least the
+# threshold, the complement of the notebook's predict() (loss < threshold means benign).
+# every family is scored against the benign test rows (X_test0). the notebook meant to do
+# the same, but DataFrame.append returns a new frame, so its mirai_shuffled_test_set and
+# bash_shuffled_test_set were only mirai.scan and gafgyt.combo, and the slices it counted
+# as benign (the last 6510 rows) were attack rows
+import argparse
+import hashlib
+import os
+from typing import NamedTuple
+
+import numpy as np
+
+from dataset import ATTACKS, CACHE_DIR, DEVICE, TRAIN_FRACTION, FeatureCache, csv_name, split_benign
+
+BENIGN_TRAIN = "benign.train"
+BENIGN_TEST = "benign.test"
+
+
+# the notebook's threshold, mean + k standard deviations of the training losses
+def mean_std_threshold(train_losses: np.ndarray, k: float = 1.0) -> float:
+    train_losses = np.asarray(train_losses, dtype=np.float64)
+    return float(train_losses.mean() + k * train_losses.std())
+
+
+def compute_errors(score: callable, data_dir: str = ".", device: int = DEVICE, attacks=ATTACKS,
+                   path: str = None, key: str = None, cache: FeatureCache = None) -> dict:
+    """Reconstruction errors of the benign train and test rows and of every attack family.
+
+    Parameters
+    ----------
+    score : callable
+        Maps a (rows, features) array to per row losses, e.g. inference.Detector.score.
+
+    data_dir, device, attacks : optional
+        Where the CSVs are and which of them to score, see dataset.py.
+
+    path : str, optional
+        .npz file the errors are cached in. Cached errors are returned when they were
+        computed for the same key, CSV contents and families, otherwise they are
+        recomputed and saved.
+
+    key : str, optional
+        Identifies the model and its scaler. The default is the fingerprint() of the
+        inference.Detector whose score method score is; any other score needs a key
+        to cache its errors, ValueError is raised without one.
+
+    Returns
+    -------
+    dict
+        {family: float32 losses} for "benign.train", "benign.test" and each attack.
+    """
+    families = (BENIGN_TRAIN, BENIGN_TEST) + tuple(attacks)
+    cache = cache or FeatureCache()
+    csv_paths = [os.path.join(data_dir, csv_name(name, device)) for name in ("benign",) + tuple(attacks)]
+
+    if path is not None:
+        if key is None:
+            fingerprint = getattr(getattr(score, "__self__", None), "fingerprint", None)
+            if fingerprint is None:
+                raise ValueError("caching the errors of %r needs a key identifying its model" % (score,))
+            key = fingerprint()
+        # the errors also depend on the rows scored and how the benign ones are split
+        digest = hashlib.sha256(("%s\n%r\n" % (key, TRAIN_FRACTION)).encode())
+        for csv_path in csv_paths:
+            digest.update(cache.sha256(csv_path).encode())
+        key = digest.hexdigest()
+        if os.path.exists(path):
+            with np.load(path) as arrays:
+                if str(arrays["key"]) == key and set(families) <= set(arrays.files):
+                    return {family: arrays[family] for family in families}
+
+    train, test = split_benign(cache.load(csv_paths[0]))
+    errors = {BENIGN_TRAIN: score(train), BENIGN_TEST: score(test)}
+    for attack, csv_path in zip(attacks, csv_paths[1:]):
+        errors[attack] = score(cache.load(csv_path))
+    errors = {family: np.asarray(losses, dtype=np.float32) for family, losses in errors.items()}
+    if path is not None:
+        np.savez(path, key=np.array(key), **errors)
+    return errors
+
+
+# (losses, labels) of the benign test rows (label False) and the attack rows (True) of
+# families, every attack family by default
+def labelled(errors: dict, families=None) -> tuple[np.ndarray, np.ndarray]:
+    if families is None:
+        families = [family for family in errors if family not in (BENIGN_TRAIN, BENIGN_TEST)]
+    parts = [errors[BENIGN_TEST]] + [errors[family] for family in families]
+    losses = np.concatenate(parts)
+    labels = np.zeros(len(losses), dtype=bool)
+    labels[len(errors[BENIGN_TEST]):] = True
+    return losses, labels
+
+
+# metrics from confusion counts, arrays or scalars alike
+def _metrics(tp, fp, positives: int, negatives: int) -> dict:
+    tp = np.asarray(tp, dtype=np.float64)
+    fp = np.asarray(fp, dtype=np.float64)
+    fn = positives - tp
+    tn = negatives - fp
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precision = np.where(tp + fp > 0, tp / (tp + fp), 1.0)
+        recall = tp / positives if positives else np.zeros_like(tp)
+        return {
+            "accuracy": (tp + tn) / (positives + negatives),
+            "precision": precision,
+            "recall": recall,
+            "f1": np.where(2 * tp + fp + fn > 0, 2 * tp / (2 * tp + fp + fn), 0.0),
+            "false_positive_rate": fp / negatives if negatives else np.zeros_like(fp),
+        }
+
+
+class Point(NamedTuple):
+    threshold: float
+    accuracy: float
+    precision: float
+    recall: float
+    f1: float
+    false_positive_rate: float
+
+
+class Sweep:
+    """Metrics at every distinct threshold, from one sort and two cumulative sums.
+
+    Index i flags the rows with loss >= thresholds[i]; thresholds decrease, starting
+    at +inf where nothing is flagged. recall doubles as the ROC curve's true positive
+    rate, so (false_positive_rate, recall) is the ROC curve and (recall, precision)
+    the precision-recall curve.
+
+    Parameters
+    ----------
+    losses : array
+        Reconstruction loss of each row.
+
+    labels : array of bool
+        True for anomalous rows.
+    """
+
+    def __init__(self, losses, labels):
+        losses = np.asarray(losses, dtype=np.float32)
+        labels = np.asarray(labels, dtype=bool)
+        if losses.shape != labels.shape:
+            raise ValueError("%d losses and %d labels" % (len(losses), len(labels)))
+        self.positives = int(np.count_nonzero(labels))
+        self.negatives = len(labels) - self.positives
+
+        order = np.argsort(losses, kind="stable")[::-1]
+        losses = losses[order]
+        labels = labels[order]
+        # the last row of every run of equal losses, where a threshold boundary can fall
+        last = np.flatnonzero(np.diff(losses)) if len(losses) else np.empty(0, dtype=np.intp)
+        last = np.append(last, len(losses) - 1) if len(losses) else last
+        tp = np.cumsum(labels, dtype=np.int64)[last]
+        fp = (last + 1) - tp
+
+        self.thresholds = np.concatenate(([np.inf], losses[last]))
+        self.tp = np.concatenate(([0], tp))
+        self.fp = np.concatenate(([0], fp))
+        for name, values in _metrics(self.tp, self.fp, self.positives, self.negatives).items():
+            setattr(self, name, values)
+
+    def __len__(self) -> int:
+        return len(self.thresholds)
+
+    def point(self, i: int) -> Point:
+        return Point(float(self.thresholds[i]), float(self.accuracy[i]), float(self.precision[i]),
+                     float(self.recall[i]), float(self.f1[i]), float(self.false_positive_rate[i]))
+
+    # metrics at any threshold, by binary search
+    def at(self, threshold: float) -> Point:
+        # thresholds are decreasing, the point flagging exactly the losses >= threshold
+        i = len(self.thresholds) - int(np.searchsorted(self.thresholds[::-1], threshold, side="left")) - 1
+        point = self.point(max(i, 0))
+        return point._replace(threshold=float(threshold))
+
+    # the point maximising metric, the highest threshold among ties
+    def best(self, metric: str = "f1") -> Point:
+        return self.point(int(np.argmax(getattr(self, metric))))
+
+    @property
+    def roc_auc(self) -> float:
+        fpr = np.append(self.false_positive_rate, 1.0)
+        tpr = np.append(self.recall, 1.0)
+        return float(np.sum(np.diff(fpr) * (tpr[1:] + tpr[:-1]) / 2))
+
+    # sum over thresholds of precision weighted by the recall gained
+    @property
+    def average_precision(self) -> float:
+        return float(np.sum(np.diff(self.recall) * self.precision[1:]))
+
+
+def sweep(losses, labels) -> Sweep:
+    return Sweep(losses, labels)
+
+
+def evaluate(errors: dict, threshold: float, groups: dict = None) -> dict:
+    """Metrics at threshold of each attack family, of each group and of all of them.
+
+    Each family's rows are scored together with the benign test rows. groups maps a
+    name to families, by default "mirai" and "gafgyt" (the notebook's two test sets)
+    plus "all".
+
+    Returns
+    -------
+    dict
+        {name: {"rows", "anomalies", "threshold", "accuracy", "precision", "recall",
+        "f1", "false_positive_rate"}}
+    """
+    attacks = [family for family in errors if family not in (BENIGN_TRAIN, BENIGN_TEST)]
+    if groups is None:
+        groups = {}
+        for family in attacks:
+            groups.setdefault(family.split(".")[0], []).append(family)
+        groups["all"] = attacks
+
+    benign_flagged = int(np.count_nonzero(errors[BENIGN_TEST] >= threshold))
+    negatives = len(errors[BENIGN_TEST])
+    results = {}
+    for name, families in [(family, [family]) for family in attacks] + list(groups.items()):
+        tp = sum(int(np.count_nonzero(errors[family] >= threshold)) for family in families)
+        positives = sum(len(errors[family]) for family in families)
+        metrics = _metrics(tp, benign_flagged, positives, negatives)
+        results[name] = dict({"rows": positives, "anomalies": tp, "threshold": float(threshold)},
+                             **{metric: float(value) for metric, value in metrics.items()})
+    return results
+
+
+def main(argv=None):
+    from inference import Detector
+
+    parser = argparse.ArgumentParser(description="Evaluate an exported detector on every attack family.")
+    parser.add_argument("model", help=".npz written by inference.export()")
+    parser.add_argument("--data-dir", default=".", help="directory of the CSVs")
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    parser.add_argument("--device", type=int, default=DEVICE)
+    parser.add_argument("--errors", default=None, help="reconstruction error cache (default: next to the model)")
+    parser.add_argument("--threshold", type=float, default=None, help="default: the model's threshold")
+    args = parser.parse_args(argv)
+
+    detector = Detector.load(args.model)
+    errors = compute_errors(detector.score, args.data_dir, args.device,
+                            path=args.errors or os.path.splitext(args.model)[0] + ".errors.npz",
+                            cache=FeatureCache(args.cache_dir))
+    threshold = detector.threshold if args.threshold is None else args.threshold
+
+    print("%-16s %9s %9s %8s %9s %8s %8s %8s" % ("family", "rows", "flagged", "accuracy", "precision", "recall",
+                                                "f1", "fpr"))
+    for name, result in evaluate(errors, threshold).items():
+        print("%-16s %9d %9d %8.4f %9.4f %8.4f %8.4f %8.4f" % (
+            name, result["rows"], result["anomalies"], result["accuracy"], result["precision"],
+            result["recall"], result["f1"], result["false_positive_rate"]))
+
+    curve = sweep(*labelled(errors))
+    best = curve.best("f1")
+    print("threshold %.6f; mean + std of the training losses %.6f; best F1 %.4f at %.6f; ROC AUC %.4f; AP %.4f" % (
+        threshold, mean_std_threshold(errors[BENIGN_TRAIN]), best.f1, best.threshold, curve.roc_auc,
+        curve.average_precision))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+# TensorFlow-free scoring with a trained AnomalyDetector
+#
+# export(autoencoder, "detector.npz", threshold, scaler)      # in the notebook, once trained
+#
+# detector = Detector.load("detector.npz")                    # numpy only, no TensorFlow import
+# losses = detector.score(batch)                              # per row MAE, float32
+# benign = detector.predict(batch)                            # loss < threshold, as predict() in the notebook
+#
+# python inference.py detector.npz 9.gafgyt.udp.csv
+#
+# the artifact is one .npz holding every Dense layer's kernel, bias and activation, the
+# threshold and optionally the scaler's fitted range (see scaler.py). the forward pass is
+# a few float32 matmuls into buffers allocated once, so scoring a batch allocates nothing
+import argparse
+import hashlib
+import os
+import time
+
+import numpy as np
+
+from dataset import CACHE_DIR, FeatureCache
+from scaler import MinMaxScaler
+
+# encoder and decoder layer widths of the notebook's two AnomalyDetector models
+ARCHITECTURES = {
+    "shallow": ((32,), (115,)),
+    "deep": ((64, 32, 16), (16, 32, 64, 115)),
+}
+
+# rows run through the network at once, and so the rows the buffers are sized for
+BATCH_SIZE = 4096
+
+# in place activations, keyed by their Keras names
+ACTIVATIONS = {
+    "linear": lambda x: x,
+    "relu": lambda x: np.maximum(x, 0, out=x),
+    "tanh": lambda x: np.tanh(x, out=x),
+    "sigmoid": lambda x: np.divide(1, np.add(1, np.exp(np.negative(x, out=x), out=x), out=x), out=x),
+}
+
+
+# (kernel, bias, activation name) of each Dense layer of a Keras model, encoder then decoder
+def _dense_layers(model) -> list:
+    if hasattr(model, "encoder") and hasattr(model, "decoder"):
+        layers = list(model.encoder.layers) + list(model.decoder.layers)
+    else:
+        layers = list(model.layers)
+    dense = []
+    for layer in layers:
+        weights = layer.get_weights()
+        if not weights:
+            continue
+        if len(weights) != 2:
+            raise ValueError("layer %s is not a Dense layer with a bias" % layer.name)
+        activation = layer.get_config().get("activation", "linear")
+        if activation not in ACTIVATIONS:
+            raise ValueError("layer %s has unsupported activation %r" % (layer.name, activation))
+        dense.append((weights[0], weights[1], activation))
+    if not dense:
+        raise ValueError("the model has no weights, it has to be built (called or trained) first")
+    return dense
+
+
+def export(model, path: str, threshold: float, scaler: MinMaxScaler = None, variant: str = None):
+    """Write a trained Keras AnomalyDetector, its threshold and scaler to one .npz file.
+
+    Parameters
+    ----------
+    model : keras.Model
+        The autoencoder, either with encoder and decoder sub-models like the notebook's
+        AnomalyDetector, or a plain stack of Dense layers.
+
+    path : str
+        The .npz file to write.
+
+    threshold : float
+        Reconstruction loss below which a row counts as benign.
+
+    scaler : scaler.MinMaxScaler, optional
+        The scaler the model was trained behind, applied to every batch before scoring.
+
+    variant : str, optional
+        Name of the architecture, "shallow" or "deep" for the notebook's two models,
+        kept for reference. The default is inferred from the layer widths.
+    """
+    dense = _dense_layers(model)
+    widths = tuple(kernel.shape[1] for kernel, _, _ in dense)
+    if variant is None:
+        variant = next((name for name, (encoder, decoder) in ARCHITECTURES.items()
+                        if encoder + decoder == widths), "custom")
+
+    arrays = {
+        "variant": np.array(variant),
+        "threshold": np.float32(threshold),
+        "layers": np.int64(len(dense)),
+    }
+    for i, (kernel, bias, activation) in enumerate(dense):
+        arrays["kernel_%d" % i] = np.asarray(kernel, dtype=np.float32)
+        arrays["bias_%d" % i] = np.asarray(bias, dtype=np.float32)
+        arrays["activation_%d" % i] = np.array(activation)
+    if scaler is not None:
+        arrays.update(scaler.state())
+    np.savez(path, **arrays)
+
+
+class Detector:
+    """Dense autoencoder forward pass and per row MAE in float32 NumPy.
+
+    Holds preallocated activation buffers for batch_size rows, so one Detector must
+    not score from several threads at once; give each thread its own.
+
+    Parameters
+    ----------
+    layers : list of (kernel, bias, activation)
+        Dense layers, encoder then decoder; activation is a key of ACTIVATIONS.
+
+    threshold : float
+        Reconstruction loss below which a row counts as benign.
+
+    scaler : scaler.MinMaxScaler, optional
+        Applied to a copy of each batch before it enters the network.
+
+    batch_size : int, optional
+        Rows run through the network at once. The default is BATCH_SIZE.
+
+    variant : str, optional
+        Name of the architecture, only kept for reference.
+    """
+
+    def __init__(self, layers, threshold: float, scaler: MinMaxScaler = None, batch_size: int = BATCH_SIZE,
+                 variant: str = "custom"):
+        self.layers = [(np.ascontiguousarray(kernel, dtype=np.float32), np.asarray(bias, dtype=np.float32),
+                        ACTIVATIONS[activation]) for kernel, bias, activation in layers]
+        self.features = self.layers[0][0].shape[0]
+        if self.layers[-1][0].shape[1] != self.features:
+            raise ValueError("the decoder outputs %d features, the encoder takes %d"
+                             % (self.layers[-1][0].shape[1], self.features))
+        self.threshold = np.float32(threshold)
+        self.scaler = scaler
+        self.batch_size = batch_size
+        self.variant = variant
+
+        self._input = np.empty((batch_size, self.features), dtype=np.float32)
+        self._buffers = [np.empty((batch_size, kernel.shape[1]), dtype=np.float32) for kernel, _, _ in self.layers]
+
+    @classmethod
+    def load(cls, path: str, batch_size: int = BATCH_SIZE) -> "Detector":
+        with np.load(path) as arrays:
+            layers = [(arrays["kernel_%d" % i], arrays["bias_%d" % i], str(arrays["activation_%d" % i]))
+                      for i in range(int(arrays["layers"]))]
+            scaler = MinMaxScaler.from_state(arrays) if "scaler_min" in arrays else None
+            return cls(layers, float(arrays["threshold"]), scaler, batch_size, str(arrays["variant"]))
+
+    # SHA-256 of everything the losses depend on: the layers and the scaler's fitted range,
+    # not the threshold, so cached losses can be matched to the model that scored them
+    def fingerprint(self) -> str:
+        digest = hashlib.sha256()
+        for kernel, bias, activation in self.layers:
+            name = next(name for name, function in ACTIVATIONS.items() if function is activation)
+            digest.update(name.encode())
+            digest.update(np.array(kernel.shape, dtype=np.int64).tobytes())
+            digest.update(kernel.tobytes())
+            digest.update(bias.tobytes())
+        if self.scaler is not None:
+            for name, value in sorted(self.scaler.state().items()):
+                if name.endswith("rows_seen"):
+                    continue
+                digest.update(name.encode())
+                digest.update(np.asarray(value).tobytes())
+        return digest.hexdigest()
+
+    # per row MAE of the rows in self._input[:rows], written to out
+    def _score_batch(self, rows: int, out: np.ndarray):
+        x = self._input[:rows]
+        if self.scaler is not None:
+            self.scaler.transform(x)
+        h = x
+        for (kernel, bias, activation), buffer in zip(self.layers, self._buffers):
+            y = buffer[:rows]
+            np.matmul(h, kernel, out=y)
+            y += bias
+            activation(y)
+            h = y
+        np.subtract(h, x, out=h)
+        np.abs(h, out=h)
+        np.mean(h, axis=1, out=out)
+
+    def score(self, x, out: np.ndarray = None) -> np.ndarray:
+        """Reconstruction loss (mean absolute error) of each row of x, as float32.
+
+        x is any (rows, features) array-like, a memory map from dataset.load() included;
+        it is copied batch by batch and never modified. out, when given, is a float32
+        array of len(x) that receives the losses.
+        """
+        x = np.asarray(x)
+        if x.ndim != 2 or x.shape[1] != self.features:
+            raise ValueError("expected (rows, %d) features, got shape %s" % (self.features, x.shape))
+        if out is None:
+            out = np.empty(len(x), dtype=np.float32)
+        for start in range(0, len(x), self.batch_size):
+            rows = min(self.batch_size, len(x) - start)
+            self._input[:rows] = x[start:start + rows]
+            self._score_batch(rows, out[start:start + rows])
+        return out
+
+    # True for rows whose loss is below the threshold, i.e. benign
+    def predict(self, x, threshold: float = None) -> np.ndarray:
+        return self.score(x) < (self.threshold if threshold is None else threshold)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score a CSV of feature rows with an exported detector.")
+    parser.add_argument("model", help=".npz written by inference.export()")
+    parser.add_argument("csv", help="CSV of feature rows")
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    detector = Detector.load(args.model, args.batch_size)
+    loaded = time.perf_counter()
+    data = FeatureCache(args.cache_dir).load(args.csv)
+    losses = detector.score(data)
+    scored = time.perf_counter()
+
+    anomalies = int(np.count_nonzero(losses >= detector.threshold))
+    print("%s: %d rows, %d anomalous (%.2f%%), threshold %.6f" % (
+        os.path.basename(args.csv), len(losses), anomalies, 100 * anomalies / max(len(losses), 1), detector.threshold))
+    print("model loaded in %.1f ms, scored at %.0f rows/s" % (
+        1000 * (loaded - started), len(losses) / max(scored - loaded, 1e-9)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+# tf.data training pipeline of the anomaly detector (training.py)
+#
+# train = make_dataset(x, batch_size=512, shuffle=True, scale=scale, offset=offset)   # y=None: autoencoder
+# history = fit(model, train, val, epochs=100, checkpoint="checkpoints/detector.weights.h5", samples=len(x))
+# history.history["samples_per_second"]
+#
+# the inputs are normalised once inside the pipeline and cached as float32 tensors, then
+# shuffled, batched and prefetched so the host prepares the next batches while the model
+# trains. training stops once the validation loss has not improved for patience epochs,
+# keeping the best weights, which are also checkpointed as they improve
+import os
+import time
+
+import numpy as np
+import tensorflow as tf
+from tensorflow import keras
+
+SHUFFLE_BUFFER = 16384
+
+# batch sizes tried by tune_batch_size
+BATCH_SIZES = (64, 128, 256, 512, 1024, 2048)
+
+# epochs without a better validation loss before training stops
+PATIENCE = 5
+
+
+def make_dataset(x, y=None, batch_size: int = 256, shuffle: bool = False, scale=None, offset=None,
+                 seed: int = None) -> tf.data.Dataset:
+    """Batched, prefetched (inputs, targets) dataset of in-memory arrays.
+
+    Parameters
+    ----------
+    x : array
+        The inputs, any numeric dtype; they are cast to float32.
+
+    y : array, optional
+        The targets. Without them the inputs are also the targets, as an autoencoder
+        needs, and normalised the same way.
+
+    batch_size : int, optional
+        The default is 256.
+
+    shuffle : bool, optional
+        Reshuffle every epoch, for training sets. The default is False.
+
+    scale, offset : float or array, optional
+        The inputs become x * scale - offset (per feature for arrays), e.g. 1 / 255
+        for pixels, or the scaler.MinMaxScaler.coefficients() of the training rows.
+        Computed once, before the cache.
+    """
+    x = np.asarray(x)
+    dataset = tf.data.Dataset.from_tensor_slices(x if y is None else (x, np.asarray(y)))
+
+    def normalise(inputs):
+        inputs = tf.cast(inputs, tf.float32)
+        if scale is not None:
+            inputs = inputs * tf.constant(scale, tf.float32)
+        if offset is not None:
+            inputs = inputs - tf.constant(offset, tf.float32)
+        return inputs
+
+    if y is None:
+        dataset = dataset.map(lambda inputs: (normalise(inputs),) * 2, num_parallel_calls=tf.data.AUTOTUNE)
+    else:
+        dataset = dataset.map(lambda inputs, targets: (normalise(inputs), targets),
+                              num_parallel_calls=tf.data.AUTOTUNE)
+    dataset = dataset.cache()
+    if shuffle:
+        dataset = dataset.shuffle(min(len(x), SHUFFLE_BUFFER), seed=seed, reshuffle_each_iteration=True)
+    return dataset.batch(batch_size).prefetch(tf.data.AUTOTUNE)
+
+
+class Throughput(keras.callbacks.Callback):
+    """Records the training samples per second of each epoch.
+
+    The rate is added to the epoch's logs as samples_per_second, so it lands in the
+    History next to the losses, and kept in self.rates.
+
+    Parameters
+    ----------
+    samples : int
+        Training samples in an epoch.
+    """
+
+    def __init__(self, samples: int):
+        super().__init__()
+        self.samples = samples
+        self.rates = []
+        self._started = None
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._started = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        rate = self.samples / (time.perf_counter() - self._started)
+        self.rates.append(rate)
+        if logs is not None:
+            logs["samples_per_second"] = rate
+
+
+# early stopping on the validation loss, restoring the best weights, and checkpoints of
+# the best weights as they improve (when checkpoint is given)
+def training_callbacks(checkpoint: str = None, patience: int = PATIENCE) -> list:
+    callbacks = [keras.callbacks.EarlyStopping(monitor="val_loss", patience=patience, restore_best_weights=True)]
+    if checkpoint is not None:
+        os.makedirs(os.path.dirname(checkpoint) or ".", exist_ok=True)
+        callbacks.append(keras.callbacks.ModelCheckpoint(checkpoint, monitor="val_loss", save_best_only=True,
+                                                         save_weights_only=True))
+    return callbacks
+
+
+def fit(model: keras.Model, train: tf.data.Dataset, validation: tf.data.Dataset, epochs: int, samples: int,
+        checkpoint: str = None, patience: int = PATIENCE, verbose: int = 2) -> keras.callbacks.History:
+    """model.fit with early stopping, checkpoints and per epoch throughput.
+
+    samples is the number of training samples in an epoch. epochs is an upper bound,
+    training usually stops earlier.
+    """
+    return model.fit(train, validation_data=validation, epochs=epochs, verbose=verbose,
+                     callbacks=training_callbacks(checkpoint, patience) + [Throughput(samples)])
+
+
+def tune_batch_size(build: callable, x, y=None, candidates=BATCH_SIZES, steps: int = 20, **dataset_options) -> int:
+    """The batch size in candidates that trains fastest on this machine, in samples per second.
+
+    build() returns a fresh compiled model. Each candidate trains for steps batches
+    after one warm-up batch, which pays for tracing; keyword arguments go to make_dataset.
+    Larger batches are faster per sample on CPUs up to a point, but generalise worse,
+    so only sizes that suit the model should be offered.
+    """
+    rates = {}
+    for batch_size in candidates:
+        if batch_size * (steps + 1) > len(x):
+            continue
+        dataset = make_dataset(x, y, batch_size, **dataset_options)
+        model = build()
+        model.fit(dataset.take(1), verbose=0)
+        started = time.perf_counter()
+        model.fit(dataset.skip(1).take(steps), verbose=0)
+        rates[batch_size] = batch_size * steps / (time.perf_counter() - started)
+    if not rates:
+        return min(candidates)
+    return max(rates, key=rates.get)
@@ -0,0 +1,170 @@
+# min-max feature scaling learned once, from the benign training rows, and reused everywhere
+#
+# scaler = fit_benign("9.benign.csv")        # one streaming pass over the training rows
+# scaler.save("scaler.npz")
+# scaler = MinMaxScaler.load("scaler.npz")
+# batch = scaler.transform(batch)            # in place when batch is a writable float32 array
+#
+# python scaler.py --data-dir . -o scaler.npz
+#
+# the notebook fitted a new sklearn MinMaxScaler to every dataset, so each attack file was
+# squeezed into [0, 1] on its own and its shift away from benign traffic scaled out of it.
+# one scaler fitted to the benign training rows keeps that shift, and training and scoring
+# scale the same way
+import argparse
+import os
+
+import numpy as np
+
+from dataset import CACHE_DIR, DEVICE, TRAIN_FRACTION, FeatureCache, csv_name, split_benign
+
+
+class MinMaxScaler:
+    """Maps each feature's [min, max] over the fitted rows onto [0, 1].
+
+    Fitted incrementally, one chunk at a time, so the training rows never need to be
+    in memory together. Rows outside the fitted range map outside [0, 1] unless
+    clip is set, which is how an anomaly keeps its distance from benign traffic.
+    Constant features are shifted to 0 and not scaled, like sklearn's MinMaxScaler.
+
+    Parameters
+    ----------
+    clip : bool, optional
+        Clip transformed values to [0, 1]. The default is False.
+    """
+
+    def __init__(self, clip: bool = False):
+        self.clip = clip
+        self.data_min = None
+        self.data_max = None
+        self.rows_seen = 0
+        self._offset = None
+        self._scale = None
+
+    @property
+    def fitted(self) -> bool:
+        return self.rows_seen > 0
+
+    # widens the fitted range to cover a (rows, features) chunk
+    def partial_fit(self, chunk: np.ndarray) -> "MinMaxScaler":
+        chunk = np.asarray(chunk)
+        if chunk.ndim != 2:
+            raise ValueError("expected a (rows, features) array, got shape %s" % (chunk.shape,))
+        if not len(chunk):
+            return self
+        low = chunk.min(axis=0).astype(np.float32)
+        high = chunk.max(axis=0).astype(np.float32)
+        if self.data_min is None:
+            self.data_min, self.data_max = low, high
+        else:
+            if len(low) != len(self.data_min):
+                raise ValueError("fitted to %d features, chunk has %d" % (len(self.data_min), len(low)))
+            np.minimum(self.data_min, low, out=self.data_min)
+            np.maximum(self.data_max, high, out=self.data_max)
+        self.rows_seen += len(chunk)
+        self._offset = self._scale = None
+        return self
+
+    # fits to an iterable of chunks (or a single array), in one pass
+    def fit(self, chunks) -> "MinMaxScaler":
+        self.data_min = self.data_max = None
+        self.rows_seen = 0
+        if isinstance(chunks, np.ndarray):
+            chunks = (chunks,)
+        for chunk in chunks:
+            self.partial_fit(chunk)
+        if not self.fitted:
+            raise ValueError("no rows to fit the scaler to")
+        return self
+
+    # (offset, scale) such that transform(x) is x * scale - offset, worked out once
+    def coefficients(self) -> tuple[np.ndarray, np.ndarray]:
+        if self._scale is None:
+            if not self.fitted:
+                raise ValueError("the scaler has not been fitted")
+            span = self.data_max.astype(np.float64) - self.data_min
+            span[span == 0] = 1.0
+            self._scale = (1.0 / span).astype(np.float32)
+            self._offset = (self.data_min * self._scale).astype(np.float32)
+        return self._offset, self._scale
+
+    def transform(self, x: np.ndarray, copy: bool = False) -> np.ndarray:
+        """Scale the (rows, features) array x and return it.
+
+        A writable float32 array is scaled in place unless copy is set; anything else
+        (other dtypes, read-only memory maps, DataFrames) is scaled into a new float32
+        array.
+        """
+        offset, scale = self.coefficients()
+        if copy or not isinstance(x, np.ndarray) or x.dtype != np.float32 or not x.flags.writeable:
+            x = np.array(x, dtype=np.float32)
+        if x.shape[-1] != len(scale):
+            raise ValueError("fitted to %d features, got %d" % (len(scale), x.shape[-1]))
+        np.multiply(x, scale, out=x)
+        np.subtract(x, offset, out=x)
+        if self.clip:
+            np.clip(x, 0.0, 1.0, out=x)
+        return x
+
+    # scales each chunk of a stream as it passes, FeatureCache.chunks() blocks in place
+    def transform_chunks(self, chunks):
+        for chunk in chunks:
+            yield self.transform(chunk)
+
+    def inverse_transform(self, x: np.ndarray) -> np.ndarray:
+        offset, scale = self.coefficients()
+        return (np.asarray(x, dtype=np.float32) + offset) / scale
+
+    # the fitted range as arrays, under prefixed names so they can share a file with other arrays
+    def state(self, prefix: str = "scaler_") -> dict:
+        if not self.fitted:
+            raise ValueError("the scaler has not been fitted")
+        return {
+            prefix + "min": self.data_min,
+            prefix + "max": self.data_max,
+            prefix + "rows_seen": np.int64(self.rows_seen),
+            prefix + "clip": np.bool_(self.clip),
+        }
+
+    @classmethod
+    def from_state(cls, arrays, prefix: str = "scaler_") -> "MinMaxScaler":
+        scaler = cls(clip=bool(arrays[prefix + "clip"]))
+        scaler.data_min = np.asarray(arrays[prefix + "min"], dtype=np.float32).copy()
+        scaler.data_max = np.asarray(arrays[prefix + "max"], dtype=np.float32).copy()
+        scaler.rows_seen = int(arrays[prefix + "rows_seen"])
+        return scaler
+
+    def save(self, path: str):
+        np.savez(path, **self.state())
+
+    @classmethod
+    def load(cls, path: str) -> "MinMaxScaler":
+        with np.load(path) as arrays:
+            return cls.from_state(arrays)
+
+
+# a scaler fitted to the benign training rows (the notebook's X_train), streamed from the cache
+def fit_benign(csv_path: str, train_fraction: float = TRAIN_FRACTION, cache: FeatureCache = None,
+               clip: bool = False) -> MinMaxScaler:
+    cache = cache or FeatureCache()
+    train, _ = split_benign(cache.load(csv_path), train_fraction)
+    return MinMaxScaler(clip).fit(cache.chunks(csv_path, stop=len(train)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fit the feature scaler to the benign training rows.")
+    parser.add_argument("--data-dir", default=".", help="directory of the CSVs")
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    parser.add_argument("--device", type=int, default=DEVICE)
+    parser.add_argument("--clip", action="store_true", help="clip scaled values to [0, 1]")
+    parser.add_argument("-o", "--output", default="scaler.npz")
+    args = parser.parse_args(argv)
+
+    scaler = fit_benign(os.path.join(args.data_dir, csv_name("benign", args.device)),
+                        cache=FeatureCache(args.cache_dir), clip=args.clip)
+    scaler.save(args.output)
+    print("fitted to %d rows of %d features, saved to %s" % (scaler.rows_seen, len(scaler.data_min), args.output))
+
+
+if __name__ == "__main__":
+    main()
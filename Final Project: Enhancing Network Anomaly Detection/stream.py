@@ -0,0 +1,465 @@
+# online anomaly scoring of a never ending stream of feature rows
+#
+# python stream.py detector.npz --follow traffic.csv                # rows appended to a growing CSV
+# python stream.py detector.npz --unix /tmp/features.sock           # rows written to a local socket
+# python stream.py detector.npz --port 8171 --adapt quantile --q 0.99
+#
+# each input line is one row of comma separated features. rows are scored in micro
+# batches that close when batch_size rows have arrived or max_delay seconds after the
+# first of them, whichever comes first, so an alert is at most max_delay plus one batch
+# of scoring late. alerts are written as JSON lines.
+#
+# the threshold follows the benign traffic: the losses of the rows scored below it feed
+# either a running mean and variance (Welford) or a window of recent losses, and rows
+# flagged as anomalies never enter them, so a sustained attack cannot teach the
+# threshold that it is normal. the rows kept are a sample truncated at the threshold,
+# whose mean and spread are biased low; taken as they are, each threshold would come out
+# below the last even on unchanging traffic. the statistics are corrected for that by
+# fitting a normal distribution to the truncated sample (untruncated()). memory is
+# constant: one batch, the running statistics or the window, and a bounded queue
+# between the reader and the scorer
+import argparse
+import asyncio
+import json
+import math
+import os
+import sys
+import time
+from statistics import NormalDist
+from typing import NamedTuple
+
+import numpy as np
+
+from inference import Detector
+
+BATCH_SIZE = 256
+
+# seconds a row may wait for its batch to fill
+MAX_DELAY = 0.05
+
+# batches of rows the reader may queue ahead of the scorer before it stops reading
+QUEUED_BATCHES = 16
+
+# benign rows seen before the running threshold replaces the detector's own
+WARMUP = 1000
+
+# standard deviations above the mean at which a truncation is too far out to matter
+_NEGLIGIBLE_TRUNCATION = 8.0
+
+_STANDARD_NORMAL = NormalDist()
+
+
+# (beta + lambda) / sqrt(1 - beta * lambda - lambda ** 2) and lambda, the standardised
+# distance from the mean of the truncated normal to its upper bound beta standard
+# deviations above the untruncated mean, with lambda = pdf(beta) / cdf(beta)
+def _truncation(beta: float) -> tuple[float, float]:
+    ratio = _STANDARD_NORMAL.pdf(beta) / _STANDARD_NORMAL.cdf(beta)
+    return (beta + ratio) / math.sqrt(1 - beta * ratio - ratio * ratio), ratio
+
+
+def untruncated(mean: float, std: float, bound: float) -> tuple[float, float]:
+    """(mean, std) of the normal distribution whose part below bound has this mean and std.
+
+    Losses of the rows scored below a threshold are such a truncated sample. The
+    truncated mean is mu - sigma * lambda and its variance sigma ** 2 * (1 - beta *
+    lambda - lambda ** 2), for beta = (bound - mu) / sigma; beta is found by bisection.
+    Samples that reach past about 6 standard deviations of truncation are taken as
+    truncated at that point.
+    """
+    if not std > 0 or not math.isfinite(bound) or (bound - mean) / std >= _NEGLIGIBLE_TRUNCATION:
+        return float(mean), float(std)
+    target = (bound - mean) / std
+    low, high = -6.0, _NEGLIGIBLE_TRUNCATION
+    for _ in range(60):
+        middle = (low + high) / 2
+        if _truncation(middle)[0] < target:
+            low = middle
+        else:
+            high = middle
+    beta = (low + high) / 2
+    ratio = _truncation(beta)[1]
+    sigma = std / math.sqrt(1 - beta * ratio - ratio * ratio)
+    return float(bound - beta * sigma), float(sigma)
+
+
+class RunningThreshold:
+    """mean + k standard deviations of the losses of rows classified benign.
+
+    Only the rows scored below the current threshold are kept. Their mean and variance
+    are updated batch by batch with Welford's algorithm in its parallel form (Chan et
+    al.), which stays accurate over billions of rows, together with the average
+    threshold they were kept under, and corrected for that truncation by untruncated().
+    With max_count set, the statistics weigh at most max_count rows, older ones fading
+    out geometrically, so the threshold can follow drifting benign traffic.
+
+    Parameters
+    ----------
+    initial : float
+        Threshold used until warmup benign rows have been seen, e.g. the detector's.
+
+    k : float, optional
+        Standard deviations above the mean. The default is 1, the notebook's mean + std.
+
+    warmup : int, optional
+        Benign rows needed before the running statistics are used. The default is WARMUP.
+
+    max_count : int, optional
+        Effective number of rows remembered. The default is all of them.
+    """
+
+    def __init__(self, initial: float, k: float = 1.0, warmup: int = WARMUP, max_count: int = None):
+        self.initial = float(initial)
+        self.k = k
+        self.warmup = warmup
+        self.max_count = max_count
+        # statistics of the kept losses, truncated at bound on average
+        self.count = 0
+        self._mean = 0.0
+        self._m2 = 0.0
+        self.bound = 0.0
+        self.mean, self.std = 0.0, 0.0
+
+    # seeded with the training losses below their own mean + k std, so the threshold
+    # starts as the notebook's and the seed is truncated like every later batch
+    @classmethod
+    def from_losses(cls, losses, k: float = 1.0, max_count: int = None) -> "RunningThreshold":
+        losses = np.asarray(losses, dtype=np.float64)
+        threshold = cls(0.0, k, warmup=0, max_count=max_count)
+        bound = float(losses.mean() + k * losses.std())
+        threshold._add(losses[losses < bound], bound)
+        return threshold
+
+    # the losses of a batch; only those below the current threshold are kept
+    def update(self, losses: np.ndarray):
+        bound = self.value
+        losses = np.asarray(losses, dtype=np.float64)
+        self._add(losses[losses < bound], bound)
+
+    # adds losses that were all kept below bound (math.inf when nothing was left out)
+    def _add(self, losses: np.ndarray, bound: float = math.inf):
+        n = len(losses)
+        if not n:
+            return
+        batch_mean = float(losses.mean())
+        batch_m2 = float(np.square(losses - batch_mean).sum())
+        total = self.count + n
+        delta = batch_mean - self._mean
+        self._mean += delta * n / total
+        self._m2 += batch_m2 + delta * delta * self.count * n / total
+        self.bound = bound if self.count == 0 else self.bound + (bound - self.bound) * n / total
+        self.count = total
+        if self.max_count is not None and self.count > self.max_count:
+            self._m2 *= self.max_count / self.count
+            self.count = self.max_count
+        self.mean, self.std = untruncated(self._mean, (self._m2 / self.count) ** 0.5, self.bound)
+
+    @property
+    def value(self) -> float:
+        if self.count < max(self.warmup, 1):
+            return self.initial
+        return self.mean + self.k * self.std
+
+
+class WindowQuantile:
+    """The q quantile of the losses of the last window rows classified benign.
+
+    Only the rows scored below the current threshold enter the window, so its losses are
+    truncated there and their own q quantile would sit below the benign one, lower
+    with every update. Instead a normal distribution is fitted to the window with
+    untruncated(), using the average threshold its rows were kept under, and the
+    threshold is that distribution's q quantile. The window is a fixed ring buffer and
+    the fit is recomputed once per update.
+
+    Parameters
+    ----------
+    initial : float
+        Threshold used until warmup benign rows have been seen.
+
+    q : float, optional
+        Quantile of the benign losses, 0.99 flags about 1% of benign rows.
+
+    window : int, optional
+        Recent benign rows remembered.
+
+    warmup : int, optional
+        Benign rows needed before the window is used. The default is WARMUP.
+    """
+
+    def __init__(self, initial: float, q: float = 0.99, window: int = 65536, warmup: int = WARMUP):
+        self.initial = float(initial)
+        self.q = q
+        self.warmup = min(warmup, window)
+        self._z = _STANDARD_NORMAL.inv_cdf(q)
+        self._window = np.empty(window, dtype=np.float32)
+        # the threshold each row of the window was kept under
+        self._bounds = np.empty(window, dtype=np.float32)
+        self._next = 0
+        self.count = 0
+        self._value = self.initial
+
+    # the losses of a batch; only those below the current threshold are kept
+    def update(self, losses: np.ndarray):
+        losses = np.asarray(losses, dtype=np.float32)
+        losses = losses[losses < self._value][-len(self._window):]
+        if not len(losses):
+            return
+        end = self._next + len(losses)
+        if end <= len(self._window):
+            self._window[self._next:end] = losses
+            self._bounds[self._next:end] = self._value
+        else:
+            split = len(self._window) - self._next
+            self._window[self._next:] = losses[:split]
+            self._window[:end - len(self._window)] = losses[split:]
+            self._bounds[self._next:] = self._value
+            self._bounds[:end - len(self._window)] = self._value
+        self._next = end % len(self._window)
+        self.count = min(self.count + len(losses), len(self._window))
+        if self.count >= max(self.warmup, 1):
+            window = self._window[:self.count].astype(np.float64)
+            mean, std = untruncated(float(window.mean()), float(window.std()),
+                                    float(self._bounds[:self.count].mean(dtype=np.float64)))
+            self._value = mean + self._z * std
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+
+class Alert(NamedTuple):
+    row: int
+    loss: float
+    threshold: float
+    # seconds from the row's arrival to its alert
+    latency: float
+
+
+class StreamScorer:
+    """Scores rows from an async line source in micro batches and reports anomalies.
+
+    Parameters
+    ----------
+    detector : inference.Detector
+        The exported model, whose threshold is the starting one.
+
+    threshold : RunningThreshold or WindowQuantile, optional
+        Adapts the threshold to the benign traffic. The default is a RunningThreshold
+        starting from the detector's threshold.
+
+    batch_size : int, optional
+        Rows scored at once at most. The default is BATCH_SIZE.
+
+    max_delay : float, optional
+        Seconds a row may wait for its batch to fill. The default is MAX_DELAY.
+
+    on_alert : callable, optional
+        Called with every Alert. The default prints them as JSON lines.
+    """
+
+    def __init__(self, detector: Detector, threshold=None, batch_size: int = BATCH_SIZE,
+                 max_delay: float = MAX_DELAY, on_alert: callable = None):
+        self.detector = detector
+        self.threshold = threshold or RunningThreshold(detector.threshold)
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.on_alert = on_alert or (lambda alert: print(json.dumps(alert._asdict()), flush=True))
+
+        self.rows = 0
+        self.malformed = 0
+        self.alerts = 0
+        self.batches = 0
+        self.max_latency = 0.0
+        self._batch = np.empty((batch_size, detector.features), dtype=np.float32)
+        self._arrived = np.empty(batch_size, dtype=np.float64)
+        self._losses = np.empty(batch_size, dtype=np.float32)
+
+    # reads lines into the queue, None marks the end of the source
+    @staticmethod
+    async def _read(source, queue: asyncio.Queue):
+        try:
+            async for line in source:
+                await queue.put((line, time.monotonic()))
+        finally:
+            await queue.put(None)
+
+    # parses a line into row n of the batch, False for a malformed line (or a CSV header)
+    def _parse(self, line: str, n: int) -> bool:
+        values = line.strip().split(",")
+        if len(values) != self.detector.features:
+            return False
+        try:
+            self._batch[n] = [float(value) for value in values]
+        except ValueError:
+            return False
+        return True
+
+    # scores the first rows of the batch, reports its anomalies and adapts the threshold
+    def _flush(self, rows: int):
+        losses = self.detector.score(self._batch[:rows], out=self._losses[:rows])
+        threshold = self.threshold.value
+        anomalous = losses >= threshold
+        now = time.monotonic()
+        first_row = self.rows - rows
+        for i in np.flatnonzero(anomalous):
+            latency = now - float(self._arrived[i])
+            self.max_latency = max(self.max_latency, latency)
+            self.on_alert(Alert(first_row + int(i), float(losses[i]), threshold, latency))
+        self.alerts += int(np.count_nonzero(anomalous))
+        self.threshold.update(losses)
+        self.batches += 1
+
+    async def run(self, source):
+        """Score every line of source, an async iterable of CSV rows, until it ends."""
+        queue = asyncio.Queue(self.batch_size * QUEUED_BATCHES)
+        reader = asyncio.ensure_future(self._read(source, queue))
+        rows = 0
+        deadline = None
+        try:
+            while True:
+                if not queue.empty():
+                    item = queue.get_nowait()
+                else:
+                    try:
+                        timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+                        item = await asyncio.wait_for(queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        self._flush(rows)
+                        rows, deadline = 0, None
+                        continue
+                if item is None:
+                    break
+
+                line, arrived = item
+                if not self._parse(line, rows):
+                    self.malformed += 1
+                    continue
+                self._arrived[rows] = arrived
+                if deadline is None:
+                    deadline = arrived + self.max_delay
+                rows += 1
+                self.rows += 1
+                if rows == self.batch_size:
+                    self._flush(rows)
+                    rows, deadline = 0, None
+            if rows:
+                self._flush(rows)
+        finally:
+            reader.cancel()
+            await asyncio.gather(reader, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "rows": self.rows, "malformed": self.malformed, "alerts": self.alerts, "batches": self.batches,
+            "threshold": self.threshold.value, "max_latency_seconds": self.max_latency,
+        }
+
+
+async def follow(path: str, poll: float = 0.2, from_start: bool = False):
+    """Yield the lines appended to a file as they are written, like tail -F.
+
+    Waits for the file to exist, holds back a last line until its newline arrives,
+    and starts over when the file is truncated or replaced.
+    """
+    f = None
+    partial = ""
+    try:
+        while True:
+            if f is None:
+                try:
+                    f = open(path)
+                except FileNotFoundError:
+                    await asyncio.sleep(poll)
+                    continue
+                if not from_start:
+                    f.seek(0, os.SEEK_END)
+                from_start = True
+                partial = ""
+
+            line = f.readline()
+            if line:
+                partial += line
+                if partial.endswith("\n"):
+                    yield partial
+                    partial = ""
+                continue
+
+            await asyncio.sleep(poll)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if stat.st_ino != os.fstat(f.fileno()).st_ino or stat.st_size < f.tell():
+                f.close()
+                f = None
+    finally:
+        if f is not None:
+            f.close()
+
+
+async def listen(unix: str = None, host: str = "127.0.0.1", port: int = 8171, queued: int = BATCH_SIZE * QUEUED_BATCHES):
+    """Yield the lines written by any client to a Unix socket (or localhost TCP port).
+
+    Clients stop being read while queued lines wait, so a slow scorer slows the
+    writers down instead of buffering without bound.
+    """
+    lines = asyncio.Queue(queued)
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                await lines.put(line.decode("latin-1"))
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    if unix is not None:
+        server = await asyncio.start_unix_server(handle, path=unix)
+    else:
+        server = await asyncio.start_server(handle, host, port)
+    async with server:
+        while True:
+            yield await lines.get()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score a stream of feature rows with an exported detector.")
+    parser.add_argument("model", help=".npz written by inference.export()")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--follow", help="CSV file to follow as rows are appended")
+    source.add_argument("--unix", help="Unix socket to read rows from")
+    source.add_argument("--port", type=int, help="localhost TCP port to read rows from")
+    parser.add_argument("--from-start", action="store_true", help="score the rows already in --follow first")
+    parser.add_argument("--adapt", choices=("welford", "quantile"), default="welford")
+    parser.add_argument("--k", type=float, default=1.0, help="welford: standard deviations above the mean")
+    parser.add_argument("--max-count", type=int, default=None, help="welford: rows the statistics remember")
+    parser.add_argument("--q", type=float, default=0.99, help="quantile: quantile of the benign losses")
+    parser.add_argument("--window", type=int, default=65536, help="quantile: recent benign rows kept")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--max-delay", type=float, default=MAX_DELAY, help="seconds a row may wait for its batch")
+    args = parser.parse_args(argv)
+
+    detector = Detector.load(args.model, args.batch_size)
+    if args.adapt == "welford":
+        threshold = RunningThreshold(detector.threshold, args.k, max_count=args.max_count)
+    else:
+        threshold = WindowQuantile(detector.threshold, args.q, args.window)
+    scorer = StreamScorer(detector, threshold, args.batch_size, args.max_delay)
+
+    if args.follow:
+        lines = follow(args.follow, from_start=args.from_start)
+    else:
+        lines = listen(args.unix, port=args.port)
+    try:
+        asyncio.run(scorer.run(lines))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(json.dumps(scorer.stats()), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,362 @@
+# creates and runs unit tests of the numpy modules, on small generated CSVs and arrays
+import unittest
+
+# builds feature caches in a scratch directory
+import os
+import tempfile
+
+# drives the stream scorer
+import asyncio
+
+import numpy as np
+
+# imports functions and classes from pertaining files
+from dataset import ATTACKS, FeatureCache, csv_name, split_benign
+from evaluate import BENIGN_TEST, BENIGN_TRAIN, compute_errors, evaluate, labelled, sweep
+from inference import ARCHITECTURES, Detector, export
+from scaler import MinMaxScaler
+from stream import RunningThreshold, StreamScorer, WindowQuantile, untruncated
+
+
+# a Dense layer as export() reads it, the Keras methods it calls and nothing else
+class DenseLayer:
+    def __init__(self, kernel, bias, activation: str):
+        self.name = "dense"
+        self.kernel, self.bias, self.activation = kernel, bias, activation
+
+    def get_weights(self):
+        return [self.kernel, self.bias]
+
+    def get_config(self):
+        return {"activation": self.activation}
+
+
+# random Dense layers of an autoencoder with the given widths
+def random_layers(rng, widths, activations=("relu",)) -> list:
+    layers = []
+    for i, (fan_in, fan_out) in enumerate(zip(widths, widths[1:])):
+        kernel = rng.normal(scale=fan_in ** -0.5, size=(fan_in, fan_out)).astype(np.float32)
+        bias = rng.normal(scale=0.1, size=fan_out).astype(np.float32)
+        layers.append((kernel, bias, activations[i % len(activations)]))
+    return layers
+
+
+# the forward pass written out in float64, one layer at a time
+def reference_losses(layers, x) -> np.ndarray:
+    functions = {"relu": lambda y: np.maximum(y, 0), "linear": lambda y: y, "tanh": np.tanh,
+                 "sigmoid": lambda y: 1 / (1 + np.exp(-y))}
+    h = x.astype(np.float64)
+    for kernel, bias, activation in layers:
+        h = functions[activation](h @ kernel.astype(np.float64) + bias)
+    return np.abs(h - x).mean(axis=1)
+
+
+class TestAnomalyDetection(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    # writes a CSV with a header under the scratch directory, returns its path
+    def write_csv(self, name: str, text: str) -> str:
+        path = os.path.join(self.tmp.name, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(text)
+        return path
+
+    def test_feature_cache(self):
+        cache = FeatureCache(os.path.join(self.tmp.name, "cache"), chunk_rows=2)
+        path = self.write_csv("a/9.benign.csv", "x,y\n1,2\n3,4\n\n5,6\n\n")
+        data = cache.load(path)
+        self.assertEqual(data.dtype, np.float32)
+        self.assertEqual(data.tolist(), [[1, 2], [3, 4], [5, 6]])
+        self.assertTrue(data.flags.f_contiguous)
+        self.assertEqual(cache.columns(path), ["x", "y"])
+        self.assertEqual([chunk.tolist() for chunk in cache.chunks(path, start=1)], [[[3, 4], [5, 6]]])
+
+        # a CSV of the same name elsewhere gets its own cache
+        other = self.write_csv("b/9.benign.csv", "x,y\n7,8\n")
+        self.assertEqual(cache.load(other).tolist(), [[7, 8]])
+        self.assertEqual(cache.load(path).tolist(), [[1, 2], [3, 4], [5, 6]])
+
+        # changed contents are parsed again, no temporary files are left behind
+        self.write_csv("a/9.benign.csv", "x,y\n9,10\n")
+        self.assertEqual(cache.load(path).tolist(), [[9, 10]])
+        self.assertFalse([name for name in os.listdir(cache.directory) if name.endswith(".tmp")])
+
+        train, test = split_benign(np.arange(9))
+        self.assertEqual((len(train), len(test)), (6, 3))
+
+    def test_min_max_scaler(self):
+        rng = np.random.default_rng(19)
+        x = (rng.normal(size=(1000, 6)) * [1, 10, 100, 0.1, 1, 0]).astype(np.float32)
+        x[:, 4] = 3.0
+
+        # streamed chunk by chunk, the range is that of the whole array
+        scaler = MinMaxScaler().fit(np.array_split(x, 7))
+        np.testing.assert_array_equal(scaler.data_min, x.min(axis=0))
+        np.testing.assert_array_equal(scaler.data_max, x.max(axis=0))
+        self.assertEqual(scaler.rows_seen, 1000)
+
+        span = x.max(axis=0) - x.min(axis=0)
+        span[span == 0] = 1
+        expected = (x - x.min(axis=0)) / span
+        scaled = scaler.transform(x, copy=True)
+        np.testing.assert_allclose(scaled, expected, atol=1e-6)
+        self.assertEqual(scaled[:, 4].tolist(), [0.0] * 1000)
+        np.testing.assert_allclose(scaler.inverse_transform(scaled)[:, :4], x[:, :4], rtol=1e-4, atol=1e-4)
+
+        # a writable float32 array is scaled in place, anything else is copied
+        batch = x.copy()
+        self.assertIs(scaler.transform(batch), batch)
+        readonly = x.copy()
+        readonly.flags.writeable = False
+        self.assertIsNot(scaler.transform(readonly), readonly)
+        np.testing.assert_array_equal(readonly, x)
+
+        # rows outside the fitted range stay outside [0, 1] unless clipped
+        outside = np.full((1, 6), 1000, dtype=np.float32)
+        self.assertGreater(scaler.transform(outside, copy=True).max(), 1)
+        scaler.clip = True
+        self.assertEqual(scaler.transform(outside, copy=True).max(), 1)
+
+        path = os.path.join(self.tmp.name, "scaler.npz")
+        scaler.save(path)
+        loaded = MinMaxScaler.load(path)
+        self.assertTrue(loaded.clip)
+        np.testing.assert_array_equal(loaded.transform(x, copy=True), scaler.transform(x, copy=True))
+
+        with self.assertRaises(ValueError):
+            MinMaxScaler().fit([])
+        with self.assertRaises(ValueError):
+            scaler.transform(np.zeros((2, 5), dtype=np.float32))
+
+    def test_detector(self):
+        rng = np.random.default_rng(20)
+        x = rng.uniform(size=(1000, 115)).astype(np.float32)
+        for variant, (encoder, decoder) in ARCHITECTURES.items():
+            layers = random_layers(rng, (115,) + encoder + decoder)
+            expected = reference_losses(layers, x)
+
+            # batches smaller than the input, the last one partial
+            detector = Detector(layers, threshold=np.median(expected), batch_size=64)
+            losses = detector.score(x)
+            self.assertEqual(losses.dtype, np.float32)
+            np.testing.assert_allclose(losses, expected, rtol=1e-5, atol=1e-6)
+            np.testing.assert_array_equal(detector.predict(x), losses < detector.threshold)
+
+            out = np.empty(len(x), dtype=np.float32)
+            self.assertIs(detector.score(x, out), out)
+            np.testing.assert_array_equal(out, losses)
+
+        # every activation, with and without a scaler, through an exported file
+        layers = random_layers(rng, (115, 48, 24, 48, 115), ("tanh", "sigmoid", "linear", "relu"))
+        raw = x * 50 + 7
+        scaler = MinMaxScaler().fit(raw)
+        path = os.path.join(self.tmp.name, "detector.npz")
+        export_model = type("Model", (), {"layers": [DenseLayer(*layer) for layer in layers]})()
+        export(export_model, path, 0.25, scaler)
+        detector = Detector.load(path, batch_size=100)
+        self.assertEqual((detector.variant, detector.threshold), ("custom", np.float32(0.25)))
+        np.testing.assert_allclose(detector.score(raw), reference_losses(layers, scaler.transform(raw, copy=True)),
+                                   rtol=1e-5, atol=1e-6)
+
+        # scoring never modifies its input
+        before = raw.copy()
+        detector.score(raw)
+        np.testing.assert_array_equal(raw, before)
+
+        with self.assertRaises(ValueError):
+            detector.score(x[:, :100])
+
+    def test_sweep(self):
+        rng = np.random.default_rng(21)
+        # rounded so that many losses tie
+        benign = np.round(rng.gamma(2.0, 1.0, size=300), 1).astype(np.float32)
+        attack = np.round(rng.gamma(4.0, 1.0, size=200), 1).astype(np.float32)
+        losses = np.concatenate([benign, attack])
+        labels = np.arange(len(losses)) >= len(benign)
+        curve = sweep(losses, labels)
+
+        self.assertEqual(curve.thresholds[0], np.inf)
+        self.assertEqual(len(curve), len(np.unique(losses)) + 1)
+        self.assertTrue(np.all(np.diff(curve.thresholds) < 0))
+        for i, threshold in enumerate(curve.thresholds):
+            flagged = losses >= threshold
+            tp = np.count_nonzero(flagged & labels)
+            fp = np.count_nonzero(flagged & ~labels)
+            self.assertEqual((curve.tp[i], curve.fp[i]), (tp, fp))
+            self.assertAlmostEqual(curve.accuracy[i], np.mean(flagged == labels))
+            self.assertAlmostEqual(curve.recall[i], tp / 200)
+            self.assertAlmostEqual(curve.false_positive_rate[i], fp / 300)
+            self.assertAlmostEqual(curve.precision[i], tp / (tp + fp) if tp + fp else 1.0)
+            self.assertAlmostEqual(curve.f1[i], 2 * tp / (tp + fp + 200))
+
+        # any threshold, between the distinct losses or on them
+        for threshold in (0.0, 0.55, 2.0, float(attack.max()), 100.0):
+            point = curve.at(threshold)
+            flagged = losses >= threshold
+            self.assertEqual(point.threshold, threshold)
+            self.assertAlmostEqual(point.recall, np.count_nonzero(flagged & labels) / 200)
+            self.assertAlmostEqual(point.false_positive_rate, np.count_nonzero(flagged & ~labels) / 300)
+
+        # ROC AUC is the chance an attack row scores above a benign one, ties counting half
+        above = (attack[:, None] > benign[None, :]).mean() + 0.5 * (attack[:, None] == benign[None, :]).mean()
+        self.assertAlmostEqual(curve.roc_auc, above)
+        # average precision, the precision at each threshold weighted by the recall it adds
+        expected = sum((curve.recall[i] - curve.recall[i - 1]) * curve.precision[i] for i in range(1, len(curve)))
+        self.assertAlmostEqual(curve.average_precision, expected)
+
+        best = curve.best("f1")
+        self.assertEqual(best.f1, curve.f1.max())
+        self.assertEqual(curve.at(best.threshold), best)
+
+        perfect = sweep([0.1, 0.2, 0.8, 0.9], [False, False, True, True])
+        self.assertEqual((perfect.roc_auc, perfect.average_precision), (1.0, 1.0))
+        self.assertEqual(perfect.best("accuracy").threshold, np.float32(0.8))
+
+    def test_evaluate(self):
+        rng = np.random.default_rng(22)
+        attacks = ATTACKS[:2] + ATTACKS[5:6]
+        for name, shift in (("benign", 0.0),) + tuple((attack, 1.0 + i) for i, attack in enumerate(attacks)):
+            rows = rng.normal(shift, 0.3, size=(30, 3))
+            self.write_csv(csv_name(name), "a,b,c\n" + "".join("%f,%f,%f\n" % tuple(row) for row in rows))
+
+        # a linear autoencoder that outputs zeros, the loss of a row is its mean absolute value
+        layers = [(np.zeros((3, 2), np.float32), np.zeros(2, np.float32), "linear"),
+                  (np.zeros((2, 3), np.float32), np.zeros(3, np.float32), "linear")]
+        detector = Detector(layers, threshold=0.5)
+        cache = FeatureCache(os.path.join(self.tmp.name, "cache"))
+        path = os.path.join(self.tmp.name, "errors.npz")
+        errors = compute_errors(detector.score, self.tmp.name, attacks=attacks, path=path, cache=cache)
+        self.assertEqual(list(errors), [BENIGN_TRAIN, BENIGN_TEST] + list(attacks))
+        self.assertEqual((len(errors[BENIGN_TRAIN]), len(errors[BENIGN_TEST])), (20, 10))
+
+        # cached for this model, recomputed for another one or without a key
+        calls = []
+        cached = compute_errors(lambda x: calls.append(1) or detector.score(x), self.tmp.name, attacks=attacks,
+                                path=path, key=detector.fingerprint(), cache=cache)
+        self.assertEqual(calls, [])
+        np.testing.assert_array_equal(cached[attacks[0]], errors[attacks[0]])
+        other = Detector(layers[:1] + [(np.ones((2, 3), np.float32), np.ones(3, np.float32), "linear")], 0.5)
+        self.assertNotEqual(other.fingerprint(), detector.fingerprint())
+        recomputed = compute_errors(other.score, self.tmp.name, attacks=attacks, path=path, cache=cache)
+        self.assertFalse(np.array_equal(recomputed[attacks[0]], errors[attacks[0]]))
+        with self.assertRaises(ValueError):
+            compute_errors(lambda x: detector.score(x), self.tmp.name, attacks=attacks, path=path, cache=cache)
+
+        results = evaluate(errors, 0.5)
+        self.assertEqual(list(results), list(attacks) + ["mirai", "gafgyt", "all"])
+        benign_flagged = np.count_nonzero(errors[BENIGN_TEST] >= 0.5)
+        for name, families in (("mirai", attacks[:2]), ("all", attacks)):
+            tp = sum(np.count_nonzero(errors[family] >= 0.5) for family in families)
+            self.assertEqual(results[name]["anomalies"], tp)
+            self.assertEqual(results[name]["rows"], 30 * len(families))
+            self.assertAlmostEqual(results[name]["false_positive_rate"], benign_flagged / 10)
+        losses, labels = labelled(errors)
+        point = sweep(losses, labels).at(0.5)
+        self.assertAlmostEqual(point.f1, results["all"]["f1"])
+        self.assertAlmostEqual(point.accuracy, results["all"]["accuracy"])
+
+    def test_running_threshold(self):
+        rng = np.random.default_rng(23)
+        losses = rng.lognormal(0, 0.5, size=10000)
+        threshold = RunningThreshold(0.0, warmup=0)
+        threshold._add(losses[:3000])
+        threshold._add(losses[3000:])
+        self.assertAlmostEqual(threshold.mean, losses.mean())
+        self.assertAlmostEqual(threshold.std, losses.std())
+        self.assertAlmostEqual(threshold.value, losses.mean() + losses.std())
+
+        # the part of a normal sample below a bound gives back the whole sample's normal
+        losses = rng.normal(1.0, 0.1, size=200000)
+        for bound in (0.9, 1.0, 1.2, np.inf):
+            kept = losses[losses < bound]
+            mean, std = untruncated(kept.mean(), kept.std(), bound)
+            self.assertAlmostEqual(mean, 1.0, delta=0.005)
+            self.assertAlmostEqual(std, 0.1, delta=0.005)
+
+        threshold = RunningThreshold.from_losses(losses[:10000])
+        self.assertLess(threshold.count, 10000)
+        self.assertAlmostEqual(threshold.value, 1.1, delta=0.01)
+
+        window = WindowQuantile(0.5, q=0.9, window=1000, warmup=100)
+        window.update(losses[:50])
+        self.assertEqual(window.value, 0.5)
+        window = WindowQuantile(np.inf, q=0.9, window=1000, warmup=100)
+        for batch in np.array_split(losses[:20000], 20):
+            window.update(batch)
+        self.assertEqual(window.count, 1000)
+        self.assertAlmostEqual(window.value, 1.0 + 0.1 * 1.2816, delta=0.02)
+
+    def test_threshold_on_stationary_traffic(self):
+        # every batch is scored against the threshold and then updates it, as StreamScorer
+        # does; the rate of benign rows flagged must not creep up
+        rng = np.random.default_rng(24)
+        train = rng.normal(1.0, 0.1, size=100000)
+        for threshold, expected in ((RunningThreshold.from_losses(train), 0.159),
+                                    (RunningThreshold.from_losses(train, max_count=100000), 0.159),
+                                    (RunningThreshold(1.0), 0.159),
+                                    (WindowQuantile(np.quantile(train, 0.99), q=0.99), 0.01),
+                                    (WindowQuantile(1.0, q=0.99), 0.01)):
+            flagged = []
+            for _ in range(300):
+                losses = rng.normal(1.0, 0.1, size=4096)
+                flagged.append(np.mean(losses >= threshold.value))
+                threshold.update(losses)
+            self.assertAlmostEqual(np.mean(flagged[-100:]), expected, delta=expected * 0.15)
+
+        # a burst of anomalies does not move it at all
+        threshold = RunningThreshold.from_losses(train)
+        before = threshold.value
+        threshold.update(np.full(4096, 1e6))
+        self.assertEqual(threshold.value, before)
+
+    def test_threshold_under_sustained_attack(self):
+        # 30% of every batch is attack traffic far above the benign losses, for a long time;
+        # the threshold must stay where the benign traffic puts it and keep catching them
+        rng = np.random.default_rng(25)
+        for threshold, benign_value in ((RunningThreshold(1.2), 1.1),
+                                        (RunningThreshold(1.2, max_count=20000), 1.1),
+                                        (WindowQuantile(1.2, q=0.99), 1.0 + 0.1 * 2.3263)):
+            values, caught, attacks = [], 0, 0
+            for _ in range(200):
+                benign = rng.normal(1.0, 0.1, size=4096)
+                attack = rng.normal(20.0, 2.0, size=1229)
+                values.append(threshold.value)
+                caught += np.count_nonzero(attack >= threshold.value)
+                attacks += len(attack)
+                losses = np.concatenate([benign, attack])
+                rng.shuffle(losses)
+                threshold.update(losses)
+            self.assertLess(max(values), 1.3)
+            self.assertAlmostEqual(values[-1], benign_value, delta=0.02)
+            self.assertGreater(caught / attacks, 0.99)
+
+    def test_stream_scorer(self):
+        # an autoencoder that outputs zeros, the loss of a row is its mean absolute value
+        layers = [(np.zeros((2, 2), np.float32), np.zeros(2, np.float32), "linear")]
+        detector = Detector(layers, threshold=1.0, batch_size=4)
+        alerts = []
+        threshold = RunningThreshold(1.0, warmup=100)
+        scorer = StreamScorer(detector, threshold, batch_size=4, max_delay=0.01, on_alert=alerts.append)
+
+        async def source():
+            for line in ["a,b\n", "0.1,0.1\n", "5,5\n", "0.2,0.2\n", "bad\n", "0.3,0.3\n", "3,-3\n"]:
+                yield line
+            await asyncio.sleep(0.05)
+            yield "0,2\n"
+
+        asyncio.run(scorer.run(source()))
+        self.assertEqual([(alert.row, alert.loss) for alert in alerts], [(1, 5.0), (4, 3.0), (5, 1.0)])
+        self.assertTrue(all(alert.latency >= 0 and alert.threshold == 1.0 for alert in alerts))
+        stats = scorer.stats()
+        self.assertEqual((stats["rows"], stats["malformed"], stats["alerts"], stats["batches"]), (6, 2, 3, 3))
+        # only the rows scored below the threshold fed the statistics
+        self.assertEqual(threshold.count, 3)
+        self.assertAlmostEqual(threshold._mean, 0.2, places=6)
+        self.assertEqual(threshold.bound, 1.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
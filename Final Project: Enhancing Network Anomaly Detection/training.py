@@ -0,0 +1,95 @@
+# training of the notebook's AnomalyDetector through the shared pipeline, exported for inference.py
+#
+# history = train_autoencoder("detector.npz", data_dir=".", variant="deep")
+#
+# python training.py --data-dir . --variant deep -o detector.npz     # trains and exports the detector
+#
+# the tf.data pipeline, early stopping, checkpoints and throughput logging live in
+# pipeline.py; the scaler's coefficients normalise the rows inside it and the exported
+# threshold is measured on the exported model itself
+import argparse
+import os
+
+from tensorflow import keras
+
+from dataset import CACHE_DIR, DEVICE, FeatureCache, csv_name, split_benign
+from evaluate import mean_std_threshold
+from inference import ARCHITECTURES, Detector, export
+from pipeline import PATIENCE, fit, make_dataset, tune_batch_size
+from scaler import fit_benign
+
+CHECKPOINT_DIR = "checkpoints"
+
+
+class AnomalyDetector(keras.Model):
+    """The notebook's autoencoder, variant "shallow" (115-32-115) or "deep" (64/32/16)."""
+
+    def __init__(self, variant: str = "shallow"):
+        super().__init__()
+        encoder, decoder = ARCHITECTURES[variant]
+        self.variant = variant
+        self.encoder = keras.Sequential([keras.layers.Dense(width, activation="relu") for width in encoder])
+        self.decoder = keras.Sequential([keras.layers.Dense(width, activation="relu") for width in decoder])
+
+    def call(self, x):
+        return self.decoder(self.encoder(x))
+
+
+def build_autoencoder(variant: str = "shallow") -> keras.Model:
+    model = AnomalyDetector(variant)
+    model.compile(optimizer="adam", loss="mae")
+    return model
+
+
+def train_autoencoder(output: str, data_dir: str = ".", variant: str = "shallow", epochs: int = 100,
+                      batch_size: int = None, patience: int = PATIENCE, checkpoint_dir: str = CHECKPOINT_DIR,
+                      device: int = DEVICE, cache: FeatureCache = None) -> keras.callbacks.History:
+    """Train an AnomalyDetector on the benign training rows and export it with inference.export.
+
+    The scaler is fitted to the training rows and exported with the model; the
+    threshold is the notebook's mean + std of the training losses. Without a
+    batch_size the fastest one is measured first.
+    """
+    cache = cache or FeatureCache()
+    benign_path = os.path.join(data_dir, csv_name("benign", device))
+    train, test = split_benign(cache.load(benign_path))
+    scaler = fit_benign(benign_path, cache=cache)
+    offset, scale = scaler.coefficients()
+    normalisation = {"scale": scale, "offset": offset}
+
+    if batch_size is None:
+        batch_size = tune_batch_size(lambda: build_autoencoder(variant), train, shuffle=True, **normalisation)
+    model = build_autoencoder(variant)
+    history = fit(model, make_dataset(train, batch_size=batch_size, shuffle=True, **normalisation),
+                  make_dataset(test, batch_size=batch_size, **normalisation), epochs, len(train),
+                  os.path.join(checkpoint_dir, "detector_%s.weights.h5" % variant), patience)
+
+    # the threshold comes from the exported model itself, exactly as it will score
+    export(model, output, 0.0, scaler, variant)
+    threshold = mean_std_threshold(Detector.load(output).score(train))
+    export(model, output, threshold, scaler, variant)
+    return history
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train the anomaly detector and export it for inference.py.")
+    parser.add_argument("--data-dir", default=".", help="directory of the CSVs")
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    parser.add_argument("--device", type=int, default=DEVICE)
+    parser.add_argument("--variant", choices=sorted(ARCHITECTURES), default="shallow")
+    parser.add_argument("--epochs", type=int, default=100, help="at most, training stops early")
+    parser.add_argument("--batch-size", type=int, default=None, help="default: the fastest on this machine")
+    parser.add_argument("--patience", type=int, default=PATIENCE)
+    parser.add_argument("--checkpoint-dir", default=CHECKPOINT_DIR)
+    parser.add_argument("-o", "--output", default="detector.npz")
+    args = parser.parse_args(argv)
+
+    history = train_autoencoder(args.output, args.data_dir, args.variant, args.epochs, args.batch_size,
+                                args.patience, args.checkpoint_dir, args.device, FeatureCache(args.cache_dir))
+    rates = history.history["samples_per_second"]
+    print("%d epochs, best val_loss %.6f, %.0f samples/s on average, exported to %s" % (
+        len(rates), min(history.history["val_loss"]), sum(rates) / len(rates), args.output))
+
+
+if __name__ == "__main__":
+    main()
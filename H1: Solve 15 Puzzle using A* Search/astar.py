@@ -1,78 +1,692 @@
-# imports TilesNode which represents the 4 x 4 puzzle
-from tiles import TilesNode
+# imports TilesNode which represents the puzzle, Geometry which describes its board size
+# and Path which stores a solution as its moves
+from tiles import FIFTEEN, MOVE_CODES, Geometry, Path, TilesNode, path_to_moves
 
-# imports from std lib, used to store and prioritize puzzle during A* search
-from queue import PriorityQueue
+# used to describe heuristics that support incremental evaluation, and anytime solutions
+from typing import NamedTuple, Protocol
+
+# lookup table heuristics and pattern databases, selectable by name
+from heuristics import LinearConflict, WalkingDistance
+from patterndb import PatternDatabase
+
+# open lists used to store and prioritize puzzle nodes during A* search
+from openlist import BucketOpenList
+
+# optional instrumentation of AStar
+from stats import SearchAborted, SearchStats, TimedOpenList, timed_heuristic
+
+# heaps for the frontiers of the bidirectional search
+import heapq
+from itertools import count
+
+# used for the optional deadlines of the searches
+import time
+
+# sizes the stored search states for the stats
+import sys
+
+# how many expansions the searches run between deadline checks
+DEADLINE_CHECK_INTERVAL = 1024
+
+
+# raised by the searches when their deadline passes before a solution is found
+class SearchTimeout(Exception):
+    pass
+
+
+# precomputed Manhattan distance of every tile from every cell of the 15 puzzle, MANHATTAN[tile][cell]
+MANHATTAN = FIFTEEN.distance
+
+
+# protocol for heuristics that can score a child from its parent's value and the move
+class IncrementalHeuristic(Protocol):
+
+    # full evaluation, used for the root
+    def __call__(self, node: TilesNode) -> int: ...
+
+    # value of the child reached by sliding tile from cell src to cell dst,
+    # given the parent's value h
+    def update(self, h: int, tile: int, src: int, dst: int) -> int: ...
+
+
+# calculates hueristic value for puzzle node using Manhattan distance
+# target is optional, the board to measure the distance to instead of the goal
+# geometry is optional, the board size when there is no target (default: 15 puzzle)
+class ManhattanDistance:
+
+    def __init__(self, target: TilesNode = None, geometry: Geometry = None):
+        if target is not None:
+            geometry = target.geometry
+        elif geometry is None:
+            geometry = FIFTEEN
+        self.geometry = geometry
+
+        if target is None:
+            self.table = geometry.distance
+        else:
+            cells = geometry.cells
+            self.table = [[0] * cells for _ in range(cells)]
+            for target_cell in range(cells):
+                tile = (target.board >> (geometry.bits * target_cell)) & geometry.mask
+                if tile != 0:
+                    self.table[tile] = [
+                        geometry.cell_distance(cell, target_cell) for cell in range(cells)
+                    ]
+
+    # Manhattan distance = sums distance between each tile's current and goal position
+    def __call__(self, node: TilesNode) -> int:
+        geometry = self.geometry
+        if node.geometry is not geometry:
+            raise ValueError("heuristic is for %r, node is %r" % (geometry, node.geometry))
+
+        board = node.board
+        bits, mask = geometry.bits, geometry.mask
+        table = self.table
+        total_distance = 0
+        for cell in range(geometry.cells):
+            total_distance += table[(board >> (bits * cell)) & mask][cell]
+        return total_distance
+
+    # only the moved tile changes its distance, by +-1
+    def update(self, h: int, tile: int, src: int, dst: int) -> int:
+        distances = self.table[tile]
+        return h - distances[src] + distances[dst]
+
+    # the same heuristic measured toward another board, used by the backward half of MM
+    def toward(self, target: TilesNode) -> "ManhattanDistance":
+        return ManhattanDistance(target)
+
+
+heuristic = ManhattanDistance()
+
+
+# heuristics by name, each made for a board size; "pdb:PATH" names a pattern database file
+HEURISTICS = {
+    "manhattan": lambda geometry: ManhattanDistance(geometry=geometry),
+    "linear-conflict": LinearConflict,
+    "walking-distance": WalkingDistance,
+}
+
+
+# the heuristic called name for boards of geometry (default: 15 puzzle)
+def get_heuristic(name: str, geometry: Geometry = None):
+    if name.startswith("pdb:"):
+        return PatternDatabase(name[4:])
+    if name not in HEURISTICS:
+        raise ValueError("unknown heuristic %r, expected one of %s or pdb:PATH" % (name, ", ".join(HEURISTICS)))
+    return HEURISTICS[name](geometry or FIFTEEN)
+
+
+# the solvers take a heuristic or its name, which is resolved for the root's board size
+def _named(heuristic, root: TilesNode):
+    if isinstance(heuristic, str):
+        return get_heuristic(heuristic, root.geometry)
+    return heuristic
 
-# function calculates hueristic value for puzzle node using Manhattan distance
-def heuristic(node: TilesNode) -> int:
-    
-    total_distance = 0
-    for i in range(len(node.state)):
-        for j in range(len(node.state[i])):
-            tile = node.state[i][j]
-            if tile != 0:
-                goal_row = (tile - 1) // len(node.state)
-                goal_col = (tile - 1) % len(node.state[i])
-                
-				# Manhattan distance = sums distance between each tile's current and goal position
-                total_distance += abs(i - goal_row) + abs(j - goal_col)
-    return total_distance
 
 # A* star search function, 2 parameters -> root + huerisitic
-def AStar(root, heuristic: callable) -> list[TilesNode] or None:
+# the heuristic may also be given by name, see HEURISTICS
+# open_list is optional, any openlist.OpenList; the default bucket list needs integer f values
+# deadline is optional, a time.monotonic() value after which SearchTimeout is raised
+# stats is optional, a stats.SearchStats that is filled in as the search runs
+# callback is optional, called with the stats every callback_interval expansions; the
+# search raises stats.SearchAborted if it returns a true value
+# every solver checks its root first: tiles.InvalidPuzzleError for a board that is not a
+# permutation of its tiles, tiles.UnsolvablePuzzleError for one that cannot reach the goal
+# cache is optional, a cache.SolutionCache; cached boards are answered without searching,
+# cached distances are used as exact h values and the solution found is recorded in it
+def AStar(root, heuristic: callable, open_list=None, deadline: float = None,
+          stats: SearchStats = None, callback: callable = None, callback_interval: int = 10000,
+          cache=None) -> Path or None:
+
+	# rejects bad boards before searching half of the state space for them
+    root.validate()
+    heuristic = _named(heuristic, root)
+
+	# a cached root needs no search at all
+    if cache is not None:
+        cached = cache.solution(root)
+        if cached is not None:
+            return cached
+
+	# cached distances of the states generated so far, their f is exact
+        exact = {}
+
+	# board size tables used to move tiles
+    geometry = root.geometry
+    neighbours, bits, mask = geometry.neighbours, geometry.bits, geometry.mask
+    goal_board = geometry.goal_board
+    from_board = TilesNode.from_board
+
+	# the search keeps no nodes, a state is the packed board with the empty space's cell in its low bits
+    shift = (geometry.cells - 1).bit_length()
+    blank_mask = (1 << shift) - 1
+    root_state = root.board << shift | root.blank
+
+	# 2 bit code of each move, keyed by the change in the empty space's cell
+    codes = {delta: MOVE_CODES.index(letter) for delta, letter in geometry.moves.items()}
     
 	# initlizes data structures
-	# priority wueue stores puzzle states that will be explored, prioritized by f_score
-    unexplored = PriorityQueue()
-    counter = 0
-    unexplored.put((heuristic(root), counter, root))
+	# open list stores puzzle states that will be explored, prioritized by f = g + h
+    unexplored = BucketOpenList() if open_list is None else open_list
+
+	# scores the root once, children are then scored from their parent's h when the heuristic supports it
+    update = getattr(heuristic, "update", None)
+
+	# instrumentation wraps the heuristic and the open list, only for a measured search
+    if callback is not None and stats is None:
+        stats = SearchStats()
+    if stats is not None:
+        started = time.perf_counter()
+        stats.node_bytes = sys.getsizeof(root_state)
+        heuristic, update = timed_heuristic(heuristic, update, stats)
+        unexplored = TimedOpenList(unexplored, stats)
+        callback_countdown = callback_interval
+
+    root.h = heuristic(root)
+    unexplored.push(root.h, 0, root_state)
     
-	# stores puzzle nodes already explored
+	# stores puzzle states already explored, only kept for the stats
     explored = set()
     
-	# stores cost to reach puzzle to root node
-    g_score = {root: 0}
+	# stores cost to reach each state from the root and the move that reached it, as g << 2 | move code
+	# the path is rebuilt from these moves, so no state keeps a parent
+    g_score = {root_state: 0}
     
-	# stores estimated total cost (g_score + hueristic) to reach puzzle to root node
-    f_score = {root: heuristic(root)}
-    
-	# loop that explores unexplored priority queue
-    while not unexplored.empty():
+	# counts expansions between deadline checks
+    countdown = DEADLINE_CHECK_INTERVAL
+
+	# loop that explores unexplored open list
+    while unexplored:
         
-		# each iteration gets puzzle node with lowest f_score (estimated total cost) from unexplored pq 
-        current_node = unexplored.get()[2]
+		# each iteration gets puzzle state with lowest f (estimated total cost) from the open list
+        current_f, current_g, current_state = unexplored.pop()
+
+		# skips stale entries, the state was reopened later with a better g
+        if current_g > g_score[current_state] >> 2:
+            continue
+        board, blank = current_state >> shift, current_state & blank_mask
         
 		# if current state is the goal state -> returns solution path
-        if current_node.is_goal():
-            return current_node.get_path()
+        if board == goal_board:
+            if stats is not None:
+                stats.seconds += time.perf_counter() - started
+            path = Path(root, _moves_to(current_state, root_state, g_score, geometry))
+            if cache is not None:
+                cache.record(path)
+            return path
+
+		# h of the current state, its f was pushed as g + h unless it had a cached distance
+        current_h = current_f - current_g
+
+		# a state with a cached distance has the lowest f, so the path through it is optimal
+        if cache is not None and current_state in exact:
+            current_node = from_board(board, blank, None, geometry)
+            suffix = cache.solution(current_node)
+            if suffix is not None:
+                if stats is not None:
+                    stats.seconds += time.perf_counter() - started
+                path = Path(root, _moves_to(current_state, root_state, g_score, geometry) + suffix.moves)
+                cache.record(path)
+                return path
+            # evicted since it was generated, searched below like any other state
+            del exact[current_state]
+            current_h = heuristic(current_node)
+
+        if stats is not None:
+            stats.expanded += 1
+            stats.layers[current_g + current_h] += 1
+            if current_state in explored:
+                stats.reexpanded += 1
+            if callback is not None:
+                callback_countdown -= 1
+                if callback_countdown == 0:
+                    callback_countdown = callback_interval
+                    stats.seconds = time.perf_counter() - started
+                    if callback(stats):
+                        raise SearchAborted
 		
-		# else it marks the current node as explored 
-        explored.add(current_node)
+			# else it marks the current state as explored 
+            explored.add(current_state)
+
+        if deadline is not None:
+            countdown -= 1
+            if countdown == 0:
+                countdown = DEADLINE_CHECK_INTERVAL
+                if time.monotonic() > deadline:
+                    raise SearchTimeout
         
-		# moves onto neighboring puzzle nodes (ie. children of current node)
-        for neighbor in current_node.get_children():
-            
-			# need to calculate g_score 
-            tentative_g_score = g_score[current_node] + 1
+		# need to calculate g_score 
+        tentative_g_score = current_g + 1
+
+		# moves onto neighboring puzzle states, the tile at each neighbouring cell slides into the empty space
+        if stats is None:
+            children = [(cell, (board >> (bits * cell)) & mask) for cell in neighbours[blank]]
+        else:
+            start = time.perf_counter()
+            children = [(cell, (board >> (bits * cell)) & mask) for cell in neighbours[blank]]
+            stats.children_seconds += time.perf_counter() - start
+            stats.generated += len(children)
+            if len(explored) > stats.peak_closed:
+                stats.peak_closed = len(explored)
+
+        pending = []
+        for cell, tile in children:
+            neighbor_board = board + (tile << (bits * blank)) - (tile << (bits * cell))
+            neighbor = neighbor_board << shift | cell
             
-			# if neighbor node already explored and g_score is >= previous g_score
-            if neighbor in explored and tentative_g_score >= g_score[neighbor]:
-                
-				# skips neighbor since there is not a better path
+			# if neighbor state already reached with a g_score <= tentative g_score
+			# skips neighbor since there is not a better path
+            previous = g_score.get(neighbor)
+            if previous is not None and tentative_g_score >= previous >> 2:
+                if stats is not None and neighbor in explored:
+                    stats.duplicates += 1
                 continue
 
-			# else (ie. tentative g_score < previous g_score)
-            if tentative_g_score < g_score.get(neighbor, float('inf')):
-                
-                # this becomes the better path, g_score, f_score updated, added to unexplored pq
-                neighbor.parent = current_node
-                g_score[neighbor] = tentative_g_score
-                f_score[neighbor] = tentative_g_score + heuristic(neighbor)
-                
-				# increment counter used to break ties when two nodes have the same f_score
-                counter += 1 
-                unexplored.put((f_score[neighbor], counter, neighbor))
+            # else this becomes the better path, g_score updated, added to open list
+            g_score[neighbor] = tentative_g_score << 2 | codes[cell - blank]
+            if update is not None:
+                # the tile moved from cell to where the empty space was in the current state
+                neighbor_h = update(current_h, tile, cell, blank)
+            else:
+                neighbor_h = heuristic(from_board(neighbor_board, cell, None, geometry))
+            if cache is not None:
+                pending.append((neighbor_board, neighbor, neighbor_h))
+                continue
+            unexplored.push(tentative_g_score + neighbor_h, tentative_g_score, neighbor)
+
+        # the children of one expansion are looked up in the cache together
+        if pending:
+            cached_distances = cache.distances(geometry, [child[0] for child in pending])
+            for neighbor_board, neighbor, neighbor_h in pending:
+                distance = cached_distances.get(neighbor_board)
+                if distance is not None:
+                    exact[neighbor] = distance
+                    neighbor_h = distance
+                unexplored.push(tentative_g_score + neighbor_h, tentative_g_score, neighbor)
                 
 	# if loop exits without solution -> returns None since no path to goal node found
-    return None
\ No newline at end of file
+    if stats is not None:
+        stats.seconds += time.perf_counter() - started
+    return None
+
+
+# the moves from root_state to state, undoing the move stored with each state in g_score
+def _moves_to(state: int, root_state: int, g_score: dict, geometry: Geometry) -> str:
+    bits, mask = geometry.bits, geometry.mask
+    shift = (geometry.cells - 1).bit_length()
+    blank_mask = (1 << shift) - 1
+    deltas = [geometry.deltas[letter] for letter in MOVE_CODES]
+
+    moves = []
+    while state != root_state:
+        code = g_score[state] & 3
+        board, blank = state >> shift, state & blank_mask
+        previous = blank - deltas[code]
+        # the tile that moved sits where the empty space was before the move
+        tile = (board >> (bits * previous)) & mask
+        board = board - (tile << (bits * previous)) + (tile << (bits * blank))
+        state = board << shift | previous
+        moves.append(MOVE_CODES[code])
+    return "".join(reversed(moves))
+
+
+# the path from root to one of its descendants, following the parents of node
+def _path_from(node: TilesNode, root: TilesNode) -> Path:
+    moves = node.geometry.moves
+    letters = []
+    while node is not root:
+        letters.append(moves[node.blank - node.parent.blank])
+        node = node.parent
+    return Path(root, "".join(reversed(letters)))
+
+
+# IDA* search function, same parameters and result as AStar
+# iterative deepening on f = g + h, memory is linear in the depth of the solution
+# stats is optional, gets the expanded and generated counts, the expansions of each
+# iteration in layers (keyed by its bound) and the wall time
+def IDAStar(root, heuristic: callable, deadline: float = None, stats: SearchStats = None) -> Path or None:
+
+    root.validate()
+    heuristic = _named(heuristic, root)
+    started = time.perf_counter()
+    update = getattr(heuristic, "update", None)
+    root.h = heuristic(root)
+    countdown = DEADLINE_CHECK_INTERVAL
+    expanded = generated = 0
+
+    geometry = root.geometry
+    neighbours, bits, mask = geometry.neighbours, geometry.bits, geometry.mask
+
+    # current path from the root, the only nodes kept in memory
+    path = [root]
+
+    # depth first search below node, returns the smallest f that exceeded the bound
+    # (or None once the goal is found, leaving the solution in path)
+    def search(node, g, bound):
+        nonlocal countdown, expanded, generated
+        f = g + node.h
+        if f > bound:
+            return f
+        if node.is_goal():
+            return None
+        expanded += 1
+
+        if deadline is not None:
+            countdown -= 1
+            if countdown == 0:
+                countdown = DEADLINE_CHECK_INTERVAL
+                if time.monotonic() > deadline:
+                    raise SearchTimeout
+
+        board = node.board
+        blank = node.blank
+
+        # the empty space never moves straight back to where it came from
+        previous = path[-2].blank if len(path) > 1 else -1
+        minimum = float('inf')
+        for cell in neighbours[blank]:
+            if cell == previous:
+                continue
+            generated += 1
+
+            # same move as TilesNode.get_children
+            tile = (board >> (bits * cell)) & mask
+            child = TilesNode.from_board(
+                board + (tile << (bits * blank)) - (tile << (bits * cell)), cell, node, geometry)
+            if update is not None:
+                child.h = update(node.h, tile, cell, blank)
+            else:
+                child.h = heuristic(child)
+
+            path.append(child)
+            t = search(child, g + 1, bound)
+            if t is None:
+                return None
+            path.pop()
+            if t < minimum:
+                minimum = t
+        return minimum
+
+    # each iteration raises the bound to the smallest f that exceeded the previous one
+    bound = root.h
+    while True:
+        layer_start = expanded
+        try:
+            t = search(root, 0, bound)
+        finally:
+            if stats is not None:
+                stats.expanded, stats.generated = expanded, generated
+                stats.layers[bound] += expanded - layer_start
+                stats.seconds = time.perf_counter() - started
+        if t is None:
+            return Path(root, path_to_moves(path))
+        if t == float('inf'):
+            return None
+        bound = t
+
+
+# one improvement found by anytime_astar
+# path is the solution, bound an upper bound on len(path) - 1 divided by the optimal length
+# and weight the heuristic weight of the pass that found it
+class AnytimeSolution(NamedTuple):
+    path: Path
+    bound: float
+    weight: float
+
+
+# weights of the successive passes of anytime_astar, the last pass is plain A*
+ANYTIME_WEIGHTS = (3.0, 2.0, 1.5, 1.25, 1.0)
+
+
+# anytime weighted A* (ARA*): passes with decreasing heuristic weights that reuse the
+# previous pass's work, yields an AnytimeSolution each time the solution or its bound improves
+# stops once the solution is proven optimal (bound == 1), or silently when the deadline
+# (a time.monotonic() value) passes or max_nodes expansions have been made
+def anytime_astar(root, heuristic: callable, weights=ANYTIME_WEIGHTS, deadline: float = None, max_nodes: int = None):
+
+    root.validate()
+    heuristic = _named(heuristic, root)
+    update = getattr(heuristic, "update", None)
+    bits, mask = root.geometry.bits, root.geometry.mask
+    root.h = heuristic(root)
+
+    g_score = {root: 0}
+    # nodes waiting in the open list, and closed nodes reached again with a better g this pass
+    open_nodes = {root}
+    incons = set()
+    closed = set()
+
+    best_goal = None
+    best_cost = float('inf')
+    reported_bound = float('inf')
+    expanded = 0
+    countdown = DEADLINE_CHECK_INTERVAL
+
+    for weight in weights:
+        # entries are (g + weight * h, -g, tiebreak, g, node); stale ones are skipped when popped
+        tiebreak = count()
+        open_nodes |= incons
+        incons = set()
+        closed = set()
+        heap = [
+            (g_score[node] + weight * node.h, -g_score[node], next(tiebreak), g_score[node], node)
+            for node in open_nodes
+        ]
+        heapq.heapify(heap)
+
+        # improves the solution until no open node can lead to a cheaper one under this weight
+        while heap and heap[0][0] < best_cost:
+            _, _, _, g, node = heapq.heappop(heap)
+            if node not in open_nodes or g != g_score[node]:
+                continue
+
+            if max_nodes is not None and expanded >= max_nodes:
+                return
+            if deadline is not None:
+                countdown -= 1
+                if countdown == 0:
+                    countdown = DEADLINE_CHECK_INTERVAL
+                    if time.monotonic() > deadline:
+                        return
+
+            open_nodes.discard(node)
+            closed.add(node)
+            expanded += 1
+
+            if node.is_goal():
+                best_goal, best_cost = node, g
+                continue
+
+            child_g = g + 1
+            for child in node.get_children():
+                if child_g >= g_score.get(child, float('inf')):
+                    continue
+                g_score[child] = child_g
+                if update is not None:
+                    tile = (child.board >> (bits * node.blank)) & mask
+                    child.h = update(node.h, tile, child.blank, node.blank)
+                else:
+                    child.h = heuristic(child)
+
+                # closed nodes wait for the next pass, as in ARA*
+                if child in closed:
+                    incons.add(child)
+                else:
+                    open_nodes.add(child)
+                    heapq.heappush(heap, (child_g + weight * child.h, -child_g, next(tiebreak), child_g, child))
+
+        if best_goal is None:
+            continue
+
+        # every cheaper solution passes through an open or inconsistent node
+        lower_bound = min(
+            (g_score[node] + node.h for node in open_nodes | incons), default=best_cost)
+        bound = max(1.0, min(weight, best_cost / lower_bound if lower_bound > 0 else 1.0))
+        if bound < reported_bound:
+            reported_bound = bound
+            yield AnytimeSolution(_path_from(best_goal, root), bound, weight)
+        if bound == 1.0:
+            return
+
+
+# runs anytime_astar until it proves optimality or the budget runs out and returns the
+# last AnytimeSolution, raises SearchTimeout if the budget ran out before any solution
+def AnytimeAStar(root, heuristic: callable, weights=ANYTIME_WEIGHTS, deadline: float = None, max_nodes: int = None) -> AnytimeSolution:
+    solution = None
+    for solution in anytime_astar(root, heuristic, weights, deadline, max_nodes):
+        pass
+    if solution is None:
+        raise SearchTimeout
+    return solution
+
+
+# one direction of the bidirectional search
+# a node is open when it has a g but is not in closed; heap entries of nodes that were
+# closed or reached again with a better g since they were pushed are skipped lazily
+class _Frontier:
+
+    def __init__(self, root: TilesNode, heuristic: callable):
+        self.heuristic = heuristic
+        self.update = getattr(heuristic, "update", None)
+        self.bits, self.mask = root.geometry.bits, root.geometry.mask
+        root.h = heuristic(root)
+        self.g = {root: 0}
+        # latest node object for each state, its parent chain is the best path found
+        self.nodes = {root: root}
+        self.closed = set()
+        # (priority, g, tiebreak, node) heaps for max(f, 2g), f and g
+        self.pr_heap, self.f_heap, self.g_heap = [], [], []
+        self.tiebreak = count()
+        self.expanded = self.generated = 0
+        self.push(root, 0)
+
+    def push(self, node: TilesNode, g: int):
+        f = g + node.h
+        n = next(self.tiebreak)
+        heapq.heappush(self.pr_heap, (max(f, 2 * g), g, n, node))
+        heapq.heappush(self.f_heap, (f, g, n, node))
+        heapq.heappush(self.g_heap, (g, g, n, node))
+
+    # lowest key of an open node in heap, inf when the frontier is empty
+    def peek(self, heap) -> float:
+        while heap:
+            _, g, _, node = heap[0]
+            if node not in self.closed and self.g[node] == g:
+                return heap[0][0]
+            heapq.heappop(heap)
+        return float('inf')
+
+    # expands the open node with the lowest priority, returns it and its improved children
+    def expand(self) -> tuple[TilesNode, list[TilesNode]]:
+        self.peek(self.pr_heap)
+        _, g, _, node = heapq.heappop(self.pr_heap)
+        self.closed.add(node)
+        self.expanded += 1
+
+        improved = []
+        children = node.get_children()
+        self.generated += len(children)
+        for child in children:
+            child_g = g + 1
+            if child_g >= self.g.get(child, float('inf')):
+                continue
+            self.g[child] = child_g
+            self.nodes[child] = child
+            self.closed.discard(child)
+            if self.update is not None:
+                tile = (child.board >> (self.bits * node.blank)) & self.mask
+                child.h = self.update(node.h, tile, child.blank, node.blank)
+            else:
+                child.h = self.heuristic(child)
+            self.push(child, child_g)
+            improved.append(child)
+        return node, improved
+
+
+# bidirectional MM search ("meet in the middle"), same parameters and result as AStar
+# searches forward from root with heuristic and backward from the goal with reverse_heuristic,
+# which estimates the distance to root (default: heuristic.toward(root), if the heuristic has it)
+# each direction expands nodes in order of max(g + h, 2g), so neither passes the midpoint
+# stats is optional, gets the expanded and generated counts of both directions, the peak
+# number of states stored and the wall time
+def MM(root, heuristic: callable, reverse_heuristic: callable = None, deadline: float = None,
+       stats: SearchStats = None) -> Path or None:
+
+    root.validate()
+    heuristic = _named(heuristic, root)
+    started = time.perf_counter()
+
+    geometry = root.geometry
+    if root.board == geometry.goal_board:
+        return Path(root)
+    if reverse_heuristic is None:
+        if not hasattr(heuristic, "toward"):
+            raise ValueError("MM needs a reverse_heuristic for heuristics without a toward() method")
+        reverse_heuristic = heuristic.toward(root)
+
+    goal = TilesNode.from_board(geometry.goal_board, geometry.cells - 1, geometry=geometry)
+    forward = _Frontier(root, heuristic)
+    backward = _Frontier(goal, reverse_heuristic)
+
+    # cost of the best solution found so far and the state where its two halves meet
+    best_cost = float('inf')
+    meeting = None
+    countdown = DEADLINE_CHECK_INTERVAL
+
+    while True:
+        pr_forward = forward.peek(forward.pr_heap)
+        pr_backward = backward.peek(backward.pr_heap)
+
+        # no solution can be cheaper than any of these lower bounds (unit move cost)
+        lower_bound = max(
+            min(pr_forward, pr_backward),
+            forward.peek(forward.f_heap),
+            backward.peek(backward.f_heap),
+            forward.peek(forward.g_heap) + backward.peek(backward.g_heap) + 1,
+        )
+        if best_cost <= lower_bound:
+            break
+        if pr_forward == float('inf') or pr_backward == float('inf'):
+            break
+
+        if deadline is not None:
+            countdown -= 1
+            if countdown == 0:
+                countdown = DEADLINE_CHECK_INTERVAL
+                if time.monotonic() > deadline:
+                    raise SearchTimeout
+
+        # expands in the direction with the lower priority, forward on ties
+        frontier, other = (forward, backward) if pr_forward <= pr_backward else (backward, forward)
+        _, improved = frontier.expand()
+        for child in improved:
+            other_g = other.g.get(child)
+            if other_g is not None and frontier.g[child] + other_g < best_cost:
+                best_cost = frontier.g[child] + other_g
+                meeting = child
+
+    if stats is not None:
+        stats.expanded = forward.expanded + backward.expanded
+        stats.generated = forward.generated + backward.generated
+        stats.peak_closed = len(forward.g) + len(backward.g)
+        stats.seconds = time.perf_counter() - started
+
+    if meeting is None:
+        return None
+
+    # root -> meeting through the forward parents
+    path = []
+    node = forward.nodes[meeting]
+    while node is not root:
+        path.append(node)
+        node = node.parent
+    path.append(root)
+    path.reverse()
+
+    # meeting -> goal through the backward parents, relinked so parents point toward root
+    node = backward.nodes[meeting].parent
+    while node is not None:
+        path.append(TilesNode.from_board(node.board, node.blank, path[-1]))
+        node = node.parent
+    return Path(root, path_to_moves(path))
@@ -0,0 +1,270 @@
+# solves many puzzles in parallel over a process pool and streams the results
+#
+# python batch.py puzzles.jsonl -o solutions.jsonl --workers 8 --timeout 30
+#
+# each input line is a JSON board, either a list of rows, a flat list of a square board's
+# tiles, or an object {"id": ..., "state": board}. each output line is a JSON object with the
+# instance's index (and id), its status, the solution moves and per instance search stats.
+# a line that is not valid JSON, or an object without a state, is reported as invalid
+# and the rest of the stream is still solved
+import argparse
+import json
+import math
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
+from multiprocessing.util import Finalize
+
+from astar import HEURISTICS, MM, AStar, IDAStar, ManhattanDistance, SearchTimeout, get_heuristic
+from cache import SolutionCache
+from patterndb import PatternDatabase
+from stats import SearchStats
+from tiles import FIFTEEN, InvalidPuzzleError, TilesNode, UnsolvablePuzzleError, path_to_moves, validate_state
+
+SOLVERS = {"astar": AStar, "idastar": IDAStar, "mm": MM}
+
+# the batched search needs numpy
+try:
+    from batched import BatchAStar, batch_heuristic
+except ImportError:
+    pass
+else:
+    SOLVERS["batched"] = BatchAStar
+
+# instances queued per worker, bounds memory when the input is a long stream
+QUEUED_PER_WORKER = 4
+
+# the solution cache connection of this worker process, opened by _open_cache
+_worker_cache = None
+
+
+# pool initializer, each worker connects to the cache file once and closes it on exit
+def _open_cache(path: str, max_entries: int) -> None:
+    global _worker_cache
+    _worker_cache = SolutionCache(path, max_entries)
+    Finalize(_worker_cache, _worker_cache.close, exitpriority=10)
+
+
+# solve_one with the worker's own cache connection
+def _solve_cached(index: int, state, solver, heuristic: callable, timeout: float) -> dict:
+    return solve_one(index, state, solver, heuristic, timeout, _worker_cache)
+
+
+# solves a single instance, runs inside a worker process
+# without a heuristic, Manhattan distance for the instance's board size is used
+# state may also be the InvalidPuzzleError of an input line that could not be read
+# any other exception of the solver is reported as an "error" result, not raised, so one
+# instance cannot abort the rest of a batch
+def solve_one(index: int, state, solver=AStar, heuristic: callable = None, timeout: float = None,
+              cache: SolutionCache = None) -> dict:
+    start = time.monotonic()
+    deadline = None if timeout is None else start + timeout
+    result = {"index": index}
+    stats = None
+    try:
+        if isinstance(state, InvalidPuzzleError):
+            raise state
+        # untrusted input, a malformed board is reported instead of reaching the solver
+        root = TilesNode(state=state, geometry=validate_state(state))
+        if heuristic is None:
+            heuristic = ManhattanDistance(geometry=root.geometry)
+        stats = SearchStats()
+        if cache is None:
+            solution = solver(root, heuristic, deadline=deadline, stats=stats)
+        else:
+            solution = solver(root, heuristic, deadline=deadline, stats=stats, cache=cache)
+    except SearchTimeout:
+        result["status"] = "timeout"
+    except UnsolvablePuzzleError as error:
+        result["status"] = "unsolvable"
+        result["error"] = str(error)
+    except InvalidPuzzleError as error:
+        result["status"] = "invalid"
+        result["error"] = str(error)
+    except Exception as error:
+        result["status"] = "error"
+        result["error"] = "%s: %s" % (type(error).__name__, error)
+    else:
+        if solution is None:
+            result["status"] = "unsolvable"
+        else:
+            result["status"] = "solved"
+            result["moves"] = path_to_moves(solution)
+            result["length"] = len(solution) - 1
+    # the stats of whatever search ran, seconds stays the instance's whole wall time
+    if result["status"] in ("solved", "timeout"):
+        result.update(stats.as_dict())
+    result["seconds"] = round(time.monotonic() - start, 6)
+    return result
+
+
+def solve_batch(states, workers: int = None, heuristic: callable = None, timeout: float = None, solver=AStar,
+                cache: SolutionCache = None):
+    """Solve an iterable of puzzle states in parallel, yielding results as they finish.
+
+    Parameters
+    ----------
+    states : iterable of list[list[int]]
+        The puzzles to solve. May be a stream, at most a few instances per worker
+        are read ahead of the results.
+
+    workers : int, optional
+        Number of worker processes. The default is os.cpu_count(). With 1 worker
+        the instances are solved in this process, in order.
+
+    heuristic : callable or str, optional
+        Heuristic passed to the solver, it must be picklable (module level functions
+        and objects like astar.heuristic or patterndb.PatternDatabase are). A name
+        from astar.HEURISTICS is made for each instance's board size. The default
+        is Manhattan distance for each instance's board size.
+
+    timeout : float, optional
+        Seconds each instance may search for before it is reported as a timeout.
+
+    solver : callable, optional
+        AStar, IDAStar, MM or batched.BatchAStar. The default is AStar.
+
+    cache : SolutionCache, optional
+        Shared solution cache, AStar only. Each worker opens its own connection to
+        the file once and closes it when the pool shuts down.
+
+    Yields
+    ------
+    dict
+        {"index", "status", "seconds"} plus "moves" and "length" for solved instances
+        and "error" for unsolvable, invalid and failed ones. status is "solved",
+        "timeout", "unsolvable", "invalid" or "error", the last for any other exception
+        raised while solving; index is the position in states. Solved and timed
+        out instances also carry the stats.SearchStats.as_dict() counters of their
+        search ("expanded", "generated", "peak_open", ...), whose "seconds" is replaced
+        by the instance's wall time.
+    """
+    workers = workers or os.cpu_count() or 1
+    instances = enumerate(states)
+
+    if workers == 1:
+        for index, state in instances:
+            yield solve_one(index, state, solver, heuristic, timeout, cache)
+        return
+
+    # the cache is not sent with every instance, each worker opens it once
+    if cache is None:
+        task, initializer, initargs = solve_one, None, ()
+    else:
+        task, initializer, initargs = _solve_cached, _open_cache, (cache.path, cache.max_entries)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs) as pool:
+        pending = set()
+
+        # keeps the pool busy without reading the whole input up front
+        def refill():
+            for index, state in islice(instances, workers * QUEUED_PER_WORKER - len(pending)):
+                pending.add(pool.submit(task, index, state, solver, heuristic, timeout))
+
+        refill()
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            refill()
+            for future in done:
+                yield future.result()
+
+
+# reads one puzzle per non-empty line, returns (id or None, state); the state of a line
+# that is not JSON or lacks a state is an InvalidPuzzleError, which solve_one reports
+def read_instances(lines):
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as error:
+            yield None, InvalidPuzzleError("malformed JSON: %s" % error)
+            continue
+        instance_id = None
+        if isinstance(record, dict):
+            instance_id = record.get("id")
+            if "state" not in record:
+                yield instance_id, InvalidPuzzleError("an instance object needs a \"state\"")
+                continue
+            record = record["state"]
+        if isinstance(record, list) and record and not isinstance(record[0], list):
+            side = math.isqrt(len(record))
+            record = [record[row * side:(row + 1) * side] for row in range(side)]
+        yield instance_id, record
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Solve sliding puzzles in parallel, JSONL in and out.")
+    parser.add_argument("input", nargs="?", default="-", help="JSONL file of puzzles, - for stdin")
+    parser.add_argument("-o", "--output", default="-", help="JSONL file for the results, - for stdout")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("-t", "--timeout", type=float, default=None, help="seconds per instance")
+    parser.add_argument("--solver", choices=sorted(SOLVERS), default="astar")
+    parser.add_argument("--heuristic", default="manhattan",
+                        help="pdb:PATH or from: %s (default: manhattan)" % ", ".join(HEURISTICS))
+    parser.add_argument("--pdb", default=None, help="pattern database file, same as --heuristic pdb:PATH")
+    parser.add_argument("--cache", default=None, help="SQLite solution cache file (astar only)")
+    args = parser.parse_args(argv)
+    if args.cache and args.solver != "astar":
+        parser.error("--cache is only supported with --solver astar")
+
+    # a pattern database is opened once, named heuristics are made for each instance's board size
+    heuristic = args.heuristic
+    if args.pdb:
+        heuristic = PatternDatabase(args.pdb)
+    elif heuristic.startswith("pdb:"):
+        heuristic = PatternDatabase(heuristic[4:])
+    elif heuristic not in HEURISTICS:
+        parser.error("unknown heuristic %r" % heuristic)
+
+    # solvers that need more of the heuristic than its value, checked on its 15 puzzle form
+    # rather than failing on every instance
+    if args.solver in ("mm", "batched"):
+        instance = get_heuristic(heuristic) if isinstance(heuristic, str) else heuristic
+        if args.solver == "mm" and not hasattr(instance, "toward"):
+            parser.error("--solver mm needs a heuristic with a toward() method, like manhattan")
+        if args.solver == "batched":
+            try:
+                batch_heuristic(instance, getattr(instance, "geometry", FIFTEEN))
+            except ValueError as error:
+                parser.error("--solver batched: %s" % error)
+
+    source = sys.stdin if args.input == "-" else open(args.input)
+    sink = sys.stdout if args.output == "-" else open(args.output, "w")
+
+    cache = SolutionCache(args.cache) if args.cache else None
+    ids = []
+
+    # remembers the ids as the pool reads the instances
+    def states():
+        for instance_id, state in read_instances(source):
+            ids.append(instance_id)
+            yield state
+
+    try:
+        for result in solve_batch(
+            states(),
+            workers=args.workers,
+            heuristic=heuristic,
+            timeout=args.timeout,
+            solver=SOLVERS[args.solver],
+            cache=cache,
+        ):
+            if ids[result["index"]] is not None:
+                result["id"] = ids[result["index"]]
+            sink.write(json.dumps(result) + "\n")
+            sink.flush()
+    finally:
+        if cache is not None:
+            cache.close()
+        if source is not sys.stdin:
+            source.close()
+        if sink is not sys.stdout:
+            sink.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,422 @@
+# batched best-first search and pattern database construction with numpy
+#
+# path = BatchAStar(root, heuristic, block_size=4096)
+#
+# AStar pays interpreter overhead for every node; here the open list holds numpy arrays
+# of packed boards and a whole block of nodes with the same f and g is expanded at once.
+# children and their heuristic values come from vectorised table lookups and duplicates
+# are removed with a vectorised open addressing hash table. boards are held as uint64,
+# so only board sizes with cells * bits <= 64 are supported (up to the 15 puzzle).
+#
+# build_pattern_table_batched is the same retrograde 0-1 search as
+# patterndb.build_pattern_table, run one distance layer at a time over arrays of states;
+# build_pattern_database uses it whenever numpy is installed
+import time
+
+import numpy as np
+
+from astar import SearchTimeout, get_heuristic
+from patterndb import UNSEEN, PatternDatabase, rank, table_size
+from stats import SearchStats
+from tiles import FIFTEEN, Geometry, Path, TilesNode
+
+# nodes expanded together, large enough to amortise the per block overhead
+BLOCK_SIZE = 4096
+
+# states processed together while building a pattern table, bounds temporary memory
+PATTERN_CHUNK = 1 << 18
+
+# initial number of hash table slots, doubled whenever it is half full
+TABLE_CAPACITY = 1 << 16
+
+# marks an empty hash table slot and the root's missing parent, never a valid board
+EMPTY = np.uint64(0xFFFFFFFFFFFFFFFF)
+
+# Fibonacci hashing multiplier, spreads packed boards over the table
+HASH_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+
+# neighbours[cell] as a (cells, 4) array, -1 where the empty space cannot move
+def neighbour_table(geometry: Geometry) -> np.ndarray:
+    table = np.full((geometry.cells, 4), -1, dtype=np.int64)
+    for cell, neighbours in enumerate(geometry.neighbours):
+        table[cell, :len(neighbours)] = neighbours
+    return table
+
+
+# tiles of each packed board in cell order, an (n, cells) array
+def unpack_boards(boards: np.ndarray, geometry: Geometry) -> np.ndarray:
+    shifts = np.arange(geometry.cells, dtype=np.uint64) * np.uint64(geometry.bits)
+    return ((boards[:, None] >> shifts) & np.uint64(geometry.mask)).astype(np.int64)
+
+
+# patterndb.rank of each row of cells, an (n, k) array
+def rank_batch(cells: np.ndarray, n: int) -> np.ndarray:
+    index = np.zeros(len(cells), dtype=np.int64)
+    for i in range(cells.shape[1]):
+        smaller = (cells[:, :i] < cells[:, i:i + 1]).sum(axis=1)
+        index = index * (n - i) + cells[:, i] - smaller
+    return index
+
+
+# patterndb.unrank of each index, an (n, k) array of cells
+def unrank_batch(index: np.ndarray, k: int, n: int) -> np.ndarray:
+    digits = np.empty((len(index), k), dtype=np.int64)
+    for i in range(k - 1, -1, -1):
+        index, digits[:, i] = np.divmod(index, n - i)
+
+    # each digit counts the free cells before its cell, so it is raised past every cell
+    # taken by an earlier tile, in increasing order
+    cells = np.empty_like(digits)
+    for i in range(k):
+        cell = digits[:, i].copy()
+        for taken in np.sort(cells[:, :i], axis=1).T:
+            cell += taken <= cell
+        cells[:, i] = cell
+    return cells
+
+
+# vectorised form of a per tile, per cell table heuristic like ManhattanDistance
+class _TableHeuristic:
+
+    def __init__(self, table, geometry: Geometry):
+        self.table = np.array(table, dtype=np.int64)
+        self.geometry = geometry
+        self.cells = np.arange(geometry.cells)
+
+    def __call__(self, boards: np.ndarray) -> np.ndarray:
+        return self.table[unpack_boards(boards, self.geometry), self.cells].sum(axis=1)
+
+    # values of the children reached by sliding tiles from cells src to cells dst
+    def update(self, h: np.ndarray, tiles: np.ndarray, src: np.ndarray, dst: np.ndarray) -> np.ndarray:
+        return h - self.table[tiles, src] + self.table[tiles, dst]
+
+
+# vectorised form of a PatternDatabase, its tables are read from the same mapping
+class _PatternDatabaseHeuristic:
+
+    def __init__(self, database: PatternDatabase):
+        self.geometry = database.geometry
+        self.patterns = [list(pattern) for pattern in database.partition]
+        self.tables = [np.frombuffer(table, dtype=np.uint8) for table in database.tables]
+
+    def __call__(self, boards: np.ndarray) -> np.ndarray:
+        # boards are permutations, so sorting a board's cells by tile gives each tile's cell
+        positions = np.argsort(unpack_boards(boards, self.geometry), axis=1)
+        n = self.geometry.cells
+        total = np.zeros(len(boards), dtype=np.int64)
+        for pattern, table in zip(self.patterns, self.tables):
+            total += table[rank_batch(positions[:, pattern], n)]
+        return total
+
+
+# the vectorised form of heuristic, which is a ManhattanDistance (or any heuristic with a
+# per tile, per cell .table) or a PatternDatabase
+def batch_heuristic(heuristic, geometry: Geometry = FIFTEEN):
+    if isinstance(heuristic, PatternDatabase):
+        if heuristic.geometry is not geometry:
+            raise ValueError("%s was built for %r, root is %r" % (heuristic.path, heuristic.geometry, geometry))
+        return _PatternDatabaseHeuristic(heuristic)
+    table = getattr(heuristic, "table", None)
+    if table is None:
+        raise ValueError("no vectorised form of heuristic %r" % heuristic)
+    if getattr(heuristic, "geometry", geometry) is not geometry:
+        raise ValueError("heuristic is for %r, root is %r" % (heuristic.geometry, geometry))
+    return _TableHeuristic(table, geometry)
+
+
+class StateTable:
+    """Open addressing hash table of packed boards with their best g and parent board.
+
+    Every method works on whole arrays of boards; probing runs one vectorised step
+    for all pending boards at a time.
+
+    Parameters
+    ----------
+    capacity : int, optional
+        Initial number of slots, a power of two. The default is TABLE_CAPACITY.
+    """
+
+    def __init__(self, capacity: int = TABLE_CAPACITY):
+        self.count = 0
+        self._allocate(capacity)
+
+    def _allocate(self, size: int):
+        self.keys = np.full(size, EMPTY, dtype=np.uint64)
+        self.g = np.zeros(size, dtype=np.int64)
+        self.parents = np.full(size, EMPTY, dtype=np.uint64)
+        self._shift = np.uint64(64 - (size.bit_length() - 1))
+        self._slot_mask = size - 1
+
+    def _slots(self, keys: np.ndarray) -> np.ndarray:
+        return ((keys * HASH_MULTIPLIER) >> self._shift).astype(np.int64)
+
+    # slots holding keys, -1 for keys not in the table
+    def find(self, keys: np.ndarray) -> np.ndarray:
+        slots = self._slots(keys)
+        found = np.full(len(keys), -1, dtype=np.int64)
+        pending = np.arange(len(keys))
+        while pending.size:
+            probe = slots[pending]
+            stored = self.keys[probe]
+            hit = stored == keys[pending]
+            found[pending[hit]] = probe[hit]
+            collided = ~hit & (stored != EMPTY)
+            pending = pending[collided]
+            slots[pending] = (probe[collided] + 1) & self._slot_mask
+        return found
+
+    # adds distinct keys, or lowers the g (and replaces the parent) of keys already
+    # present with a larger g; returns a bool array of the keys added or improved
+    def insert(self, keys: np.ndarray, g: np.ndarray, parents: np.ndarray) -> np.ndarray:
+        if 2 * (self.count + len(keys)) > len(self.keys):
+            self._grow(self.count + len(keys))
+
+        slots = self._slots(keys)
+        improved = np.zeros(len(keys), dtype=bool)
+        pending = np.arange(len(keys))
+        while pending.size:
+            probe = slots[pending]
+            stored = self.keys[probe]
+
+            hit = stored == keys[pending]
+            better = hit.copy()
+            better[hit] = g[pending[hit]] < self.g[probe[hit]]
+            self.g[probe[better]] = g[pending[better]]
+            self.parents[probe[better]] = parents[pending[better]]
+            improved[pending[better]] = True
+
+            # several keys may probe the same empty slot, the first of them claims it and
+            # the others find it taken on their next probe
+            empty = np.flatnonzero(stored == EMPTY)
+            claimed_slots, first = np.unique(probe[empty], return_index=True)
+            claimed = pending[empty[first]]
+            self.keys[claimed_slots] = keys[claimed]
+            self.g[claimed_slots] = g[claimed]
+            self.parents[claimed_slots] = parents[claimed]
+            improved[claimed] = True
+            self.count += len(claimed)
+
+            unresolved = ~hit
+            unresolved[empty[first]] = False
+            collided = unresolved & (stored != EMPTY)
+            slots[pending[collided]] = (probe[collided] + 1) & self._slot_mask
+            pending = pending[unresolved]
+        return improved
+
+    def _grow(self, needed: int):
+        occupied = self.keys != EMPTY
+        keys, g, parents = self.keys[occupied], self.g[occupied], self.parents[occupied]
+        size = len(self.keys)
+        while 2 * needed > size:
+            size *= 2
+        self.count = 0
+        self._allocate(size)
+        self.insert(keys, g, parents)
+
+    def __len__(self) -> int:
+        return self.count
+
+
+# the moves of the empty space from every board of a block, with the tile each one slides
+# returns (children, their blanks, moved tiles, parent blanks, parent indexes)
+def expand_boards(boards: np.ndarray, blanks: np.ndarray, neighbours: np.ndarray, geometry: Geometry):
+    shifts = np.arange(geometry.cells, dtype=np.uint64) * np.uint64(geometry.bits)
+    mask = np.uint64(geometry.mask)
+    parts = []
+    for direction in range(neighbours.shape[1]):
+        cells = neighbours[blanks, direction]
+        valid = np.flatnonzero(cells >= 0)
+        cells = cells[valid]
+        parent_blanks = blanks[valid]
+        parent_boards = boards[valid]
+        tiles = (parent_boards >> shifts[cells]) & mask
+        # the empty space holds 0, so xor moves the tile from cells to parent_blanks
+        children = parent_boards ^ (tiles << shifts[cells]) ^ (tiles << shifts[parent_blanks])
+        parts.append((children, cells, tiles.astype(np.int64), parent_blanks, valid))
+    return tuple(np.concatenate(column) for column in zip(*parts))
+
+
+# the path from root to the goal board, following the parents stored in table
+def _path(root: TilesNode, table: StateTable, goal: int) -> Path:
+    boards = [goal]
+    while boards[-1] != root.board:
+        slot = table.find(np.array([boards[-1]], dtype=np.uint64))[0]
+        boards.append(int(table.parents[slot]))
+
+    geometry = root.geometry
+    bits, mask = geometry.bits, geometry.mask
+    blanks = [next(cell for cell in range(geometry.cells) if not (board >> (bits * cell)) & mask)
+              for board in reversed(boards)]
+    return Path(root, "".join(geometry.moves[after - before] for before, after in zip(blanks, blanks[1:])))
+
+
+# batched A* search, same result as AStar for the path from root on
+# heuristic is a ManhattanDistance or a PatternDatabase (see batch_heuristic), or the name
+# of one of them; the other table heuristics have no vectorised form
+# block_size is the most nodes expanded at once, all of them with the same f and g;
+# deeper nodes of the lowest f are expanded first, like the default BucketOpenList
+# deadline and stats are as for AStar; stats gets the expanded, generated and duplicate
+# counts, expansions per f, the number of stored states as peak_closed and the wall time
+def BatchAStar(root, heuristic, block_size: int = BLOCK_SIZE, deadline: float = None,
+               stats: SearchStats = None) -> Path or None:
+
+    root.validate()
+    started = time.perf_counter()
+    geometry = root.geometry
+    if geometry.cells * geometry.bits > 64:
+        raise ValueError("batched search needs boards of at most 64 bits, %r has %d"
+                         % (geometry, geometry.cells * geometry.bits))
+
+    if isinstance(heuristic, str):
+        heuristic = get_heuristic(heuristic, geometry)
+    score = batch_heuristic(heuristic, geometry)
+    update = getattr(score, "update", None)
+    neighbours = neighbour_table(geometry)
+
+    table = StateTable()
+    boards = np.array([root.board], dtype=np.uint64)
+    table.insert(boards, np.zeros(1, dtype=np.int64), np.array([EMPTY], dtype=np.uint64))
+
+    # open list: f -> g -> chunks of (boards, blanks, h); stale boards are dropped when
+    # popped, their g no longer matches the table
+    unexplored = {}
+    open_count = 0
+
+    def push(f, g, chunk):
+        nonlocal open_count
+        unexplored.setdefault(f, {}).setdefault(g, []).append(chunk)
+        open_count += len(chunk[0])
+
+    h = score(boards)
+    push(int(h[0]), 0, (boards, np.array([root.blank], dtype=np.int64), h))
+    goal = np.uint64(geometry.goal_board)
+
+    while unexplored:
+        if deadline is not None and time.monotonic() > deadline:
+            raise SearchTimeout("no solution found before the deadline")
+
+        # a block from the deepest g of the lowest f
+        f = min(unexplored)
+        layer = unexplored[f]
+        g = max(layer)
+        chunks = layer[g]
+        taken = []
+        size = 0
+        while chunks and size < block_size:
+            chunk = chunks.pop()
+            if size + len(chunk[0]) > block_size:
+                keep = block_size - size
+                chunks.append(tuple(column[keep:] for column in chunk))
+                chunk = tuple(column[:keep] for column in chunk)
+            taken.append(chunk)
+            size += len(chunk[0])
+        if not chunks:
+            del layer[g]
+            if not layer:
+                del unexplored[f]
+        open_count -= size
+        boards, blanks, h = (np.concatenate(column) for column in zip(*taken))
+
+        live = table.g[table.find(boards)] == g
+        boards, blanks, h = boards[live], blanks[live], h[live]
+        if not len(boards):
+            continue
+
+        if stats is not None:
+            stats.expanded += len(boards)
+            stats.layers[f] += len(boards)
+
+        # every node of the block has the lowest f, so a goal among them is optimal
+        if (boards == goal).any():
+            if stats is not None:
+                stats.seconds = time.perf_counter() - started
+            return _path(root, table, geometry.goal_board)
+
+        children, child_blanks, tiles, parent_blanks, parents = expand_boards(boards, blanks, neighbours, geometry)
+        if update is not None:
+            child_h = update(h[parents], tiles, child_blanks, parent_blanks)
+        else:
+            child_h = score(children)
+
+        # every child has g + 1, so the first copy of a board in the block is as good as any
+        children, first = np.unique(children, return_index=True)
+        improved = table.insert(children, np.full(len(children), g + 1, dtype=np.int64), boards[parents[first]])
+        kept = first[improved]
+        children = children[improved]
+        child_blanks, child_h = child_blanks[kept], child_h[kept]
+
+        child_f = g + 1 + child_h
+        for value in np.unique(child_f):
+            same = child_f == value
+            push(int(value), g + 1, (children[same], child_blanks[same], child_h[same]))
+
+        if stats is not None:
+            stats.generated += len(tiles)
+            stats.duplicates += len(tiles) - len(children)
+            stats.peak_closed = len(table)
+            stats.peak_open = max(stats.peak_open, open_count)
+
+    if stats is not None:
+        stats.seconds = time.perf_counter() - started
+    return None
+
+
+# the abstract successors of pattern states (rank * n + empty cell), as patterndb's search
+# returns the states reached by moving another tile (cost 0) and by moving a pattern tile (cost 1)
+def _pattern_successors(states: np.ndarray, k: int, n: int, neighbours: np.ndarray):
+    index, blank = np.divmod(states, n)
+    cells = unrank_batch(index, k, n)
+    free, paid = [], []
+    for direction in range(neighbours.shape[1]):
+        targets = neighbours[blank, direction]
+        valid = targets >= 0
+        targets, from_cells, from_blank, from_index = targets[valid], cells[valid], blank[valid], index[valid]
+
+        hit = from_cells == targets[:, None]
+        moved = hit.any(axis=1)
+        free.append(from_index[~moved] * n + targets[~moved])
+
+        # a pattern tile slides into the empty space
+        moved_cells = from_cells[moved]
+        moved_cells[hit[moved]] = from_blank[moved]
+        paid.append(rank_batch(moved_cells, n) * n + targets[moved])
+    return np.concatenate(free), np.concatenate(paid)
+
+
+# drop in replacement for patterndb.build_pattern_table, returns the same table
+# level-synchronous: each distance layer is first closed under the free moves of other
+# tiles, then the moves of pattern tiles from the whole layer form the next one
+def build_pattern_table_batched(pattern, geometry: Geometry = FIFTEEN) -> bytearray:
+    n = geometry.cells
+    k = len(pattern)
+    size = table_size(k, n)
+    neighbours = neighbour_table(geometry)
+    distance = np.full(size * n, UNSEEN, dtype=np.uint8)
+
+    start = rank([tile - 1 for tile in pattern], n) * n + (n - 1)
+    distance[start] = 0
+    frontier = np.array([start], dtype=np.int64)
+    d = 0
+
+    # states already reached are dropped before deduplicating, which keeps the sorts small
+    def unseen(states):
+        return np.unique(states[distance[states] == UNSEEN])
+
+    while frontier.size:
+        new = frontier
+        paid = []
+        while new.size:
+            found = []
+            for begin in range(0, new.size, PATTERN_CHUNK):
+                free, cost_one = _pattern_successors(new[begin:begin + PATTERN_CHUNK], k, n, neighbours)
+                paid.append(cost_one[distance[cost_one] == UNSEEN])
+                found.append(unseen(free))
+            new = unseen(np.concatenate(found))
+            distance[new] = d
+
+        frontier = unseen(np.concatenate(paid))
+        distance[frontier] = d + 1
+        d += 1
+
+    return bytearray(distance.reshape(size, n).min(axis=1).tobytes())
@@ -0,0 +1,227 @@
+# reproducible solver benchmarks with regression checks
+#
+# python benchmark.py --sets scramble30 --solvers astar,idastar -o results.json
+# python benchmark.py --sets scramble30 --tolerance 0.3
+# python benchmark.py --sets scramble30 --update-baseline
+# python benchmark.py --sets scramble30 --baseline ""          # no regression check
+#
+# each (solver, heuristic, instance set) configuration runs in a fresh process so its
+# peak RSS is its own. the run fails (exit status 1) when a configuration solves fewer
+# instances, finds a longer solution, or its nodes/second drop by more than the tolerance
+# compared with the baseline, benchmarks/baseline.json unless --baseline names another.
+# configurations missing from the baseline are not checked. the committed baseline
+# covers the scramble sets for astar and idastar with every named heuristic and mm with
+# manhattan; its nodes/second were measured on one machine, re-record them with
+# --update-baseline before comparing speed on another
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from astar import HEURISTICS, MM, AStar, IDAStar, SearchTimeout, get_heuristic
+from stats import SearchStats
+from tiles import FIFTEEN, TilesNode
+
+SOLVERS = {"astar": AStar, "idastar": IDAStar, "mm": MM}
+
+# the batched search needs numpy
+try:
+    from batched import BatchAStar
+except ImportError:
+    pass
+else:
+    SOLVERS["batched"] = BatchAStar
+
+INSTANCES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks", "instances.json")
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks", "baseline.json")
+
+# baseline configurations that searched for less than this many seconds in total are too
+# noisy to compare nodes/second with, only their solutions are checked
+MIN_TIMED_SECONDS = 0.2
+
+
+# how benchmarks/instances.json was generated, kept so the sets can be audited
+# scrambleN: 20 non-backtracking random walks of N moves from the goal
+# random100: 100 uniformly random solvable boards (mostly 45 to 60 moves from the goal,
+# only practical with a pattern database heuristic and a timeout)
+def generate_instances() -> dict:
+    instances = {}
+    for depth in (10, 30, 50):
+        rng = random.Random(depth)
+        boards = []
+        for _ in range(20):
+            node, previous = TilesNode(state=FIFTEEN.goal_state), None
+            for _ in range(depth):
+                child = rng.choice([c for c in node.get_children() if c != previous])
+                node, previous = child, node
+            boards.append([tile for row in node.state for tile in row])
+        instances["scramble%d" % depth] = boards
+
+    rng = random.Random(170)
+    boards = []
+    while len(boards) < 100:
+        tiles = list(range(FIFTEEN.cells))
+        rng.shuffle(tiles)
+        if FIFTEEN.is_solvable(FIFTEEN.pack([tiles])):
+            boards.append(tiles)
+    instances["random100"] = boards
+    return instances
+
+
+def load_instances(path: str = INSTANCES_PATH) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+# runs one configuration over a list of flat boards, returns its measurements
+def run_config(solver_name: str, heuristic_name: str, set_name: str, boards, timeout: float = None) -> dict:
+    solver = SOLVERS[solver_name]
+    h = get_heuristic(heuristic_name)
+    lengths = []
+    expanded = 0
+    search_seconds = 0.0
+    started = time.perf_counter()
+    for board in boards:
+        root = TilesNode.from_board(FIFTEEN.pack([board]), board.index(0))
+        stats = SearchStats()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        try:
+            solution = solver(root, h, deadline=deadline, stats=stats)
+        except SearchTimeout:
+            solution = None
+        lengths.append(None if solution is None else len(solution) - 1)
+        expanded += stats.expanded
+        search_seconds += stats.seconds
+    wall = time.perf_counter() - started
+
+    return {
+        "solver": solver_name,
+        "heuristic": heuristic_name,
+        "set": set_name,
+        "instances": len(boards),
+        "solved": sum(length is not None for length in lengths),
+        "wall_seconds": wall,
+        "expanded": expanded,
+        "nodes_per_second": expanded / search_seconds if search_seconds > 0 else 0.0,
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // (1024 if sys.platform == "darwin" else 1),
+        "lengths": lengths,
+    }
+
+
+# runs every configuration, each in its own fresh process
+def run_benchmarks(solvers, heuristics, sets, instances: dict, timeout: float = None, isolate: bool = True) -> list[dict]:
+    results = []
+    for set_name in sets:
+        for solver_name in solvers:
+            for heuristic_name in heuristics:
+                args = (solver_name, heuristic_name, set_name, instances[set_name], timeout)
+                if not isolate:
+                    results.append(run_config(*args))
+                    continue
+                with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+                    results.append(pool.submit(run_config, *args).result())
+    return results
+
+
+def config_key(result: dict) -> tuple:
+    return result["solver"], result["heuristic"], result["set"]
+
+
+# compares results with a baseline, returns a list of human readable failures
+def compare_results(results: list[dict], baseline: list[dict], tolerance: float = 0.2) -> list[str]:
+    failures = []
+    previous = {config_key(result): result for result in baseline}
+    for result in results:
+        key = config_key(result)
+        name = "/".join(key)
+        if key not in previous:
+            continue
+        before = previous[key]
+
+        if result["solved"] < before["solved"]:
+            failures.append("%s: solved %d instances, baseline %d" % (name, result["solved"], before["solved"]))
+        for i, (length, baseline_length) in enumerate(zip(result["lengths"], before["lengths"])):
+            if length is not None and baseline_length is not None and length > baseline_length:
+                failures.append("%s: instance %d solution length %d, baseline %d" % (name, i, length, baseline_length))
+
+        timed = before["nodes_per_second"] > 0 and before["expanded"] / before["nodes_per_second"] >= MIN_TIMED_SECONDS
+        if timed and result["nodes_per_second"] < before["nodes_per_second"] * (1 - tolerance):
+            failures.append("%s: %.0f nodes/s, baseline %.0f (-%.0f%%)" % (
+                name, result["nodes_per_second"], before["nodes_per_second"],
+                100 * (1 - result["nodes_per_second"] / before["nodes_per_second"])))
+    return failures
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the puzzle solvers on fixed instance sets.")
+    parser.add_argument("--sets", default="scramble10,scramble30", help="comma separated instance sets")
+    parser.add_argument("--solvers", default="astar", help="comma separated, from: " + ", ".join(sorted(SOLVERS)))
+    parser.add_argument("--heuristics", default="manhattan", help="comma separated, pdb:PATH or from: " + ", ".join(HEURISTICS))
+    parser.add_argument("--timeout", type=float, default=None, help="seconds per instance")
+    parser.add_argument("--instances", default=INSTANCES_PATH, help="instance sets JSON file")
+    parser.add_argument("-o", "--output", default=None, help="write the results JSON here")
+    parser.add_argument("--baseline", default=BASELINE_PATH,
+                        help="baseline results JSON to compare with (default: benchmarks/baseline.json, \"\" for none)")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed nodes/second drop (default 0.2)")
+    parser.add_argument("--update-baseline", action="store_true",
+                        help="store the results in --baseline, replacing those of the same configurations")
+    parser.add_argument("--generate-instances", action="store_true", help="regenerate --instances and exit")
+    args = parser.parse_args(argv)
+
+    if args.generate_instances:
+        os.makedirs(os.path.dirname(args.instances), exist_ok=True)
+        # one board per line, so changes to the sets show up in diffs
+        sets = generate_instances()
+        with open(args.instances, "w") as f:
+            f.write("{\n" + ",\n".join(
+                '"%s": [\n' % name + ",\n".join(json.dumps(board) for board in boards) + "\n]"
+                for name, boards in sets.items()
+            ) + "\n}\n")
+        return 0
+
+    results = run_benchmarks(
+        args.solvers.split(","), args.heuristics.split(","), args.sets.split(","),
+        load_instances(args.instances), args.timeout,
+    )
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+    for result in results:
+        print("%-8s %-16s %-11s solved %3d/%-3d %8.2fs %10d expanded %9.0f nodes/s %7d kB" % (
+            result["solver"], result["heuristic"], result["set"], result["solved"], result["instances"],
+            result["wall_seconds"], result["expanded"], result["nodes_per_second"], result["peak_rss_kb"]))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=1)
+
+    if args.baseline and args.update_baseline:
+        # configurations that were not run keep their baseline
+        if os.path.exists(args.baseline):
+            run = {config_key(result) for result in results}
+            with open(args.baseline) as f:
+                kept = [result for result in json.load(f)["results"] if config_key(result) not in run]
+            report["results"] = kept + results
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=1)
+    elif args.baseline:
+        with open(args.baseline) as f:
+            failures = compare_results(results, json.load(f)["results"], args.tolerance)
+        for failure in failures:
+            print("REGRESSION " + failure)
+        return 1 if failures else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
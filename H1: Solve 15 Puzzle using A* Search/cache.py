@@ -0,0 +1,202 @@
+# persistent cache of optimal solutions, keyed by packed board
+#
+# every state on an optimal solution has a known optimal suffix, so recording a solution
+# stores each state on it with its distance to the goal and the next move of the empty
+# space. AStar(..., cache=cache) answers cached boards straight away and uses cached
+# distances as exact heuristic values while it searches, looking up the children of each
+# expansion together with distances(), behind a bounded in-memory LRU of recent lookups
+import sqlite3
+from collections import OrderedDict
+from typing import Optional
+
+from tiles import Geometry, Path, TilesNode, path_to_moves
+
+# default bound on the number of cached states
+MAX_ENTRIES = 1_000_000
+
+# share of max_entries that may be recorded between two counts of the entries, and that
+# eviction frees below max_entries, so the table is not scanned on every record
+EVICTION_SLACK = 1 / 16
+
+# boards whose distance, or absence, distances() remembers in memory
+LOOKUP_ENTRIES = 1 << 16
+
+# keys per SELECT, below SQLite's limit on bound parameters
+LOOKUP_BATCH = 500
+
+
+class SolutionCache:
+    """SQLite backed cache of optimal distances and next moves, with LRU eviction.
+
+    Several processes can share one file. Instances pickle by path and reconnect
+    after unpickling.
+
+    Parameters
+    ----------
+    path : str
+        The SQLite database file, created if missing.
+
+    max_entries : int, optional
+        Cached states kept; the least recently used ones are evicted beyond it.
+        The default is MAX_ENTRIES. The entries are counted again only every
+        max_entries * EVICTION_SLACK recorded states, so other processes sharing the
+        file can push it past the bound by about that much until the next count.
+    """
+
+    def __init__(self, path: str, max_entries: int = MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._db = sqlite3.connect(path, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS solutions ("
+            "key BLOB PRIMARY KEY, distance INTEGER NOT NULL, move TEXT NOT NULL, last_used INTEGER NOT NULL"
+            ") WITHOUT ROWID"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS solutions_last_used ON solutions (last_used)")
+        self._db.commit()
+        # logical clock for LRU, continues from the newest entry in the file
+        self._clock = self._db.execute("SELECT COALESCE(MAX(last_used), 0) FROM solutions").fetchone()[0]
+        # entries at the last count, and states recorded since, an upper bound on the new entries
+        self._slack = int(max_entries * EVICTION_SLACK)
+        self._counted = len(self)
+        self._recorded = 0
+        # most recent distances() results, {key: distance or None}, least recent first
+        self._lookups = OrderedDict()
+
+    # board size followed by the packed board, so boards of different sizes never collide
+    @staticmethod
+    def key(node: TilesNode) -> bytes:
+        return SolutionCache._key(node.geometry, node.board)
+
+    @staticmethod
+    def _key(geometry: Geometry, board: int) -> bytes:
+        size = (geometry.cells * geometry.bits + 7) // 8
+        return bytes((geometry.rows, geometry.cols)) + board.to_bytes(size, "little")
+
+    def _tick(self) -> int:
+        self._clock += 1
+        return self._clock
+
+    # cached (distance, next move) of node, None when it is not cached
+    def get(self, node: TilesNode) -> Optional[tuple[int, str]]:
+        key = self.key(node)
+        row = self._db.execute("SELECT distance, move FROM solutions WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            self._db.execute("UPDATE solutions SET last_used = ? WHERE key = ?", (self._tick(), key))
+        return row
+
+    # cached optimal distance of node to the goal, None when it is not cached
+    def distance(self, node: TilesNode) -> Optional[int]:
+        row = self._db.execute("SELECT distance FROM solutions WHERE key = ?", (self.key(node),)).fetchone()
+        return None if row is None else row[0]
+
+    # cached optimal distances of packed boards of geometry, as {packed board: distance}
+    # for those that are cached. recent answers, misses included, come from memory, the
+    # rest from one SELECT per LOOKUP_BATCH boards. an entry evicted by another process
+    # since may still be reported; solution() then returns None for it
+    def distances(self, geometry: Geometry, boards) -> dict[int, int]:
+        found, missing = {}, {}
+        lookups = self._lookups
+        for board in boards:
+            key = self._key(geometry, board)
+            if key in lookups:
+                lookups.move_to_end(key)
+                distance = lookups[key]
+                if distance is not None:
+                    found[board] = distance
+            else:
+                missing[key] = board
+        keys = list(missing)
+        for start in range(0, len(keys), LOOKUP_BATCH):
+            batch = keys[start:start + LOOKUP_BATCH]
+            rows = self._db.execute(
+                "SELECT key, distance FROM solutions WHERE key IN (%s)" % ",".join("?" * len(batch)), batch
+            ).fetchall()
+            hits = dict(rows)
+            for key in batch:
+                distance = hits.get(key)
+                self._remember(key, distance)
+                if distance is not None:
+                    found[missing[key]] = distance
+        return found
+
+    # keeps a distances() answer in memory, forgetting the least recent beyond LOOKUP_ENTRIES
+    def _remember(self, key: bytes, distance: Optional[int]) -> None:
+        self._lookups[key] = distance
+        self._lookups.move_to_end(key)
+        if len(self._lookups) > LOOKUP_ENTRIES:
+            self._lookups.popitem(last=False)
+
+    # optimal path from node to the goal, a tiles.Path starting with node itself,
+    # or None if node (or a state along its cached suffix) is not cached
+    def solution(self, node: TilesNode) -> Optional[Path]:
+        moves = []
+        current = node
+        while True:
+            entry = self.get(current)
+            if entry is None:
+                self._db.commit()
+                return None
+            distance, move = entry
+            if distance == 0:
+                self._db.commit()
+                return Path(node, "".join(moves))
+            moves.append(move)
+            current = current.apply_move(move)
+
+    # stores every state of an optimal path to the goal with its distance and next move
+    def record(self, path) -> None:
+        nodes = list(path)
+        if not nodes:
+            return
+        moves = path_to_moves(nodes)
+        last = len(nodes) - 1
+        rows = [
+            (self.key(node), last - i, moves[i] if i < last else "", self._tick())
+            for i, node in enumerate(nodes)
+        ]
+        self._db.executemany(
+            "INSERT INTO solutions (key, distance, move, last_used) VALUES (?, ?, ?, ?) "
+            # optimal distances never change, a state already cached only becomes more recent
+            "ON CONFLICT (key) DO UPDATE SET last_used = excluded.last_used",
+            rows,
+        )
+        for key, distance, _, _ in rows:
+            if key in self._lookups:
+                self._lookups[key] = distance
+        self._recorded += len(rows)
+        self._evict()
+        self._db.commit()
+
+    # once the entries may exceed max_entries, or enough states were recorded since they
+    # were last counted, counts them and drops the least recently used down to
+    # max_entries minus the slack
+    def _evict(self) -> None:
+        if self._recorded < max(self._slack, 1) and self._counted + self._recorded <= self.max_entries:
+            return
+        entries = len(self)
+        if entries > self.max_entries:
+            excess = entries - self.max_entries + self._slack
+            self._db.execute(
+                "DELETE FROM solutions WHERE key IN (SELECT key FROM solutions ORDER BY last_used LIMIT ?)",
+                (excess,),
+            )
+            entries -= excess
+            self._lookups.clear()
+        self._counted = entries
+        self._recorded = 0
+
+    def __len__(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM solutions").fetchone()[0]
+
+    def close(self) -> None:
+        self._db.commit()
+        self._db.close()
+
+    # the connection is per process, only the settings are pickled
+    def __getstate__(self):
+        return {"path": self.path, "max_entries": self.max_entries}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"], state["max_entries"])
@@ -0,0 +1,198 @@
+# admissible, consistent heuristics stronger than Manhattan distance, built on lookup tables
+#
+# LinearConflict adds to Manhattan distance two moves for every tile that has to leave its
+# goal row (or column) to let another tile of that line past. WalkingDistance solves the
+# row and column relaxations of the puzzle exactly: only which goal row (column) each tile
+# belongs to counts, and the empty space swaps with any tile of a neighbouring row (column).
+#
+# scanning the board once reduces every line, and both relaxations, to ints that index the
+# precomputed tables, so an evaluation is one pass over the cells plus a few lookups. the
+# tables are built once per board size and process, and are not pickled with the heuristics
+from collections import deque
+from functools import lru_cache
+
+from tiles import FIFTEEN, Geometry, TilesNode
+
+
+# length of the longest strictly increasing subsequence of values
+def _longest_increasing(values) -> int:
+    ends = []
+    for value in values:
+        i = 0
+        while i < len(ends) and ends[i] < value:
+            i += 1
+        if i == len(ends):
+            ends.append(value)
+        else:
+            ends[i] = value
+    return len(ends)
+
+
+# conflict penalty of every line of width cells, each cell holding 0 for a tile that belongs
+# to another line, or 1 + its goal position within the line; a line is encoded with one
+# base width + 1 digit per cell, first cell lowest
+# the tiles outside the longest run already in order have to step out of the line, 2 moves each
+@lru_cache(maxsize=None)
+def conflict_table(width: int) -> bytes:
+    base = width + 1
+    table = bytearray(base ** width)
+    for code in range(len(table)):
+        rest, digits = code, []
+        for _ in range(width):
+            rest, digit = divmod(rest, base)
+            if digit:
+                digits.append(digit)
+        table[code] = 2 * (len(digits) - _longest_increasing(digits))
+    return bytes(table)
+
+
+# exact distance to the goal of every state of one relaxation of the puzzle, by breadth
+# first search back from the goal
+# the board is cut into lines (rows or columns) of width cells; a state counts, for each
+# line, the tiles in it that belong to each line, and records the empty space's line.
+# a move slides any tile of a neighbouring line into the empty space's line
+# states are keyed by the int sum(count * base ** (line * lines + goal line)) + blank line * base ** lines ** 2
+@lru_cache(maxsize=None)
+def walking_distance_table(lines: int, width: int) -> dict:
+    base = width + 1
+    blank_weight = base ** (lines * lines)
+    goal = [0] * (lines * lines)
+    for line in range(lines):
+        goal[line * lines + line] = width
+    goal[-1] -= 1
+
+    def key(counts, blank):
+        return sum(count * base ** i for i, count in enumerate(counts)) + blank * blank_weight
+
+    distances = {key(goal, lines - 1): 0}
+    queue = deque([(goal, lines - 1, 0)])
+    while queue:
+        counts, blank, distance = queue.popleft()
+        for line in (blank - 1, blank + 1):
+            if not 0 <= line < lines:
+                continue
+            for goal_line in range(lines):
+                if not counts[line * lines + goal_line]:
+                    continue
+                child = counts[:]
+                child[line * lines + goal_line] -= 1
+                child[blank * lines + goal_line] += 1
+                child_key = key(child, line)
+                if child_key not in distances:
+                    distances[child_key] = distance + 1
+                    queue.append((child, line, distance + 1))
+    return distances
+
+
+class LinearConflict:
+    """Manhattan distance plus 2 moves for each tile that must leave its goal line.
+
+    Two tiles in their goal row (or column) but in the wrong order there cannot both
+    walk straight home, one of them steps out of the line and back. The penalty of each
+    line is the number of tiles outside its longest correctly ordered run, precomputed
+    for every arrangement of a line.
+
+    Parameters
+    ----------
+    geometry : Geometry, optional
+        Board size the heuristic scores. The default is the 15 puzzle.
+    """
+
+    def __init__(self, geometry: Geometry = None):
+        self.geometry = geometry = geometry or FIFTEEN
+        rows, cols = geometry.rows, geometry.cols
+        self.row_table = conflict_table(cols)
+        self.col_table = conflict_table(rows)
+
+        # digit of each tile at each cell within the code of the cell's row (and column),
+        # already multiplied by the cell's place value
+        self.row_digits = [[0] * geometry.cells for _ in range(geometry.cells)]
+        self.col_digits = [[0] * geometry.cells for _ in range(geometry.cells)]
+        for tile in range(1, geometry.cells):
+            goal_row, goal_col = divmod(tile - 1, cols)
+            for cell in range(geometry.cells):
+                row, col = divmod(cell, cols)
+                if row == goal_row:
+                    self.row_digits[tile][cell] = (goal_col + 1) * (cols + 1) ** col
+                if col == goal_col:
+                    self.col_digits[tile][cell] = (goal_row + 1) * (rows + 1) ** row
+
+    def __call__(self, node: TilesNode) -> int:
+        geometry = self.geometry
+        if node.geometry is not geometry:
+            raise ValueError("heuristic is for %r, node is %r" % (geometry, node.geometry))
+
+        board = node.board
+        bits, mask, cols = geometry.bits, geometry.mask, geometry.cols
+        distance, row_digits, col_digits = geometry.distance, self.row_digits, self.col_digits
+        row_codes = [0] * geometry.rows
+        col_codes = [0] * cols
+        total = 0
+        for cell in range(geometry.cells):
+            tile = (board >> (bits * cell)) & mask
+            total += distance[tile][cell]
+            row_codes[cell // cols] += row_digits[tile][cell]
+            col_codes[cell % cols] += col_digits[tile][cell]
+
+        row_table, col_table = self.row_table, self.col_table
+        for code in row_codes:
+            total += row_table[code]
+        for code in col_codes:
+            total += col_table[code]
+        return total
+
+    # the tables are rebuilt (once per process) rather than pickled
+    def __reduce__(self):
+        return type(self), (self.geometry,)
+
+
+class WalkingDistance:
+    """Sum of the exact solution lengths of the row and column relaxations.
+
+    Vertical moves only change the row relaxation and horizontal moves the column one,
+    so both distances add up. Every reachable state of each relaxation is solved once,
+    24964 of them for the 15 puzzle; the tables grow quickly past 4x5 boards.
+
+    Parameters
+    ----------
+    geometry : Geometry, optional
+        Board size the heuristic scores. The default is the 15 puzzle.
+    """
+
+    def __init__(self, geometry: Geometry = None):
+        self.geometry = geometry = geometry or FIFTEEN
+        rows, cols = geometry.rows, geometry.cols
+        self.row_table = walking_distance_table(rows, cols)
+        self.col_table = walking_distance_table(cols, rows)
+
+        # what each tile at each cell adds to the keys of the two relaxations,
+        # the empty space records its line
+        row_base, col_base = cols + 1, rows + 1
+        self.row_weights = [[0] * geometry.cells for _ in range(geometry.cells)]
+        self.col_weights = [[0] * geometry.cells for _ in range(geometry.cells)]
+        for cell in range(geometry.cells):
+            row, col = divmod(cell, cols)
+            self.row_weights[0][cell] = row * row_base ** (rows * rows)
+            self.col_weights[0][cell] = col * col_base ** (cols * cols)
+            for tile in range(1, geometry.cells):
+                goal_row, goal_col = divmod(tile - 1, cols)
+                self.row_weights[tile][cell] = row_base ** (row * rows + goal_row)
+                self.col_weights[tile][cell] = col_base ** (col * cols + goal_col)
+
+    def __call__(self, node: TilesNode) -> int:
+        geometry = self.geometry
+        if node.geometry is not geometry:
+            raise ValueError("heuristic is for %r, node is %r" % (geometry, node.geometry))
+
+        board = node.board
+        bits, mask = geometry.bits, geometry.mask
+        row_weights, col_weights = self.row_weights, self.col_weights
+        row_key = col_key = 0
+        for cell in range(geometry.cells):
+            tile = (board >> (bits * cell)) & mask
+            row_key += row_weights[tile][cell]
+            col_key += col_weights[tile][cell]
+        return self.row_table[row_key] + self.col_table[col_key]
+
+    def __reduce__(self):
+        return type(self), (self.geometry,)
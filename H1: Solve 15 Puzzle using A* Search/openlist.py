@@ -0,0 +1,100 @@
+# open lists for the searches in astar.py
+#
+# every open list stores (f, g, node) entries and pops the entry with the lowest f,
+# breaking ties toward the highest g (the deepest node, most likely to be near the goal)
+# entries are never removed when a node is reopened with a better g; the search skips
+# the stale entry when it is popped (lazy deletion)
+import heapq
+from typing import Protocol
+
+
+class OpenList(Protocol):
+
+    # adds node with priority f and path cost g
+    def push(self, f, g: int, node) -> None: ...
+
+    # removes and returns the (f, g, node) entry with the lowest f, deepest g first
+    def pop(self) -> tuple: ...
+
+    # number of entries, including stale ones
+    def __len__(self) -> int: ...
+
+
+class BucketOpenList:
+    """Open list for small non-negative integer f values, O(1) push and amortised O(1) pop.
+
+    Entries are kept in one stack per (f, g) pair. Pops take the lowest non-empty f,
+    then the highest non-empty g inside it, then the most recently pushed node (LIFO).
+    """
+
+    def __init__(self):
+        # _buckets[f][g] is the stack of nodes pushed with that f and g
+        self._buckets = []
+        # _top[f] is an upper bound on the highest non-empty g in _buckets[f]
+        self._top = []
+        self._min_f = 0
+        self._size = 0
+
+    def push(self, f: int, g: int, node) -> None:
+        buckets = self._buckets
+        while len(buckets) <= f:
+            buckets.append([])
+            self._top.append(-1)
+        stacks = buckets[f]
+        while len(stacks) <= g:
+            stacks.append([])
+        stacks[g].append(node)
+
+        if g > self._top[f]:
+            self._top[f] = g
+        if f < self._min_f or self._size == 0:
+            self._min_f = f
+        self._size += 1
+
+    def pop(self) -> tuple:
+        if self._size == 0:
+            raise IndexError("pop from an empty open list")
+
+        f = self._min_f
+        buckets = self._buckets
+        top = self._top
+        while top[f] < 0:
+            f += 1
+        stacks = buckets[f]
+        g = top[f]
+        while not stacks[g]:
+            g -= 1
+        node = stacks[g].pop()
+
+        # lowers the bound past the stacks that are now empty
+        highest = g
+        while highest >= 0 and not stacks[highest]:
+            highest -= 1
+        top[f] = highest
+        self._min_f = f
+        self._size -= 1
+        return f, g, node
+
+    def __len__(self) -> int:
+        return self._size
+
+
+class HeapOpenList:
+    """Binary heap open list, works for any comparable f (e.g. weighted or real-valued costs)."""
+
+    def __init__(self):
+        self._heap = []
+        # insertion counter, so nodes themselves are never compared
+        self._counter = 0
+
+    def push(self, f, g: int, node) -> None:
+        # the counter is negated so equal (f, g) entries come out last in, first out
+        self._counter -= 1
+        heapq.heappush(self._heap, (f, -g, self._counter, node))
+
+    def pop(self) -> tuple:
+        f, g, _, node = heapq.heappop(self._heap)
+        return f, -g, node
+
+    def __len__(self) -> int:
+        return len(self._heap)
@@ -0,0 +1,277 @@
+# disjoint additive pattern database heuristic for sliding puzzles (15 puzzle by default)
+#
+# the tiles are split into disjoint patterns; for every placement of a pattern's tiles
+# its table stores the fewest moves of *those tiles* needed to bring them home. moves
+# of other tiles are free, so the tables of a partition can be added together and the
+# sum is still admissible and consistent
+import mmap
+import os
+import struct
+from collections import deque
+
+from tiles import FIFTEEN, Geometry, TilesNode, get_geometry
+
+MAGIC = b"TPDB"
+VERSION = 1
+
+# header: magic, version, rows, cols, number of patterns
+HEADER = struct.Struct("<4sHBBB")
+
+# 6-6-3 partition of the 15 puzzle's tiles
+DEFAULT_PARTITION = ((1, 5, 6, 9, 10, 13), (7, 8, 11, 12, 14, 15), (2, 3, 4))
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pdb663.tpdb")
+
+# entries not reached by the search, never left in a finished table
+UNSEEN = 255
+
+
+# number of ways to place k distinct tiles on a board of n cells (n! / (n - k)!)
+def table_size(k: int, n: int = FIFTEEN.cells) -> int:
+    size = 1
+    for i in range(k):
+        size *= n - i
+    return size
+
+
+# perfect hash of the cells a pattern's tiles occupy, in pattern order
+# (lexicographic rank of a partial permutation of n cells, 0 <= rank < table_size(len(cells), n))
+def rank(cells, n: int = FIFTEEN.cells) -> int:
+    index = 0
+    for i, cell in enumerate(cells):
+        smaller = 0
+        for j in range(i):
+            if cells[j] < cell:
+                smaller += 1
+        index = index * (n - i) + cell - smaller
+    return index
+
+
+# inverse of rank
+def unrank(index: int, k: int, n: int = FIFTEEN.cells) -> list[int]:
+    digits = []
+    for i in range(k - 1, -1, -1):
+        index, digit = divmod(index, n - i)
+        digits.append(digit)
+    digits.reverse()
+
+    cells = []
+    free = list(range(n))
+    for digit in digits:
+        cells.append(free.pop(digit))
+    return cells
+
+
+# builds the table of one pattern with a retrograde 0-1 breadth-first search from the goal
+# abstract states are (pattern cells, empty cell); moving a pattern tile costs 1, any other tile 0
+def build_pattern_table(pattern, geometry: Geometry = FIFTEEN) -> bytearray:
+    n = geometry.cells
+    neighbours = geometry.neighbours
+    k = len(pattern)
+    size = table_size(k, n)
+    table = bytearray([UNSEEN]) * size
+    distance = bytearray([UNSEEN]) * (size * n)
+
+    goal_cells = [tile - 1 for tile in pattern]
+    start = rank(goal_cells, n) * n + (n - 1)
+    distance[start] = 0
+    frontier = deque([start])
+
+    while frontier:
+        state = frontier.popleft()
+        index, blank = divmod(state, n)
+        d = distance[state]
+        if d < table[index]:
+            table[index] = d
+
+        cells = unrank(index, k, n)
+        for cell in neighbours[blank]:
+            if cell in cells:
+                # a pattern tile slides into the empty space
+                moved = list(cells)
+                moved[moved.index(cell)] = blank
+                child, cost = rank(moved, n) * n + cell, d + 1
+            else:
+                child, cost = index * n + cell, d
+
+            if cost < distance[child]:
+                distance[child] = cost
+                if cost == d:
+                    frontier.appendleft(child)
+                else:
+                    frontier.append(child)
+
+    return table
+
+
+# builds every table of a partition and writes them to path
+# other board sizes need their own partition, DEFAULT_PARTITION is for the 15 puzzle
+def build_pattern_database(path: str = DEFAULT_PATH, partition=DEFAULT_PARTITION, geometry: Geometry = FIFTEEN) -> None:
+    n = geometry.cells
+    tiles = [tile for pattern in partition for tile in pattern]
+    if len(set(tiles)) != len(tiles) or not all(0 < tile < n for tile in tiles):
+        raise ValueError("patterns must be disjoint sets of tiles 1 to %d" % (n - 1))
+
+    try:
+        # the numpy level-synchronous search builds the same tables much faster
+        from batched import build_pattern_table_batched as build_table
+    except ImportError:
+        build_table = build_pattern_table
+    tables = [build_table(pattern, geometry) for pattern in partition]
+    write_pattern_database(path, partition, tables, geometry)
+
+
+# file layout: header, then per pattern its size k, its k tiles and the offset of its
+# table, then the tables themselves as raw bytes, each starting on an 8 byte boundary
+def write_pattern_database(path: str, partition, tables, geometry: Geometry = FIFTEEN) -> None:
+    header = HEADER.pack(MAGIC, VERSION, geometry.rows, geometry.cols, len(partition))
+    for pattern in partition:
+        header += struct.pack("<B%dB" % len(pattern), len(pattern), *pattern)
+    offsets_at = len(header)
+    offset = offsets_at + 8 * len(partition)
+
+    offsets = []
+    for table in tables:
+        offset += -offset % 8
+        offsets.append(offset)
+        offset += len(table)
+
+    # written to a temporary file first so readers never map a half written table
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(header)
+        f.write(struct.pack("<%dQ" % len(offsets), *offsets))
+        for table, offset in zip(tables, offsets):
+            f.write(b"\0" * (offset - f.tell()))
+            f.write(table)
+    os.replace(tmp_path, path)
+
+
+class PatternDatabase:
+    """Additive pattern database heuristic backed by a file from build_pattern_database.
+
+    The file is memory-mapped read only the first time the heuristic is called, so
+    every solver process using the same file shares one page-cached copy. Instances
+    pickle by path and re-map the file after unpickling.
+
+    Parameters
+    ----------
+    path : str
+        The pattern database file. The default is DEFAULT_PATH.
+    """
+
+    def __init__(self, path: str = DEFAULT_PATH):
+        self.path = path
+        self._mmap = None
+        self._view = None
+        self._patterns = None
+        self._tables = None
+        self._geometry = None
+
+    # maps the file and checks its header
+    def _load(self):
+        with open(self.path, "rb") as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, rows, cols, count = HEADER.unpack_from(data, 0)
+        if magic != MAGIC:
+            raise ValueError("%s is not a pattern database file" % self.path)
+        if version != VERSION:
+            raise ValueError("%s has version %d, expected %d" % (self.path, version, VERSION))
+        geometry = get_geometry(rows, cols)
+
+        patterns = []
+        position = HEADER.size
+        for _ in range(count):
+            k = data[position]
+            patterns.append(tuple(data[position + 1:position + 1 + k]))
+            position += 1 + k
+        offsets = struct.unpack_from("<%dQ" % count, data, position)
+
+        view = memoryview(data)
+        self._tables = [
+            view[offset:offset + table_size(len(pattern), geometry.cells)]
+            for pattern, offset in zip(patterns, offsets)
+        ]
+        self._patterns = patterns
+        self._geometry = geometry
+        self._view = view
+        self._mmap = data
+
+    @property
+    def geometry(self) -> Geometry:
+        if self._geometry is None:
+            self._load()
+        return self._geometry
+
+    @property
+    def partition(self) -> list[tuple[int, ...]]:
+        if self._patterns is None:
+            self._load()
+        return list(self._patterns)
+
+    # one read only view of each pattern's table, in partition order
+    @property
+    def tables(self) -> list[memoryview]:
+        if self._tables is None:
+            self._load()
+        return list(self._tables)
+
+    # sum of the pattern tables for the node's tile placement
+    def __call__(self, node: TilesNode) -> int:
+        if self._tables is None:
+            self._load()
+
+        geometry = self._geometry
+        if node.geometry is not geometry:
+            raise ValueError("%s was built for %r, node is %r" % (self.path, geometry, node.geometry))
+
+        board = node.board
+        n, bits, mask = geometry.cells, geometry.bits, geometry.mask
+        positions = [0] * n
+        for cell in range(n):
+            positions[(board >> (bits * cell)) & mask] = cell
+
+        total = 0
+        for pattern, table in zip(self._patterns, self._tables):
+            total += table[rank([positions[tile] for tile in pattern], n)]
+        return total
+
+    def close(self) -> None:
+        if self._mmap is not None:
+            # the views have to be released before the mapping can be closed
+            for table in self._tables:
+                table.release()
+            self._view.release()
+            self._mmap.close()
+            self._mmap = self._view = self._patterns = self._tables = self._geometry = None
+
+    # the mapping is per process, only the path is pickled
+    def __getstate__(self):
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"])
+
+
+# python patterndb.py [path] [--partition tiles/tiles/...] [--size ROWSxCOLS]
+# e.g. python patterndb.py pdb555.tpdb --partition 1,2,3,4,5/6,7,8,9,10/11,12,13,14,15
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build a disjoint additive pattern database file.")
+    parser.add_argument("path", nargs="?", default=DEFAULT_PATH)
+    parser.add_argument("--partition", default=None, help="comma separated tiles, patterns separated by /")
+    parser.add_argument("--size", default="4x4", help="board size as ROWSxCOLS (default: 4x4)")
+    args = parser.parse_args()
+
+    rows, cols = (int(side) for side in args.size.split("x"))
+    partition = DEFAULT_PARTITION
+    if args.partition is not None:
+        partition = tuple(
+            tuple(int(tile) for tile in pattern.split(",")) for pattern in args.partition.split("/")
+        )
+    elif (rows, cols) != (4, 4):
+        parser.error("--partition is required for boards other than 4x4")
+
+    build_pattern_database(args.path, partition, get_geometry(rows, cols))
+    print("wrote %s (%s)" % (args.path, "-".join(str(len(pattern)) for pattern in partition)))
@@ -0,0 +1,388 @@
+# local solve service, HTTP over a Unix socket or localhost TCP, searches run in worker processes
+#
+# python service.py --unix /tmp/puzzle.sock --workers 4
+# python service.py --port 8170 --pdb pdb663.tpdb
+# python service.py --port 8170 --heuristic walking-distance
+#
+# curl --unix-socket /tmp/puzzle.sock -d '{"state": [[1, 2, 3], [4, 5, 6], [7, 0, 8]]}' http://localhost/solve
+# curl --unix-socket /tmp/puzzle.sock http://localhost/metrics
+#
+# POST /solve takes {"state": board, "timeout": seconds, "solver": name}, timeout and
+# solver being optional, and answers with a batch.solve_one result object. GET /metrics
+# answers with SolveService.metrics(). one request per connection.
+#
+# requests for a board that is already being searched wait for that search instead of
+# starting another. a search is cancelled, and its worker process replaced, once every
+# request waiting for it has passed its deadline or its client has disconnected
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import time
+from collections import Counter, deque
+
+from astar import HEURISTICS
+from batch import SOLVERS, solve_one
+from patterndb import PatternDatabase
+from tiles import InvalidPuzzleError, validate_state
+
+# recent request latencies kept for the percentiles in the metrics
+LATENCY_WINDOW = 1024
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found"}
+
+
+# runs in each worker process: solves (state, solver name, timeout) jobs until it gets None
+def _worker_main(conn, heuristic):
+    while True:
+        job = conn.recv()
+        if job is None:
+            break
+        state, solver, timeout = job
+        conn.send(solve_one(0, state, SOLVERS[solver], heuristic, timeout))
+
+
+# workers are started from a fork server, a plain fork would hand them copies of the open
+# client sockets and keep those connections from closing
+CONTEXT = multiprocessing.get_context("forkserver")
+
+
+class _Worker:
+
+    def __init__(self, heuristic):
+        self.conn, child_conn = CONTEXT.Pipe()
+        self.process = CONTEXT.Process(target=_worker_main, args=(child_conn, heuristic), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    # stops the process in the middle of a search
+    def kill(self):
+        self.process.terminate()
+        self.process.join()
+        self.conn.close()
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(timeout=1)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        self.conn.close()
+
+
+class _WorkerPool:
+    """Worker processes that each run one search at a time.
+
+    Jobs wait for an idle worker, and a cancelled job kills its worker and starts a
+    new one, which a ProcessPoolExecutor cannot do. Killing, joining and starting
+    processes block, so replacements run in the loop's default executor and the new
+    worker joins the idle ones when it is ready.
+    """
+
+    def __init__(self, size: int, heuristic):
+        self.size = size
+        self.heuristic = heuristic
+        self.waiting = 0
+        self.busy = 0
+        self.replaced = 0
+        self._idle = asyncio.Queue()
+        self._replacing = set()
+        for _ in range(size):
+            self._idle.put_nowait(_Worker(heuristic))
+
+    async def run(self, job) -> dict:
+        self.waiting += 1
+        try:
+            worker = await self._idle.get()
+        finally:
+            self.waiting -= 1
+
+        self.busy += 1
+        try:
+            result = await self._exchange(worker, job)
+        except BaseException:
+            # cancelled, or the worker died: its state is unknown, so it is replaced
+            task = asyncio.ensure_future(self._replace(worker))
+            self._replacing.add(task)
+            task.add_done_callback(self._replacing.discard)
+            self.replaced += 1
+            raise
+        finally:
+            self.busy -= 1
+        self._idle.put_nowait(worker)
+        return result
+
+    # kills worker and starts another in its place, off the event loop
+    async def _replace(self, worker: _Worker):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, worker.kill)
+        self._idle.put_nowait(await loop.run_in_executor(None, _Worker, self.heuristic))
+
+    # sends the job and waits, without blocking the event loop, for the worker's answer
+    @staticmethod
+    async def _exchange(worker: _Worker, job) -> dict:
+        loop = asyncio.get_running_loop()
+        worker.conn.send(job)
+        readable = loop.create_future()
+        fd = worker.conn.fileno()
+        loop.add_reader(fd, lambda: readable.done() or readable.set_result(None))
+        try:
+            await readable
+        finally:
+            loop.remove_reader(fd)
+        return worker.conn.recv()
+
+    # waits for replacements under way, then stops every worker
+    async def close(self):
+        await asyncio.gather(*self._replacing, return_exceptions=True)
+        workers = []
+        while not self._idle.empty():
+            workers.append(self._idle.get_nowait())
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(None, worker.stop) for worker in workers))
+
+
+# one running search and the number of requests waiting for it
+class _Flight:
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SolveService:
+    """Solves puzzles for concurrent requests in worker processes.
+
+    solve() can be awaited directly by code running in the same event loop;
+    serve() exposes it over HTTP. start() must be called from the running loop
+    before either.
+
+    Parameters
+    ----------
+    workers : int, optional
+        Number of worker processes, the most searches running at once. The default
+        is os.cpu_count().
+
+    heuristic : callable or str, optional
+        Heuristic passed to the solvers, it must be picklable. A name from
+        astar.HEURISTICS is made for each board's size. The default is Manhattan
+        distance for each board's size.
+
+    max_timeout : float, optional
+        Seconds a search may run however long its requests are willing to wait,
+        and the deadline of requests that give none. The default is no limit.
+    """
+
+    def __init__(self, workers: int = None, heuristic: callable = None, max_timeout: float = None):
+        self.workers = workers or os.cpu_count() or 1
+        self.heuristic = heuristic
+        self.max_timeout = max_timeout
+        self.requests = 0
+        self.coalesced = 0
+        self.disconnected = 0
+        self.statuses = Counter()
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self._flights = {}
+        self._pool = None
+
+    def start(self):
+        self._pool = _WorkerPool(self.workers, self.heuristic)
+
+    async def solve(self, state, timeout: float = None, solver: str = "astar") -> dict:
+        """Solve one board, sharing the search with identical concurrent requests.
+
+        Returns a batch.solve_one result without its index. status is "timeout" when
+        no solution arrived within timeout seconds, and "error" if the worker died.
+        """
+        started = time.monotonic()
+        self.requests += 1
+        try:
+            result = await self._solve(state, timeout, solver)
+        except asyncio.CancelledError:
+            self.statuses["cancelled"] += 1
+            raise
+        self.statuses[result["status"]] += 1
+        self.latencies.append(time.monotonic() - started)
+        return result
+
+    async def _solve(self, state, timeout: float, solver: str) -> dict:
+        try:
+            geometry = validate_state(state)
+        except InvalidPuzzleError as error:
+            return {"status": "invalid", "error": str(error)}
+        if solver not in SOLVERS:
+            return {"status": "invalid", "error": "unknown solver %r" % solver}
+        if timeout is None or (self.max_timeout is not None and timeout > self.max_timeout):
+            timeout = self.max_timeout
+
+        key = (solver, geometry.rows, geometry.cols, geometry.pack(state))
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(self._pool.run((state, solver, self.max_timeout))))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._land(key, flight))
+        else:
+            self.coalesced += 1
+
+        flight.waiters += 1
+        try:
+            result = dict(await asyncio.wait_for(asyncio.shield(flight.task), timeout))
+        except asyncio.TimeoutError:
+            return {"status": "timeout"}
+        except (EOFError, OSError) as error:
+            return {"status": "error", "error": "worker failed: %s" % (error or type(error).__name__)}
+        finally:
+            flight.waiters -= 1
+            # nobody is waiting any more, later requests for the board start afresh
+            if not flight.waiters and not flight.task.done():
+                flight.task.cancel()
+                self._land(key, flight)
+        del result["index"]
+        return result
+
+    def _land(self, key, flight: _Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def metrics(self) -> dict:
+        latencies = sorted(self.latencies)
+
+        def percentile(q):
+            return latencies[int(q * (len(latencies) - 1))] if latencies else 0.0
+
+        return {
+            "requests": self.requests,
+            "coalesced": self.coalesced,
+            "disconnected": self.disconnected,
+            "statuses": dict(self.statuses),
+            "searches_in_flight": len(self._flights),
+            "queue_depth": self._pool.waiting,
+            "busy_workers": self._pool.busy,
+            "workers": self._pool.size,
+            "workers_replaced": self._pool.replaced,
+            "latency_seconds": {
+                "count": len(latencies),
+                "mean": sum(latencies) / len(latencies) if latencies else 0.0,
+                "p50": percentile(0.5),
+                "p95": percentile(0.95),
+                "p99": percentile(0.99),
+                "max": latencies[-1] if latencies else 0.0,
+            },
+        }
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            status, payload = await self._respond(reader)
+            if status is not None:
+                body = json.dumps(payload).encode()
+                writer.write(("HTTP/1.1 %d %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\n"
+                              "Connection: close\r\n\r\n" % (status, REASONS[status], len(body))).encode() + body)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    # reads one request, returns (HTTP status, JSON payload), or (None, None) when the
+    # client disconnected before its answer was ready
+    async def _respond(self, reader: asyncio.StreamReader):
+        try:
+            method, target, _ = (await reader.readline()).decode("latin-1").split(" ", 2)
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get("content-length", 0)))
+        except ValueError:
+            return 400, {"error": "malformed request"}
+
+        if method == "GET" and target == "/metrics":
+            return 200, self.metrics()
+        if method != "POST" or target != "/solve":
+            return 404, {"error": "not found"}
+
+        try:
+            request = json.loads(body)
+            state = request["state"]
+            timeout = request.get("timeout")
+            solver = request.get("solver", "astar")
+            if timeout is not None:
+                timeout = float(timeout)
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return 400, {"error": 'expected a JSON object {"state": board, "timeout": seconds, "solver": name}'}
+
+        # the client closing the connection cancels its request
+        solving = asyncio.ensure_future(self.solve(state, timeout, solver))
+        while True:
+            closed = asyncio.ensure_future(reader.read(1))
+            await asyncio.wait({solving, closed}, return_when=asyncio.FIRST_COMPLETED)
+            if solving.done():
+                closed.cancel()
+                return 200, solving.result()
+            if closed.result() == b"":
+                solving.cancel()
+                self.disconnected += 1
+                return None, None
+
+    # serves HTTP on a Unix socket when unix is given, otherwise on host:port
+    async def serve(self, unix: str = None, host: str = "127.0.0.1", port: int = 8170):
+        if self._pool is None:
+            self.start()
+        if unix is not None:
+            server = await asyncio.start_unix_server(self._handle, path=unix)
+        else:
+            server = await asyncio.start_server(self._handle, host, port)
+        async with server:
+            await server.serve_forever()
+
+    async def close(self):
+        for flight in list(self._flights.values()):
+            flight.task.cancel()
+        await asyncio.gather(*(flight.task for flight in self._flights.values()), return_exceptions=True)
+        await self._pool.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve puzzle solving over HTTP on a Unix socket or localhost.")
+    parser.add_argument("--unix", default=None, help="Unix socket path (default: TCP on --host and --port)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8170)
+    parser.add_argument("-w", "--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--heuristic", default="manhattan",
+                        help="pdb:PATH or from: %s (default: manhattan)" % ", ".join(HEURISTICS))
+    parser.add_argument("--pdb", default=None, help="pattern database file, same as --heuristic pdb:PATH")
+    parser.add_argument("--max-timeout", type=float, default=None, help="seconds any search may run")
+    args = parser.parse_args(argv)
+
+    heuristic = args.heuristic
+    if args.pdb:
+        heuristic = PatternDatabase(args.pdb)
+    elif heuristic.startswith("pdb:"):
+        heuristic = PatternDatabase(heuristic[4:])
+    elif heuristic not in HEURISTICS:
+        parser.error("unknown heuristic %r" % heuristic)
+
+    service = SolveService(args.workers, heuristic, args.max_timeout)
+
+    async def run():
+        service.start()
+        try:
+            await service.serve(args.unix, args.host, args.port)
+        finally:
+            await service.close()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
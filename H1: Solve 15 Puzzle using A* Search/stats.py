@@ -0,0 +1,134 @@
+# search statistics and progress hooks for AStar
+#
+# stats = SearchStats()
+# AStar(root, heuristic, stats=stats, callback=print_progress, callback_interval=10000)
+#
+# AStar only measures anything when it is given a SearchStats (or a callback); the
+# timing wrappers below are installed around the heuristic and the open list for that
+# run alone, so an unmeasured search runs the same code as before
+import time
+from collections import Counter
+
+
+# raised by AStar when a progress callback asks it to stop
+class SearchAborted(Exception):
+    pass
+
+
+class SearchStats:
+    """Counters and timings of one search.
+
+    Attributes
+    ----------
+    generated : int
+        Children produced by get_children.
+
+    expanded : int
+        Nodes expanded, including re-expansions.
+
+    reexpanded : int
+        Expansions of nodes that were already explored with a worse g.
+
+    duplicates : int
+        Children skipped because they were already explored with a g at least as good.
+
+    peak_open, peak_closed : int
+        Largest open list (stale entries included) and explored set sizes.
+
+    layers : Counter
+        Expansions per f value.
+
+    children_seconds, heuristic_seconds, queue_seconds : float
+        Time spent in get_children, in the heuristic and in open list push/pop.
+
+    seconds : float
+        Wall time of the whole search.
+    """
+
+    def __init__(self):
+        self.generated = 0
+        self.expanded = 0
+        self.reexpanded = 0
+        self.duplicates = 0
+        self.peak_open = 0
+        self.peak_closed = 0
+        self.layers = Counter()
+        self.children_seconds = 0.0
+        self.heuristic_seconds = 0.0
+        self.queue_seconds = 0.0
+        self.seconds = 0.0
+        # size in bytes of one stored node (a packed state int for AStar), set by the search from its root
+        self.node_bytes = 0
+
+    # rough bytes held by the search at its peak: node objects or packed states, and one
+    # dict entry (g) plus one set or list slot (explored or open) per node
+    def memory_estimate(self) -> int:
+        per_node = self.node_bytes + 3 * 8 + 2 * 8
+        return (self.peak_open + self.peak_closed) * per_node
+
+    def nodes_per_second(self) -> float:
+        return self.expanded / self.seconds if self.seconds > 0 else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "generated": self.generated,
+            "expanded": self.expanded,
+            "reexpanded": self.reexpanded,
+            "duplicates": self.duplicates,
+            "peak_open": self.peak_open,
+            "peak_closed": self.peak_closed,
+            "layers": {str(f): n for f, n in sorted(self.layers.items())},
+            "children_seconds": self.children_seconds,
+            "heuristic_seconds": self.heuristic_seconds,
+            "queue_seconds": self.queue_seconds,
+            "seconds": self.seconds,
+            "nodes_per_second": self.nodes_per_second(),
+            "memory_estimate": self.memory_estimate(),
+        }
+
+    def __repr__(self) -> str:
+        return "SearchStats(expanded=%d, generated=%d, peak_open=%d, peak_closed=%d, seconds=%.3f)" % (
+            self.expanded, self.generated, self.peak_open, self.peak_closed, self.seconds)
+
+
+# wraps a heuristic and its update method so their time is added to stats.heuristic_seconds
+def timed_heuristic(heuristic: callable, update, stats: SearchStats):
+    clock = time.perf_counter
+
+    def timed_call(node):
+        start = clock()
+        value = heuristic(node)
+        stats.heuristic_seconds += clock() - start
+        return value
+
+    def timed_update(h, tile, src, dst):
+        start = clock()
+        value = update(h, tile, src, dst)
+        stats.heuristic_seconds += clock() - start
+        return value
+
+    return timed_call, (None if update is None else timed_update)
+
+
+class TimedOpenList:
+    """Open list wrapper that adds push/pop time to stats.queue_seconds and tracks peak_open."""
+
+    def __init__(self, open_list, stats: SearchStats):
+        self.open_list = open_list
+        self.stats = stats
+
+    def push(self, f, g: int, node) -> None:
+        start = time.perf_counter()
+        self.open_list.push(f, g, node)
+        self.stats.queue_seconds += time.perf_counter() - start
+        if len(self.open_list) > self.stats.peak_open:
+            self.stats.peak_open = len(self.open_list)
+
+    def pop(self) -> tuple:
+        start = time.perf_counter()
+        entry = self.open_list.pop()
+        self.stats.queue_seconds += time.perf_counter() - start
+        return entry
+
+    def __len__(self) -> int:
+        return len(self.open_list)
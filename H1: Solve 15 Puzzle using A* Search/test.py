@@ -4,9 +4,39 @@ import unittest
 # generates random test cases
 import random
 
+# builds pattern databases in a scratch directory
+import os
+import tempfile
+
+# checks that solution paths pickle compactly
+import pickle
+
+# drives the solve service
+import asyncio
+import json
+
+# silences the usage errors of the command line checks
+import contextlib
+import io
+
+# the vectorised solvability check needs numpy, its test is skipped without it
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 # imports functions and classes from pertaining files
-from tiles import TilesNode
-from astar import AStar, heuristic
+from batch import main as batch_main, read_instances, solve_batch
+from cache import SolutionCache
+from service import SolveService
+from benchmark import BASELINE_PATH, MIN_TIMED_SECONDS, compare_results, config_key, load_instances, run_config
+from openlist import BucketOpenList, HeapOpenList
+from patterndb import PatternDatabase, build_pattern_database, rank, unrank
+from stats import SearchAborted, SearchStats
+from tiles import (GOAL_STATE, InvalidPuzzleError, Path, TilesNode, UnsolvablePuzzleError, get_geometry, pack_moves,
+                   pack_state, path_to_moves, unpack_moves, unpack_state, validate_state)
+from astar import (HEURISTICS, MM, AStar, AnytimeAStar, IDAStar, ManhattanDistance, SearchTimeout, anytime_astar,
+                   get_heuristic, heuristic)
 
 
 class TestFifteensPuzzle(unittest.TestCase):
@@ -50,6 +80,17 @@ class TestFifteensPuzzle(unittest.TestCase):
             "Generated test cases differ across runs with same seed.",
         )
 
+    def test_packed_state_roundtrip(self):
+        state = [[12, 1, 10, 7], [11, 9, 6, 2], [5, 4, 3, 8], [13, 14, 0, 15]]
+        self.assertEqual(unpack_state(pack_state(state)), state)
+
+        node = TilesNode(state=state)
+        self.assertEqual(node.state, state)
+        self.assertEqual(node.find_empty_space(), (3, 2))
+        for child in node.get_children():
+            self.assertIs(child.parent, node)
+            self.assertEqual(child.state[child.blank // 4][child.blank % 4], 0)
+
     def test_is_goal(self):
         self.assertFalse(self.fifteens_root.is_goal())
         self.assertTrue(self.goal_node.is_goal())
@@ -95,6 +136,288 @@ class TestFifteensPuzzle(unittest.TestCase):
         self.assertTrue(solution[-1].is_goal())
         self.assertLessEqual(len(solution), 20)
 
+    def test_idastar(self):
+        random.seed(3)
+        for _ in range(5):
+            root = self.generate_random_test_case(steps=30)
+            solution = IDAStar(root, heuristic)
+            self.assertIs(solution[0], root)
+            self.assertTrue(solution[-1].is_goal())
+            fresh_root = TilesNode(state=root.state)
+            self.assertEqual(len(solution), len(AStar(fresh_root, heuristic)))
+
+        solution = IDAStar(TilesNode(state=self.goal_state), heuristic)
+        self.assertEqual(len(solution), 1)
+
+    def test_bidirectional(self):
+        random.seed(4)
+        for _ in range(5):
+            state = self.generate_random_test_case(steps=40).state
+            root = TilesNode(state=state)
+            solution = MM(root, heuristic)
+            self.assertIs(solution[0], root)
+            self.assertTrue(solution[-1].is_goal())
+            self.assertEqual(solution[-1].get_path(), solution)
+            self.assertEqual(len(solution), len(AStar(TilesNode(state=state), heuristic)))
+
+        goal_node = TilesNode(state=self.goal_state)
+        self.assertEqual(MM(goal_node, heuristic), [goal_node])
+
+        # the reverse heuristic is Manhattan distance toward the root
+        self.assertEqual(ManhattanDistance(self.fifteens_root)(self.fifteens_root), 0)
+        self.assertEqual(ManhattanDistance(self.fifteens_root)(goal_node), heuristic(self.fifteens_root))
+
+    def test_anytime(self):
+        random.seed(12)
+        for _ in range(3):
+            state = self.generate_random_test_case(steps=60).state
+            optimal = len(AStar(TilesNode(state=state), heuristic)) - 1
+            solutions = list(anytime_astar(TilesNode(state=state), heuristic))
+            for solution in solutions:
+                self.assertTrue(solution.path[-1].is_goal())
+                self.assertLessEqual(len(solution.path) - 1, solution.bound * optimal)
+            self.assertEqual(solutions[-1].bound, 1.0)
+            self.assertEqual(len(solutions[-1].path) - 1, optimal)
+            bounds = [solution.bound for solution in solutions]
+            self.assertEqual(bounds, sorted(bounds, reverse=True))
+
+        # a single expansion is not enough for any solution
+        with self.assertRaises(SearchTimeout):
+            AnytimeAStar(TilesNode(state=state), heuristic, max_nodes=1)
+
+    def test_open_lists(self):
+        for open_list in (BucketOpenList(), HeapOpenList()):
+            for f, g, name in [(5, 1, "a"), (3, 0, "b"), (5, 3, "c"), (3, 2, "d"), (5, 3, "e")]:
+                open_list.push(f, g, name)
+            self.assertEqual(len(open_list), 5)
+            order = [open_list.pop() for _ in range(5)]
+            # lowest f first, then deepest g, then last in first out
+            self.assertEqual(
+                order, [(3, 2, "d"), (3, 0, "b"), (5, 3, "e"), (5, 3, "c"), (5, 1, "a")])
+            self.assertEqual(len(open_list), 0)
+
+        random.seed(5)
+        for _ in range(3):
+            state = self.generate_random_test_case(steps=40).state
+            self.assertEqual(
+                len(AStar(TilesNode(state=state), heuristic, HeapOpenList())),
+                len(AStar(TilesNode(state=state), heuristic)),
+            )
+
+    def test_solve_batch(self):
+        random.seed(9)
+        states = [self.generate_random_test_case(steps=20).state for _ in range(6)]
+        for workers in (1, 2):
+            results = sorted(solve_batch(states, workers=workers), key=lambda r: r["index"])
+            self.assertEqual([r["index"] for r in results], list(range(6)))
+            for state, result in zip(states, results):
+                self.assertEqual(result["status"], "solved")
+                solution = AStar(TilesNode(state=state), heuristic)
+                self.assertEqual(result["moves"], path_to_moves(solution))
+                self.assertEqual(result["length"], len(solution) - 1)
+                self.assertGreaterEqual(result["expanded"], result["length"])
+                self.assertGreaterEqual(result["generated"], result["expanded"])
+
+        # a deep scramble cannot be solved within a zero second budget
+        hard = [[14, 15, 8, 12], [10, 11, 9, 13], [2, 6, 5, 1], [3, 7, 4, 0]]
+        result = next(solve_batch([hard], workers=1, timeout=0))
+        self.assertEqual(result["status"], "timeout")
+        self.assertIn("expanded", result)
+
+        # unreadable lines are reported in place and the rest of the stream is solved
+        lines = ['[[1, 2], [0, 3]]', '{bad', '', '{"id": 7}', '{"id": 8, "state": [1, 2, 0, 3]}']
+        ids, states = zip(*read_instances(lines))
+        self.assertEqual(ids, (None, None, 7, 8))
+        results = list(solve_batch(states, workers=1))
+        self.assertEqual([r["status"] for r in results], ["solved", "invalid", "invalid", "solved"])
+        self.assertIn("JSON", results[1]["error"])
+
+        # any other failure of the solver is reported for its instance only
+        results = list(solve_batch([[[1, 2], [0, 3]]] * 2, workers=1, solver=MM, heuristic="linear-conflict"))
+        self.assertEqual([r["status"] for r in results], ["error", "error"])
+        self.assertTrue(results[0]["error"].startswith("ValueError: "))
+
+        # and pairs of solver and heuristic that cannot work are refused before solving
+        refused = [["--solver", "mm", "--heuristic", "linear-conflict"],
+                   ["--solver", "mm", "--heuristic", "walking-distance"]]
+        if numpy is not None:
+            refused.append(["--solver", "batched", "--heuristic", "linear-conflict"])
+        for argv in refused:
+            with self.assertRaises(SystemExit), contextlib.redirect_stderr(io.StringIO()):
+                batch_main(argv + [os.devnull])
+
+    def test_compact_path(self):
+        random.seed(15)
+        root = TilesNode(state=self.generate_random_test_case(steps=40).state)
+        solution = AStar(root, heuristic)
+        self.assertIsInstance(solution, Path)
+        self.assertIs(solution[0], root)
+        self.assertEqual(len(solution), len(solution.moves) + 1)
+
+        # the nodes are rebuilt from the moves, each linked to the one before
+        nodes = list(solution)
+        self.assertTrue(nodes[-1].is_goal())
+        for parent, child in zip(nodes, nodes[1:]):
+            self.assertIs(child.parent, parent)
+            self.assertIn(child, parent.get_children())
+        self.assertEqual(solution, nodes)
+        self.assertEqual([solution[i] for i in (5, 2, -1)], [nodes[5], nodes[2], nodes[-1]])
+        self.assertEqual(solution[1:4], nodes[1:4])
+        self.assertEqual(nodes[-1].get_path(), solution)
+        self.assertEqual(path_to_moves(nodes), solution.moves)
+
+        # 2 bits per move, and pickles without the nodes
+        self.assertEqual(unpack_moves(pack_moves(solution.moves)), solution.moves)
+        self.assertEqual(len(pack_moves(solution.moves)), 4 + (len(solution.moves) + 3) // 4)
+        copy = pickle.loads(pickle.dumps(solution))
+        self.assertEqual(copy, solution)
+        self.assertIsNone(copy.root.parent)
+
+        with self.assertRaises(ValueError):
+            TilesNode(state=self.goal_state).apply_move("R")
+
+    def test_solve_service(self):
+        # far too deep to solve with Manhattan distance before the deadlines below
+        hard = [[14, 15, 8, 12], [10, 11, 9, 13], [2, 6, 5, 1], [3, 7, 4, 0]]
+
+        async def request(path, method, target, payload=None, hang_up_after=None):
+            reader, writer = await asyncio.open_unix_connection(path)
+            body = b"" if payload is None else json.dumps(payload).encode()
+            writer.write(b"%s %s HTTP/1.1\r\nContent-Length: %d\r\n\r\n%s" % (method, target, len(body), body))
+            if hang_up_after is not None:
+                await asyncio.sleep(hang_up_after)
+                writer.close()
+                return None
+            response = await reader.read()
+            writer.close()
+            head, _, body = response.partition(b"\r\n\r\n")
+            return int(head.split()[1]), json.loads(body)
+
+        async def scenario(path):
+            service = SolveService(workers=2)
+            service.start()
+            server = asyncio.ensure_future(service.serve(unix=path))
+            try:
+                # identical boards in flight share one search
+                results = await asyncio.gather(*(service.solve(self.fifteens_root.state) for _ in range(3)))
+                self.assertEqual([r["status"] for r in results], ["solved"] * 3)
+                self.assertEqual(results[0]["moves"], path_to_moves(AStar(self.fifteens_root, heuristic)))
+                self.assertEqual(service.coalesced, 2)
+
+                # a search nobody waits for any more is cancelled and its worker replaced
+                self.assertEqual((await service.solve(hard, timeout=0.2))["status"], "timeout")
+                self.assertEqual((await service.solve([[1, 1], [0, 2]]))["status"], "invalid")
+
+                while not os.path.exists(path):
+                    await asyncio.sleep(0.01)
+                status, result = await request(path, b"POST", b"/solve", {"state": self.fifteens_root.state})
+                self.assertEqual((status, result["status"]), (200, "solved"))
+                self.assertEqual((await request(path, b"POST", b"/solve", {"board": 1}))[0], 400)
+                await request(path, b"POST", b"/solve", {"state": hard}, hang_up_after=0.2)
+                await asyncio.sleep(0.1)
+
+                status, metrics = await request(path, b"GET", b"/metrics")
+                self.assertEqual(status, 200)
+                self.assertEqual(metrics["disconnected"], 1)
+                self.assertEqual(metrics["searches_in_flight"], 0)
+                self.assertEqual(metrics["workers_replaced"], 2)
+                self.assertEqual(metrics["statuses"], {"solved": 4, "timeout": 1, "invalid": 1, "cancelled": 1})
+                self.assertGreater(metrics["latency_seconds"]["count"], 0)
+            finally:
+                server.cancel()
+                await service.close()
+
+        with tempfile.TemporaryDirectory() as tmp:
+            asyncio.run(scenario(os.path.join(tmp, "solve.sock")))
+
+    def test_search_stats(self):
+        random.seed(13)
+        state = self.generate_random_test_case(steps=40).state
+        stats = SearchStats()
+        solution = AStar(TilesNode(state=state), heuristic, stats=stats)
+        self.assertEqual(solution, AStar(TilesNode(state=state), heuristic))
+        self.assertGreater(stats.expanded, 0)
+        self.assertEqual(sum(stats.layers.values()), stats.expanded)
+        self.assertGreaterEqual(stats.generated, stats.expanded)
+        self.assertEqual(stats.peak_closed, stats.expanded - stats.reexpanded)
+        self.assertGreater(stats.memory_estimate(), 0)
+        self.assertEqual(stats.as_dict()["expanded"], stats.expanded)
+
+        # a callback returning True stops the search
+        calls = []
+        with self.assertRaises(SearchAborted):
+            AStar(TilesNode(state=state), heuristic, callback=lambda s: calls.append(s.expanded) or True,
+                  callback_interval=5)
+        self.assertEqual(calls, [5])
+
+    def test_benchmark_regressions(self):
+        boards = load_instances()["scramble10"][:5]
+        result = run_config("astar", "manhattan", "scramble10", boards)
+        self.assertEqual(result["solved"], 5)
+        self.assertGreater(result["expanded"], 0)
+        self.assertEqual(compare_results([result], [result]), [])
+
+        # the committed baseline has the same optimal lengths
+        with open(BASELINE_PATH) as f:
+            baseline = {config_key(r): r for r in json.load(f)["results"]}
+        self.assertEqual(result["lengths"], baseline[config_key(result)]["lengths"][:5])
+
+        # nodes/second are only compared for baselines that searched long enough to time
+        slower = dict(result, nodes_per_second=result["nodes_per_second"] * 0.5)
+        self.assertEqual(compare_results([slower], [result], tolerance=0.2), [])
+        timed = dict(result, expanded=result["nodes_per_second"] * MIN_TIMED_SECONDS)
+        self.assertEqual(len(compare_results([slower], [timed], tolerance=0.2)), 1)
+        self.assertEqual(compare_results([slower], [timed], tolerance=0.6), [])
+
+        longer = dict(result, lengths=[length + 2 for length in result["lengths"]])
+        self.assertEqual(len(compare_results([longer], [result])), 5)
+
+    def test_solution_cache(self):
+        random.seed(14)
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = SolutionCache(os.path.join(tmp, "cache.sqlite"), max_entries=60)
+            state = self.generate_random_test_case(steps=40).state
+            solution = AStar(TilesNode(state=state), heuristic, cache=cache)
+            self.assertEqual(len(cache), len(solution))
+            self.assertEqual(cache.distance(solution[3]), len(solution) - 4)
+            boards = [solution[3].board, solution[0].board + 1]
+            self.assertEqual(cache.distances(solution[3].geometry, boards), {boards[0]: len(solution) - 4})
+            self.assertEqual(cache.distances(get_geometry(3), [solution[3].board & 0xffff]), {})
+            # answered again from memory, a miss included
+            self.assertEqual(cache.distances(solution[3].geometry, boards), {boards[0]: len(solution) - 4})
+
+            # the root and every state on its solution are answered from the cache
+            cached = AStar(TilesNode(state=state), heuristic, cache=cache)
+            self.assertEqual([node.state for node in cached], [node.state for node in solution])
+            suffix = AStar(TilesNode(state=solution[5].state), heuristic, cache=cache)
+            self.assertEqual(len(suffix), len(solution) - 5)
+
+            # a board one move away from a cached state reuses its suffix
+            near = [
+                child
+                for i in range(1, len(solution) - 1)
+                for child in solution[i].get_children()
+                if child not in (solution[i - 1], solution[i + 1])
+            ][0]
+            expected = len(AStar(TilesNode(state=near.state), heuristic))
+            found = AStar(TilesNode(state=near.state), heuristic, cache=cache)
+            self.assertEqual(len(found), expected)
+            self.assertTrue(found[-1].is_goal())
+
+            # least recently used states are evicted beyond max_entries
+            for _ in range(3):
+                AStar(self.generate_random_test_case(steps=40), heuristic, cache=cache)
+            self.assertLessEqual(len(cache), 60)
+            cache.close()
+
+            # worker processes each open the file once and record what they solve
+            cache = SolutionCache(os.path.join(tmp, "shared.sqlite"))
+            states = [self.generate_random_test_case(steps=20).state for _ in range(4)]
+            results = list(solve_batch(states, workers=2, cache=cache))
+            self.assertEqual([result["status"] for result in results], ["solved"] * 4)
+            self.assertGreater(len(cache), 0)
+            cache.close()
+
     def test_node_equality(self):
         node1 = TilesNode(
             state=[[1, 2, 3, 4], [5, 6, 7, 8], [
@@ -247,6 +570,67 @@ class TestFifteensPuzzle(unittest.TestCase):
                 + str(child.state),
             )
 
+        # every named heuristic, on the 15 puzzle and on other board sizes
+        random.seed(17)
+        for geometry in (get_geometry(4), get_geometry(3), get_geometry(3, 4)):
+            goal = TilesNode.from_board(geometry.goal_board, geometry.cells - 1, geometry=geometry)
+            manhattan = ManhattanDistance(geometry=geometry)
+            for name in HEURISTICS:
+                h = get_heuristic(name, geometry)
+                self.assertEqual(h(goal), 0, name)
+                self.assertEqual(pickle.loads(pickle.dumps(h))(goal), 0, name)
+
+            for _ in range(4):
+                node = goal
+                for _ in range(40):
+                    node = random.choice(node.get_children())
+                root = TilesNode.from_board(node.board, node.blank, geometry=geometry)
+                optimal = len(AStar(root, manhattan)) - 1
+                for name in HEURISTICS:
+                    h = get_heuristic(name, geometry)
+                    # admissible, and at least as informed as Manhattan distance
+                    self.assertLessEqual(h(root), optimal, name)
+                    if name == "linear-conflict":
+                        self.assertGreaterEqual(h(root), manhattan(root))
+                    # consistent: |h(n) - h(n')| <= cost(n, n') = 1 along a random walk
+                    walk = root
+                    for _ in range(30):
+                        child = random.choice(walk.get_children())
+                        self.assertLessEqual(abs(h(walk) - h(child)), 1, name)
+                        walk = child
+
+                # optimal solutions whichever heuristic is used, searched by name
+                for name in HEURISTICS:
+                    solution = AStar(TilesNode.from_board(node.board, node.blank, geometry=geometry), name)
+                    self.assertEqual(len(solution) - 1, optimal, name)
+                    self.assertEqual(solution[-1].board, geometry.goal_board)
+
+        with self.assertRaises(ValueError):
+            get_heuristic("euclidean")
+
+    def test_stronger_heuristics_expand_less(self):
+        random.seed(5)
+        expanded = dict.fromkeys(HEURISTICS, 0)
+        for _ in range(8):
+            node = self.generate_random_test_case(steps=80)
+            for name in HEURISTICS:
+                stats = SearchStats()
+                AStar(TilesNode(state=node.state), name, stats=stats)
+                expanded[name] += stats.expanded
+        self.assertLess(expanded["linear-conflict"] * 2, expanded["manhattan"])
+        self.assertLess(expanded["walking-distance"] * 2, expanded["manhattan"])
+
+    def test_heuristic_incremental_update(self):
+        random.seed(7)
+        node = TilesNode(state=self.goal_state)
+        node.h = heuristic(node)
+        for _ in range(50):
+            child = random.choice(node.get_children())
+            tile = child.state[node.blank // 4][node.blank % 4]
+            child.h = heuristic.update(node.h, tile, child.blank, node.blank)
+            self.assertEqual(child.h, heuristic(child))
+            node = child
+
     def test_solution_validity(self):
         random.seed(42)  # Seed the random number generator
         for i in range(10):
@@ -287,3 +671,225 @@ class TestFifteensPuzzle(unittest.TestCase):
                         if (x, y) != current_zero_pos and (x, y) != next_zero_pos:
                             self.assertEqual(
                                 current_state[x][y], next_state[x][y])
+
+
+class TestPatternDatabase(unittest.TestCase):
+    # small patterns so the tables build in well under a second
+    partition = ((1, 2, 5), (3, 4, 8))
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "small.tpdb")
+        build_pattern_database(self.path, self.partition)
+        self.pdb = PatternDatabase(self.path)
+
+    def tearDown(self):
+        self.pdb.close()
+        self.tmp.cleanup()
+
+    def test_rank_roundtrip(self):
+        for index in (0, 1, 1234, 3359):
+            self.assertEqual(rank(unrank(index, 3)), index)
+
+    def test_partition_and_goal(self):
+        self.assertEqual(self.pdb.partition, list(self.partition))
+        goal_node = TilesNode(state=GOAL_STATE)
+        self.assertEqual(self.pdb(goal_node), 0)
+
+    def test_admissible_and_consistent(self):
+        random.seed(11)
+        for _ in range(5):
+            node = TestFifteensPuzzle.generate_random_test_case(steps=40)
+            root = TilesNode(state=node.state)
+            optimal = len(IDAStar(root, heuristic)) - 1
+            self.assertLessEqual(self.pdb(root), optimal)
+            for child in root.get_children():
+                self.assertLessEqual(abs(self.pdb(root) - self.pdb(child)), 1)
+
+            solution = AStar(TilesNode(state=node.state), self.pdb)
+            self.assertEqual(len(solution) - 1, optimal)
+
+    def test_other_board_size(self):
+        eight = get_geometry(3)
+        path = os.path.join(self.tmp.name, "eight.tpdb")
+        build_pattern_database(path, ((1, 2, 3, 4), (5, 6, 7, 8)), eight)
+        pdb = PatternDatabase(path)
+        self.assertIs(pdb.geometry, eight)
+
+        state = [[8, 6, 7], [2, 5, 4], [3, 0, 1]]
+        optimal = len(AStar(TilesNode(state=state), ManhattanDistance(geometry=eight)))
+        self.assertEqual(len(AStar(TilesNode(state=state), pdb)), optimal)
+        with self.assertRaises(ValueError):
+            pdb(TilesNode(state=GOAL_STATE))
+        pdb.close()
+
+    def test_rejects_overlapping_patterns(self):
+        with self.assertRaises(ValueError):
+            build_pattern_database(self.path, ((1, 2), (2, 3)))
+
+
+class TestGeometry(unittest.TestCase):
+    @staticmethod
+    def scramble(geometry, steps):
+        node = TilesNode(state=geometry.goal_state)
+        for _ in range(steps):
+            node = random.choice(node.get_children())
+        return TilesNode(state=node.state)
+
+    def test_goal_and_neighbours(self):
+        eight = get_geometry(3)
+        self.assertEqual(eight.goal_state, [[1, 2, 3], [4, 5, 6], [7, 8, 0]])
+        self.assertEqual(eight.neighbours[4], (3, 5, 1, 7))
+        self.assertEqual(get_geometry(3, 3), eight)
+        self.assertIs(TilesNode(state=[[1, 2, 3], [4, 5, 6], [7, 8, 0]]).geometry, eight)
+        self.assertTrue(TilesNode(state=eight.goal_state).is_goal())
+
+        # a 24 puzzle board needs 5 bits per cell
+        node = TilesNode(state=get_geometry(5).goal_state)
+        self.assertEqual(len(node.get_children()), 2)
+        for child in node.get_children():
+            self.assertEqual(child.geometry.bits, 5)
+            self.assertEqual(sorted(t for row in child.state for t in row), list(range(25)))
+
+    def test_is_solvable(self):
+        # the blank one row above its goal row flips the inversion parity on even widths
+        node = TilesNode(state=[[1, 2, 3, 4], [5, 6, 7, 8], [9, 10, 11, 0], [13, 14, 15, 12]])
+        self.assertTrue(node.is_solvable())
+        self.assertFalse(TilesNode(state=[[2, 1, 3], [4, 5, 6], [7, 8, 0]]).is_solvable())
+        self.assertFalse(
+            TilesNode(state=[[1, 2, 3, 4], [5, 6, 7, 8], [9, 10, 11, 0], [13, 15, 14, 12]]).is_solvable())
+
+        random.seed(6)
+        for rows, cols in ((2, 2), (3, 3), (3, 4), (4, 4), (5, 5), (6, 6)):
+            for _ in range(5):
+                node = self.scramble(get_geometry(rows, cols), 50)
+                self.assertTrue(node.is_solvable())
+                # swapping two tiles makes any board unsolvable
+                tiles = [tile for row in node.state for tile in row]
+                i, j = random.sample([cell for cell, tile in enumerate(tiles) if tile], 2)
+                tiles[i], tiles[j] = tiles[j], tiles[i]
+                self.assertFalse(node.geometry.is_solvable(node.geometry.pack([tiles])))
+
+    @unittest.skipUnless(numpy, "numpy is not installed")
+    def test_is_solvable_batch(self):
+        random.seed(11)
+        for rows, cols in ((3, 3), (3, 4), (4, 4)):
+            geometry = get_geometry(rows, cols)
+            boards = []
+            for _ in range(50):
+                tiles = list(range(geometry.cells))
+                random.shuffle(tiles)
+                boards.append(tiles)
+            expected = [geometry.is_solvable(geometry.pack([tiles])) for tiles in boards]
+            self.assertEqual(list(geometry.is_solvable_batch(boards, chunk=16)), expected)
+
+        # rows that are not permutations are never solvable
+        boards = [list(range(1, 16)) + [0], [0] * 16, list(range(1, 16)) + [16]]
+        self.assertEqual(list(get_geometry(4).is_solvable_batch(boards)), [True, False, False])
+        with self.assertRaises(InvalidPuzzleError):
+            get_geometry(4).is_solvable_batch([list(range(9))])
+
+    def test_validation(self):
+        for state in ([], [[1, 2], [3]], [[1, 2, 3], [4, 5, 6], [7, 8, 8]], [[1, 2, 3], [4, 5, 6], [7, 8, 9]],
+                      [[1, 2], [3, "0"]], [[0]]):
+            with self.assertRaises(InvalidPuzzleError):
+                validate_state(state)
+        with self.assertRaises(InvalidPuzzleError):
+            validate_state(get_geometry(3).goal_state, get_geometry(4))
+        self.assertIs(validate_state(get_geometry(3, 4).goal_state), get_geometry(3, 4))
+
+        # every solver rejects bad roots up front instead of searching
+        unsolvable = TilesNode(state=[[2, 1, 3], [4, 5, 6], [7, 8, 0]])
+        duplicate = TilesNode(state=[[1, 1, 3], [4, 5, 6], [7, 8, 0]])
+        manhattan = ManhattanDistance(geometry=get_geometry(3))
+        for solver in (AStar, IDAStar, MM, AnytimeAStar):
+            with self.assertRaises(UnsolvablePuzzleError):
+                solver(unsolvable, manhattan)
+            with self.assertRaises(InvalidPuzzleError):
+                solver(duplicate, manhattan)
+
+        results = list(solve_batch([[[2, 1, 3], [4, 5, 6], [7, 8, 0]], [[1, 2], [3, 3]], [[1, 2], [0, 3]]], workers=1))
+        self.assertEqual([r["status"] for r in results], ["unsolvable", "invalid", "solved"])
+        self.assertIn("error", results[1])
+
+    def test_solvers_on_other_sizes(self):
+        random.seed(8)
+        for rows, cols in ((3, 3), (3, 4), (5, 5)):
+            geometry = get_geometry(rows, cols)
+            manhattan = ManhattanDistance(geometry=geometry)
+            for _ in range(3):
+                state = self.scramble(geometry, 16).state
+                lengths = set()
+                for solver in (AStar, IDAStar, MM):
+                    solution = solver(TilesNode(state=state), manhattan)
+                    self.assertTrue(solution[-1].is_goal())
+                    self.assertEqual(len(path_to_moves(solution)), len(solution) - 1)
+                    lengths.add(len(solution))
+                self.assertEqual(len(lengths), 1)
+
+        with self.assertRaises(ValueError):
+            AStar(TilesNode(state=[[1, 2, 3], [4, 5, 6], [7, 8, 0]]), heuristic)
+
+
+@unittest.skipUnless(numpy, "numpy is not installed")
+class TestBatched(unittest.TestCase):
+    def test_batch_astar(self):
+        from batched import BatchAStar
+
+        random.seed(14)
+        for rows, cols in ((3, 3), (3, 4), (4, 4)):
+            geometry = get_geometry(rows, cols)
+            manhattan = ManhattanDistance(geometry=geometry)
+            for _ in range(3):
+                state = TestGeometry.scramble(geometry, 40).state
+                stats = SearchStats()
+                # a small block size makes the search take many blocks
+                solution = BatchAStar(TilesNode(state=state), manhattan, block_size=16, stats=stats)
+                self.assertTrue(solution[-1].is_goal())
+                self.assertEqual(len(solution), len(AStar(TilesNode(state=state), manhattan)))
+                nodes = list(solution)
+                for parent, child in zip(nodes, nodes[1:]):
+                    self.assertIn(child, parent.get_children())
+                    self.assertIs(child.parent, parent)
+                self.assertGreater(stats.expanded, 0)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "small.tpdb")
+            build_pattern_database(path, TestPatternDatabase.partition)
+            pdb = PatternDatabase(path)
+            state = TestGeometry.scramble(get_geometry(4), 30).state
+            self.assertEqual(len(BatchAStar(TilesNode(state=state), pdb)),
+                             len(AStar(TilesNode(state=state), heuristic)))
+            pdb.close()
+
+        with self.assertRaises(ValueError):
+            BatchAStar(TilesNode(state=get_geometry(5).goal_state), ManhattanDistance(geometry=get_geometry(5)))
+
+    def test_state_table(self):
+        from batched import EMPTY, StateTable
+
+        table = StateTable(capacity=16)
+        keys = numpy.arange(1000, dtype=numpy.uint64) * numpy.uint64(7919)
+        parents = numpy.full(1000, EMPTY, dtype=numpy.uint64)
+        self.assertTrue(table.insert(keys, numpy.full(1000, 5), parents).all())
+        self.assertEqual(len(table), 1000)
+
+        # only a smaller g replaces an entry
+        g = numpy.where(keys % numpy.uint64(2) == 0, 3, 7)
+        improved = table.insert(keys, g, keys)
+        self.assertEqual(list(improved), list(g == 3))
+        slots = table.find(keys)
+        self.assertEqual(list(table.g[slots]), list(numpy.minimum(g, 5)))
+        self.assertEqual(list(table.find(numpy.array([1, 2], dtype=numpy.uint64))), [-1, -1])
+
+    def test_pattern_table(self):
+        from batched import build_pattern_table_batched, rank_batch, unrank_batch
+        from patterndb import build_pattern_table, table_size
+
+        index = numpy.arange(table_size(3, 16))
+        cells = unrank_batch(index, 3, 16)
+        self.assertEqual(list(rank_batch(cells, 16)), list(index))
+        self.assertEqual(list(cells[1234]), unrank(1234, 3))
+
+        for pattern, geometry in (((1, 2, 5), get_geometry(4)), ((1, 2, 3, 4), get_geometry(3))):
+            self.assertEqual(build_pattern_table_batched(pattern, geometry), build_pattern_table(pattern, geometry))
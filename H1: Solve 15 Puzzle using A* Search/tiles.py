@@ -1,104 +1,239 @@
-from copy import deepcopy
+from collections.abc import Sequence
+from functools import lru_cache
 
-# need TilesNode.is_goal
-# need TilesNode.generate_children
 
+# raised for boards that are not a permutation of the tiles of their size
+class InvalidPuzzleError(ValueError):
+    pass
 
-class TilesNode:
 
-    def __init__(self, state, parent=None,):
-        self.state = state
-        self.parent = parent
+# raised for valid boards that can never reach the goal
+class UnsolvablePuzzleError(InvalidPuzzleError):
+    pass
 
-    def is_goal(self) -> bool:
 
-        return self.state == [[1, 2, 3, 4], [5, 6, 7, 8], [9, 10, 11, 12], [13, 14, 15, 0]]
+class Geometry:
+    """Board size and the tables derived from it, computed once per size.
 
-    def find_empty_space(self) -> tuple[int, int]:
+    Use get_geometry(rows, cols) rather than the constructor so every node of the same
+    size shares one instance.
 
-        for i, row in enumerate(self.state):
-            for j, col in enumerate(row):
-                if col == 0:
-                    return i, j
+    Parameters
+    ----------
+    rows : int
+        Number of rows of the board.
 
-    def swap_tiles(self, row1, col1, row2, col2):
+    cols : int
+        Number of columns of the board.
 
-        new_state = deepcopy(self.state)
-        new_state[row1][col1], new_state[row2][col2] = (
-            new_state[row2][col2],
-            new_state[row1][col1],
+    Boards are packed into a single int with one fixed-width field per cell; cell k
+    (row-major, k = row * cols + col) lives in bits bits * k .. bits * k + bits - 1.
+    """
+
+    def __init__(self, rows: int, cols: int):
+        if rows < 2 or cols < 2:
+            raise ValueError("boards need at least 2 rows and 2 columns")
+        self.rows = rows
+        self.cols = cols
+        self.cells = rows * cols
+        # 4 bits per cell for the 15 puzzle, wider fields for bigger boards
+        self.bits = max(4, (self.cells - 1).bit_length())
+        self.mask = (1 << self.bits) - 1
+
+        # cells the empty space can move to from each cell, in (left, right, up, down) order
+        self.neighbours = tuple(
+            tuple(
+                (row + move_row) * cols + (col + move_col)
+                for move_row, move_col in ((0, -1), (0, 1), (-1, 0), (1, 0))
+                if 0 <= row + move_row < rows and 0 <= col + move_col < cols
+            )
+            for row in range(rows)
+            for col in range(cols)
         )
-        return new_state
 
-    def generate_children(self) -> list["TilesNode"]:
+        # tiles 1 .. cells - 1 in order, the empty space in the bottom right cell
+        self.goal_state = [
+            [(row * cols + col + 1) % self.cells for col in range(cols)] for row in range(rows)
+        ]
+        self.goal_board = self.pack(self.goal_state)
 
-        children = []
+        # distance[tile][cell] is the Manhattan distance of tile at cell from its goal cell
+        # the empty space (tile 0) is not counted, so its row is all zeros
+        self.distance = tuple(
+            tuple(0 if tile == 0 else self.cell_distance(cell, tile - 1) for cell in range(self.cells))
+            for tile in range(self.cells)
+        )
 
-        empty_row, empty_col = self.find_empty_space()
+        # letter for each direction the empty space can move, keyed by the change in its cell index
+        self.moves = {-1: "L", 1: "R", -cols: "U", cols: "D"}
+        self.deltas = {letter: delta for delta, letter in self.moves.items()}
+
+    # Manhattan distance between two cells
+    def cell_distance(self, a: int, b: int) -> int:
+        return abs(a // self.cols - b // self.cols) + abs(a % self.cols - b % self.cols)
+
+    # packs a list of lists of tiles into a single int
+    def pack(self, state) -> int:
+        bits = self.bits
+        board = 0
+        for k, tile in enumerate(tile for row in state for tile in row):
+            board |= tile << (bits * k)
+        return board
+
+    # unpacks an int board back into the list of lists representation
+    def unpack(self, board: int) -> list[list[int]]:
+        bits, mask, cols = self.bits, self.mask, self.cols
+        return [
+            [(board >> (bits * (row * cols + col))) & mask for col in range(cols)]
+            for row in range(self.rows)
+        ]
 
-        # left move
-        if empty_col > 0:
-            new_state = self.swap_tiles(
-                empty_row, empty_col, empty_row, empty_col - 1)
-            children.append(TilesNode(state=new_state, parent=self))
+    # tiles of a packed board in cell order
+    def tiles(self, board: int) -> list[int]:
+        bits, mask = self.bits, self.mask
+        return [(board >> (bits * cell)) & mask for cell in range(self.cells)]
+
+    # checks if a board (a permutation of the tiles) can reach the goal
+    # every move swaps the empty space with a tile, flipping the parity of the board as a
+    # permutation of the goal and of the empty space's distance from its goal cell, so
+    # the board is solvable exactly when the two parities match. for the 15 puzzle this
+    # is the usual rule: inversions plus rows between the empty space and the bottom row
+    # must be even (inversions alone on odd widths). O(cells), by counting cycles
+    def is_solvable(self, board: int) -> bool:
+        cells = self.cells
+        # goal cell of the tile at each cell, the empty space belongs in the last cell
+        target = [(tile - 1) % cells for tile in self.tiles(board)]
+        blank = target.index(cells - 1)
+
+        seen = [False] * cells
+        cycles = 0
+        for start in range(cells):
+            if not seen[start]:
+                cycles += 1
+                cell = start
+                while not seen[cell]:
+                    seen[cell] = True
+                    cell = target[cell]
+
+        return (cells - cycles) % 2 == self.cell_distance(blank, cells - 1) % 2
+
+    # vectorised is_solvable for many boards at once, needs numpy
+    # boards is an (n, cells) integer array of tiles in cell order (a list of flat boards
+    # works too); returns an (n,) bool array, False for rows that are not a permutation
+    # of 0 .. cells - 1. rows are processed in chunks to bound temporary memory
+    def is_solvable_batch(self, boards, chunk: int = 65536):
+        import numpy as np
+
+        cells = self.cells
+        boards = np.asarray(boards)
+        if boards.ndim != 2 or boards.shape[1] != cells:
+            raise InvalidPuzzleError("expected an (n, %d) array of boards" % cells)
+
+        # every pair of cells i < j, the permutation parity is the inversion count parity
+        first, second = np.triu_indices(cells, k=1)
+        rows, cols = self.rows, self.cols
+        solvable = np.zeros(len(boards), dtype=bool)
+        for begin in range(0, len(boards), chunk):
+            block = boards[begin:begin + chunk].astype(np.int64)
+            valid = (np.sort(block, axis=1) == np.arange(cells)).all(axis=1)
+
+            # goal cell of the tile at each cell, as in is_solvable
+            target = (block - 1) % cells
+            inversions = (target[:, first] > target[:, second]).sum(axis=1)
+
+            blank = np.argmax(block == 0, axis=1)
+            distance = (rows - 1 - blank // cols) + (cols - 1 - blank % cols)
+            solvable[begin:begin + chunk] = valid & ((inversions + distance) % 2 == 0)
+        return solvable
 
-        # right move
-        if empty_col < 3:
-            new_state = self.swap_tiles(
-                empty_row, empty_col, empty_row, empty_col + 1)
-            children.append(TilesNode(state=new_state, parent=self))
+    def __repr__(self) -> str:
+        return "get_geometry(%d, %d)" % (self.rows, self.cols)
 
-        # move up
-        if empty_row > 0:
-            new_state = self.swap_tiles(
-                empty_row, empty_col, empty_row - 1, empty_col)
-            children.append(TilesNode(state=new_state, parent=self))
+    # one instance per size, so unpickling returns the shared instance
+    def __reduce__(self):
+        return get_geometry, (self.rows, self.cols)
 
-        # move down
-        if empty_row < 3:
-            new_state = self.swap_tiles(
-                empty_row, empty_col, empty_row + 1, empty_col)
-            children.append(TilesNode(state=new_state, parent=self))
 
-        return children
+# shared Geometry for a rows x cols board, square when cols is omitted
+def get_geometry(rows: int, cols: int = None) -> Geometry:
+    return _cached_geometry(rows, rows if cols is None else cols)
 
-    def __str__(self):
-        return "\n".join(" ".join(map(str, row)) for row in self.state)
 
-    def __repr__(self) -> str:
-        return self.__str__()
+@lru_cache(maxsize=None)
+def _cached_geometry(rows: int, cols: int) -> Geometry:
+    return Geometry(rows, cols)
 
-    def get_path(self) -> list["TilesNode"]:
 
-        path = []
-        current_node = self
-        while current_node:
-            path.append(current_node)
-            current_node = current_node.parent
-        return path[::-1]
+# the 15 puzzle, the default everywhere a geometry is optional
+FIFTEEN = get_geometry(4, 4)
 
-    def __eq__(self, other):
-        if isinstance(other, TilesNode):
-            return self.state == other.state
-        return False
+# tables of the 15 puzzle, kept as module constants
+SIZE = FIFTEEN.cols
+CELLS = FIFTEEN.cells
+BITS = FIFTEEN.bits
+MASK = FIFTEEN.mask
+NEIGHBOURS = FIFTEEN.neighbours
+GOAL_STATE = FIFTEEN.goal_state
+GOAL_BOARD = FIFTEEN.goal_board
+MOVES = FIFTEEN.moves
 
-    def __hash__(self):
-        return hash(tuple(map(tuple, self.state)))
 
-    def is_solvable(self):
+# checks that state is a rectangular list of rows holding each tile of its size exactly
+# once (and that it has geometry's size, if given), returns its geometry
+# raises InvalidPuzzleError otherwise, so untrusted input never reaches a solver
+def validate_state(state, geometry: Geometry = None) -> Geometry:
+    if not isinstance(state, (list, tuple)) or not state or not all(isinstance(row, (list, tuple)) for row in state):
+        raise InvalidPuzzleError("a board must be a non-empty list of rows")
+    rows, cols = len(state), len(state[0])
+    if any(len(row) != cols for row in state):
+        raise InvalidPuzzleError("all rows of a board must have the same length")
+    if rows < 2 or cols < 2:
+        raise InvalidPuzzleError("a board needs at least 2 rows and 2 columns, got %dx%d" % (rows, cols))
+    if geometry is not None and (rows, cols) != (geometry.rows, geometry.cols):
+        raise InvalidPuzzleError("expected a %dx%d board, got %dx%d" % (geometry.rows, geometry.cols, rows, cols))
+
+    tiles = [tile for row in state for tile in row]
+    if not all(type(tile) is int for tile in tiles) or sorted(tiles) != list(range(rows * cols)):
+        raise InvalidPuzzleError("a %dx%d board must hold each of the tiles 0 to %d once" % (rows, cols, rows * cols - 1))
+    return get_geometry(rows, cols)
+
+
+# packs a list of lists of tiles into a single int, 15 puzzle unless geometry is given
+def pack_state(state, geometry: Geometry = FIFTEEN) -> int:
+    return geometry.pack(state)
+
+
+# unpacks an int board back into the list of lists representation
+def unpack_state(board: int, geometry: Geometry = FIFTEEN) -> list[list[int]]:
+    return geometry.unpack(board)
+
+
+# describes a path of nodes as the moves of the empty space, e.g. "RRDL"
+def path_to_moves(path) -> str:
+    if isinstance(path, Path):
+        return path.moves
+    if not path:
+        return ""
+    moves = path[0].geometry.moves
+    return "".join(moves[child.blank - node.blank] for node, child in zip(path, path[1:]))
 
-        flat_state = [tile for row in self.state for tile in row if tile != 0]
 
-        inversions = 0
-        for i in range(len(flat_state)):
-            for j in range(i + 1, len(flat_state)):
-                if flat_state[i] > flat_state[j]:
-                    inversions += 1
+# move letters in the order of their 2 bit codes
+MOVE_CODES = "LRUD"
 
-        return inversions % 2 == 0
 
+# packs a move string into bytes, 2 bits per move after a 4 byte little endian length
+def pack_moves(moves: str) -> bytes:
+    packed = bytearray((len(moves) + 3) // 4)
+    for i, move in enumerate(moves):
+        packed[i >> 2] |= MOVE_CODES.index(move) << (2 * (i & 3))
+    return len(moves).to_bytes(4, "little") + bytes(packed)
 
-# START HERE
+
+# inverse of pack_moves
+def unpack_moves(data: bytes) -> str:
+    length = int.from_bytes(data[:4], "little")
+    return "".join(MOVE_CODES[(data[4 + (i >> 2)] >> (2 * (i & 3))) & 3] for i in range(length))
 
 
 class TilesNode:
@@ -113,8 +248,21 @@ class TilesNode:
 
     parent : Node, optional
         The parent node of the current node. The default is None.
+
+    geometry : Geometry, optional
+        The board size. The default is taken from the shape of state, so other
+        sizes (8, 24, 35 puzzle...) only need a state of that shape.
+
+    Internally the board is stored as a single int (see Geometry) together with
+    the cell index of the empty space, so moves, hashing and equality are all
+    integer operations. The list of lists is only rebuilt when .state is read.
+
+    .h holds the node's heuristic value once a search has scored it, so children
+    can be scored incrementally from their parent (see astar.ManhattanDistance).
     """
 
+    __slots__ = ("board", "blank", "parent", "h", "geometry")
+
     # init method: class constructor method and initilizes TilesNode object
     def __init__(
         self,
@@ -125,21 +273,46 @@ class TilesNode:
 
         # optional specification of parent node of current node
         parent=None,
+
+        # optional board size, inferred from state
+        geometry=None,
     ):
+        if geometry is None:
+            geometry = get_geometry(len(state), len(state[0]))
+        self.geometry = geometry
         self.state = state
         self.parent = parent
 
-        # checks if current puzzle node is goal node, 4x4 grid
+        # heuristic value carried by the node, filled in by the search
+        self.h = None
+
+        # builds a node straight from a packed board, skips packing the list of lists
+        # geometry defaults to the parent's, or the 15 puzzle without a parent
+    @classmethod
+    def from_board(cls, board: int, blank: int, parent=None, geometry=None) -> "TilesNode":
+        node = cls.__new__(cls)
+        node.board = board
+        node.blank = blank
+        node.parent = parent
+        node.h = None
+        if geometry is None:
+            geometry = FIFTEEN if parent is None else parent.geometry
+        node.geometry = geometry
+        return node
+
+        # 2D list rep of the packed board
+    @property
+    def state(self) -> list[list[int]]:
+        return self.geometry.unpack(self.board)
+
+    @state.setter
+    def state(self, state):
+        self.board = self.geometry.pack(state)
+        self.blank = [tile for row in state for tile in row].index(0)
+
+        # checks if current puzzle node is goal node
     def is_goal(self) -> bool:
-        goal_state = [
-            [1, 2, 3, 4],
-            [5, 6, 7, 8],
-            [9, 10, 11, 12],
-            [13, 14, 15, 0]
-        ]
-
-        # check if every index in self matches to the goal state
-        return all(self.state[i][j] == goal_state[i][j] for i in range(len(self.state)) for j in range(len(self.state[i])))
+        return self.board == self.geometry.goal_board
 
         # finds rows and column indices of 0 of current puzzle node
     def find_empty_space(self) -> tuple[int, int]:
@@ -155,10 +328,7 @@ class TilesNode:
         empty_col : int
             The column index of the empty space.
         """
-        for i, row in enumerate(self.state):
-            for j, col in enumerate(row):
-                if col == 0:
-                    return i, j
+        return divmod(self.blank, self.geometry.cols)
 
         # creates new puzzle node by swapping two tile positions
     def swap_tiles(self, row1, col1, row2, col2):
@@ -168,7 +338,7 @@ class TilesNode:
         You don't need to use this function, but it may be helpful.
 
         """
-        new_state = deepcopy(self.state)
+        new_state = self.state
         new_state[row1][col1], new_state[row2][col2] = (
             new_state[row2][col2],
             new_state[row1][col1],
@@ -178,24 +348,33 @@ class TilesNode:
         # genrates and returns list of child nodes (new puzzle nodes) reachable from current node by moving tiles
     def get_children(self) -> list["TilesNode"]:
         children = []
-        empty_row, empty_col = self.find_empty_space()
-
-        # valid movies (left, right, up, down)
-        possible_moves = [(0, -1), (0, 1), (-1, 0), (1, 0)]
-
-        for move_row, move_col in possible_moves:
-            new_row, new_col = empty_row + move_row, empty_col + move_col
-
-            # Check if the new position is within bounds
-            if 0 <= new_row < len(self.state) and 0 <= new_col < len(self.state[0]):
-                # Create a new state by swapping the empty space with the adjacent tile
-                new_state = self.swap_tiles(
-                    empty_row, empty_col, new_row, new_col)
-                new_child = TilesNode(new_state, parent=self)
-                children.append(new_child)
+        board = self.board
+        blank = self.blank
+        geometry = self.geometry
+        bits = geometry.bits
+        mask = geometry.mask
+        from_board = TilesNode.from_board
+
+        # valid moves (left, right, up, down) are precomputed in geometry.neighbours
+        for cell in geometry.neighbours[blank]:
+            # the tile at cell slides into the empty space, which is 0 in the board
+            tile = (board >> (bits * cell)) & mask
+            new_board = board + (tile << (bits * blank)) - (tile << (bits * cell))
+            children.append(from_board(new_board, cell, self, geometry))
 
         return children
 
+        # the child reached by moving the empty space in direction move ("L", "R", "U" or "D")
+    def apply_move(self, move: str) -> "TilesNode":
+        geometry = self.geometry
+        cell = self.blank + geometry.deltas[move]
+        if cell not in geometry.neighbours[self.blank]:
+            raise ValueError("the empty space cannot move %s from cell %d" % (move, self.blank))
+        bits = geometry.bits
+        tile = (self.board >> (bits * cell)) & geometry.mask
+        board = self.board + (tile << (bits * self.blank)) - (tile << (bits * cell))
+        return TilesNode.from_board(board, cell, self, geometry)
+
         # string rep of puzzle node, easily reps node
 
     def __str__(self):
@@ -204,8 +383,9 @@ class TilesNode:
     def __repr__(self) -> str:
         return self.__str__()
 
-        # backtracks from goal to initial node, returns list of TilesNode objects rep path of puzzle nodes leading to goal
-    def get_path(self) -> list["TilesNode"]:
+        # backtracks from goal to initial node, returns a Path of puzzle nodes leading to goal
+        # the path keeps the first node and the moves, the nodes in between are rebuilt as they are read
+    def get_path(self) -> "Path":
         """
         Once a goal node is found, this function can be used to backtrack.
 
@@ -213,38 +393,114 @@ class TilesNode:
 
         You don't need to use this function, but it may be helpful.
         """
-        path = []
+        moves = []
         current_node = self
-        while current_node:
-            path.append(current_node)
+        while current_node.parent is not None:
+            moves.append(self.geometry.moves[current_node.blank - current_node.parent.blank])
             current_node = current_node.parent
-        return path[::-1]
+        return Path(current_node, "".join(reversed(moves)))
 
         # compares 2 TilesNode objects for equality
     def __eq__(self, other):
         if isinstance(other, TilesNode):
-            return self.state == other.state
+            return self.board == other.board and self.geometry is other.geometry
         return False
 
         # generates hash value for TilesNode based on node
     def __hash__(self):
-        return hash(tuple(map(tuple, self.state)))
+        return hash(self.board)
 
         # checks if current puzzle node can be solved, based on number of inversions in puzzle
     def is_solvable(self):
         """
         Check if the current state is solvable.
-        In a solvable state, the number of inversions must be even.
+        On boards with an odd number of columns the number of inversions must be even.
+        On boards with an even number of columns the number of inversions plus the
+        number of rows between the empty space and the bottom row must be even.
 
         You don't need to use this function, but it may be helpful.
         """
-        flat_state = [tile for row in self.state for tile in row if tile != 0]
+        return self.geometry.is_solvable(self.board)
+
+        # raises InvalidPuzzleError unless the board is a permutation of its tiles and
+        # UnsolvablePuzzleError unless it can reach the goal, used by every solver on its root
+    def validate(self) -> None:
+        geometry = self.geometry
+        tiles = geometry.tiles(self.board)
+        if self.board >> (geometry.bits * geometry.cells) or sorted(tiles) != list(range(geometry.cells)):
+            raise InvalidPuzzleError(
+                "board is not a permutation of the tiles 0 to %d:\n%s" % (geometry.cells - 1, self))
+        if tiles[self.blank] != 0:
+            raise InvalidPuzzleError("blank position does not hold the empty space:\n%s" % self)
+        if not geometry.is_solvable(self.board):
+            raise UnsolvablePuzzleError("board cannot reach the goal:\n%s" % self)
+
+
+class Path(Sequence):
+    """A solution path stored as its first node and the moves of the empty space.
+
+    The nodes after the first are rebuilt from the moves as they are read, each linked
+    to the one before through .parent, so a path costs one node and one letter per move
+    however long it is. Reading the nodes in order (iterating, or indexing with
+    increasing indexes) replays each move once.
+
+    Parameters
+    ----------
+    root : TilesNode
+        The first node of the path.
 
-        inversions = 0
-        for i in range(len(flat_state)):
-            for j in range(i + 1, len(flat_state)):
-                if flat_state[i] > flat_state[j]:
-                    inversions += 1
+    moves : str, optional
+        One of "L", "R", "U" and "D" per move of the empty space. The default is "",
+        a path of root alone.
+    """
+
+    __slots__ = ("root", "moves", "_cursor")
+
+    def __init__(self, root: TilesNode, moves: str = ""):
+        self.root = root
+        self.moves = moves
+        # last node rebuilt and its index, indexing continues from it when it can
+        self._cursor = (0, root)
+
+    def __len__(self) -> int:
+        return len(self.moves) + 1
+
+    def __iter__(self):
+        node = self.root
+        yield node
+        for move in self.moves:
+            node = node.apply_move(move)
+            yield node
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("path index out of range")
+
+        start, node = self._cursor
+        if index < start:
+            start, node = 0, self.root
+        for move in self.moves[start:index]:
+            node = node.apply_move(move)
+        self._cursor = (index, node)
+        return node
+
+    def __eq__(self, other):
+        if isinstance(other, Path):
+            return self.root == other.root and self.moves == other.moves
+        if isinstance(other, (list, tuple)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return "Path(%d moves: %s)" % (len(self.moves), self.moves)
 
-                # if number of inversions is even -> puzzle is solvable
-        return inversions % 2 == 0
+    # only the root's board and the moves are pickled, not the root's own parents
+    def __reduce__(self):
+        root = self.root
+        return Path, (TilesNode.from_board(root.board, root.blank, None, root.geometry), self.moves)
@@ -0,0 +1,334 @@
+# batched CPU inference for the Fashion-MNIST CNN, in float32 Keras or int8 TFLite
+#
+# classifier = Classifier("model.weights.h5")               # weights loaded once
+# labels, confidence = classifier.classify(images)          # any number of (28, 28) images at once
+#
+# batcher = AsyncClassifier(classifier)                     # gathers concurrent single-image requests
+# label, confidence = await batcher.classify(image)
+#
+# export_tflite(classifier.model, "model_int8.tflite")      # post-training int8 quantisation
+# classifier = TFLiteClassifier("model_int8.tflite")
+#
+# python classify.py --weights model.weights.h5 --tflite model_int8.tflite --benchmark
+#
+# classify() runs whole batches through one traced graph instead of paying model.predict's
+# per call setup for every image, which is what plot_random_image in the notebook does.
+# weights from cnn.train() expect pixels scaled by cnn.PIXEL_SCALE; the notebook's own
+# model.h5 was trained on raw 0-255 pixels and needs pixel_scale=1
+import argparse
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import tensorflow as tf
+
+from cnn import LABELS, PIXEL_SCALE, load_data, model_arch
+
+# images run through the model at once at most
+BATCH_SIZE = 256
+
+# AsyncClassifier: requests gathered into one batch, and seconds the first of them may wait
+MAX_GATHER = 32
+MAX_DELAY = 0.005
+
+# training images the int8 quantisation calibrates its ranges on
+CALIBRATION_IMAGES = 500
+
+
+# (n, 28, 28, 1) float32 pixels times pixel_scale, from one image or a batch, with or without channel axis
+def _as_batch(images, pixel_scale: float) -> np.ndarray:
+    images = np.asarray(images)
+    if images.ndim == 2 or (images.ndim == 3 and images.shape[-1] == 1 and images.shape[0] == 28):
+        images = images[np.newaxis]
+    if images.ndim == 3:
+        images = images[..., np.newaxis]
+    if images.shape[1:] != (28, 28, 1):
+        raise ValueError("expected 28x28 images, got shape %s" % (images.shape,))
+    return images.astype(np.float32) * np.float32(pixel_scale)
+
+
+class BatchClassifier:
+    """Classifies images in batches of at most batch_size, whatever runs the model.
+
+    Subclasses implement _probabilities(), the class probabilities of one prepared
+    float32 batch of (n, 28, 28, 1) images.
+
+    Parameters
+    ----------
+    pixel_scale : float, optional
+        Factor the pixels were scaled by in training. The default is cnn.PIXEL_SCALE.
+
+    batch_size : int, optional
+        Images run through the model at once at most. The default is BATCH_SIZE.
+    """
+
+    def __init__(self, pixel_scale: float = PIXEL_SCALE, batch_size: int = BATCH_SIZE):
+        self.pixel_scale = pixel_scale
+        self.batch_size = batch_size
+
+    def _probabilities(self, batch: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def probabilities(self, images) -> np.ndarray:
+        batch = _as_batch(images, self.pixel_scale)
+        out = np.empty((len(batch), len(LABELS)), dtype=np.float32)
+        for start in range(0, len(batch), self.batch_size):
+            out[start:start + self.batch_size] = self._probabilities(batch[start:start + self.batch_size])
+        return out
+
+    def classify(self, images) -> tuple[np.ndarray, np.ndarray]:
+        """(predicted class indices, their probabilities) of one image or a batch.
+
+        images are 28x28 pixels, uint8 or float, with or without a channel axis.
+        LABELS[i] names class i.
+        """
+        probabilities = self.probabilities(images)
+        labels = probabilities.argmax(axis=1)
+        return labels, probabilities[np.arange(len(labels)), labels]
+
+
+class Classifier(BatchClassifier):
+    """model_arch() with its trained weights, classifying batches of images.
+
+    Parameters
+    ----------
+    weights : str
+        Weights saved from model_arch(), e.g. by cnn.py or the notebook.
+
+    pixel_scale, batch_size : optional
+        As for BatchClassifier.
+    """
+
+    def __init__(self, weights: str, pixel_scale: float = PIXEL_SCALE, batch_size: int = BATCH_SIZE):
+        super().__init__(pixel_scale, batch_size)
+        self.model = model_arch()
+        self.model.load_weights(weights)
+        self._forward = tf.function(lambda x: self.model(x, training=False),
+                                    input_signature=[tf.TensorSpec((None, 28, 28, 1), tf.float32)])
+
+    def _probabilities(self, batch: np.ndarray) -> np.ndarray:
+        return self._forward(tf.constant(batch)).numpy()
+
+
+def export_tflite(model: tf.keras.Model, path: str, calibration=None, pixel_scale: float = PIXEL_SCALE,
+                  int8: bool = True) -> int:
+    """Convert a trained model to TFLite, post-training quantised to int8 by default.
+
+    calibration holds images to measure the activation ranges on, by default
+    CALIBRATION_IMAGES training images. With int8 the inputs and outputs are int8
+    too; TFLiteClassifier quantises and dequantises around them. Returns the size of
+    the written model in bytes.
+    """
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if int8:
+        if calibration is None:
+            (trainX, _), _ = load_data()
+            calibration = trainX[np.random.default_rng(0).choice(len(trainX), CALIBRATION_IMAGES, replace=False)]
+        calibration = _as_batch(calibration, pixel_scale)
+
+        def representative_dataset():
+            for image in calibration:
+                yield [image[np.newaxis]]
+
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        converter.inference_input_type = tf.int8
+        converter.inference_output_type = tf.int8
+    flatbuffer = converter.convert()
+    with open(path, "wb") as f:
+        f.write(flatbuffer)
+    return len(flatbuffer)
+
+
+class TFLiteClassifier(BatchClassifier):
+    """Classifier running a TFLite model, float32 or int8, with the same API.
+
+    Parameters
+    ----------
+    path : str
+        Model written by export_tflite().
+
+    pixel_scale, batch_size : optional
+        As for BatchClassifier.
+
+    threads : int, optional
+        Interpreter threads. The default lets TFLite choose.
+    """
+
+    def __init__(self, path: str, pixel_scale: float = PIXEL_SCALE, batch_size: int = BATCH_SIZE,
+                 threads: int = None):
+        super().__init__(pixel_scale, batch_size)
+        self.interpreter = tf.lite.Interpreter(model_path=path, num_threads=threads)
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self._rows = None
+
+    def _probabilities(self, batch: np.ndarray) -> np.ndarray:
+        interpreter = self.interpreter
+        if self._rows != len(batch):
+            interpreter.resize_tensor_input(self._input["index"], batch.shape)
+            interpreter.allocate_tensors()
+            self._rows = len(batch)
+
+        if self._input["dtype"] == np.int8:
+            scale, zero_point = self._input["quantization"]
+            batch = np.clip(np.round(batch / scale + zero_point), -128, 127).astype(np.int8)
+        interpreter.set_tensor(self._input["index"], batch)
+        interpreter.invoke()
+        out = interpreter.get_tensor(self._output["index"])
+        if self._output["dtype"] == np.int8:
+            scale, zero_point = self._output["quantization"]
+            out = (out.astype(np.float32) - zero_point) * scale
+        return out
+
+
+class AsyncClassifier:
+    """Gathers concurrent single-image requests into small batches.
+
+    A batch is run once max_gather requests are waiting, or max_delay seconds after
+    the first of them, in a worker thread so the event loop keeps accepting requests.
+    Batches run one at a time; a Classifier is not safe to call from several threads.
+
+    Parameters
+    ----------
+    classifier : BatchClassifier
+        A Classifier or TFLiteClassifier.
+
+    max_gather : int, optional
+        Requests per batch at most. The default is MAX_GATHER.
+
+    max_delay : float, optional
+        Seconds the first request of a batch waits for others. The default is MAX_DELAY.
+    """
+
+    def __init__(self, classifier: BatchClassifier, max_gather: int = MAX_GATHER, max_delay: float = MAX_DELAY):
+        self.classifier = classifier
+        self.max_gather = max_gather
+        self.max_delay = max_delay
+        self.batches = 0
+        self._pending = []
+        self._flush_handle = None
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        # running batches, referenced until they finish
+        self._running = set()
+
+    async def classify(self, image) -> tuple[int, float]:
+        """(class index, probability) of one image, classified with others that arrive meanwhile."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((_as_batch(image, self.classifier.pixel_scale)[0], future))
+        if len(self._pending) >= self.max_gather:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.max_delay, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        pending, self._pending = self._pending, []
+        if pending:
+            task = asyncio.ensure_future(self._run(pending))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run(self, pending):
+        loop = asyncio.get_running_loop()
+        batch = np.stack([image for image, _ in pending])
+        self.batches += 1
+        try:
+            probabilities = await loop.run_in_executor(self._executor, self.classifier._probabilities, batch)
+        except Exception as error:
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        labels = probabilities.argmax(axis=1)
+        for (_, future), label, row in zip(pending, labels, probabilities):
+            if not future.done():
+                future.set_result((int(label), float(row[label])))
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+
+# median seconds of one classify() call of a single image, over the first count images
+def _latency(classify: callable, images, count: int) -> float:
+    times = []
+    for image in images[:count]:
+        started = time.perf_counter()
+        classify(image)
+        times.append(time.perf_counter() - started)
+    return float(np.median(times))
+
+
+def benchmark(classifiers: dict, images, labels, single: int = 200) -> dict:
+    """Latency, throughput and accuracy of each classifier on the test set.
+
+    Returns {name: {"latency_ms": single image median, "images_per_second": whole test
+    set in batches, "accuracy"}}. A "keras predict" entry measures what the notebook
+    does, model.predict on one image at a time, for the first Classifier.
+    """
+    results = {}
+    for name, classifier in classifiers.items():
+        classifier.classify(images[:classifier.batch_size])  # warm up: tracing, tensor allocation
+        latency = _latency(classifier.classify, images, single)
+        started = time.perf_counter()
+        predicted, _ = classifier.classify(images)
+        seconds = time.perf_counter() - started
+        results[name] = {
+            "latency_ms": 1000 * latency,
+            "images_per_second": len(images) / seconds,
+            "accuracy": float(np.mean(predicted == labels)),
+        }
+
+    keras_name = next((name for name, classifier in classifiers.items() if isinstance(classifier, Classifier)), None)
+    if keras_name is not None:
+        model, scale = classifiers[keras_name].model, classifiers[keras_name].pixel_scale
+
+        def predict_one(image):
+            return model.predict(tf.expand_dims(_as_batch(image, scale)[0], axis=0), verbose=0)
+
+        predict_one(images[0])
+        latency = _latency(predict_one, images, min(single, 50))
+        results["keras predict"] = {"latency_ms": 1000 * latency, "images_per_second": 1 / latency,
+                                    "accuracy": results[keras_name]["accuracy"]}
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Classify Fashion-MNIST images, export int8 TFLite, benchmark.")
+    parser.add_argument("--weights", default="model.weights.h5", help="weights of model_arch()")
+    parser.add_argument("--raw-pixels", action="store_true", help="the weights were trained on 0-255 pixels")
+    parser.add_argument("--tflite", default=None, help="int8 TFLite model, exported first if missing")
+    parser.add_argument("--benchmark", action="store_true", help="compare float32 and int8 on testX/testy")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    pixel_scale = 1.0 if args.raw_pixels else PIXEL_SCALE
+    classifiers = {"float32": Classifier(args.weights, pixel_scale, args.batch_size)}
+    if args.tflite:
+        if not os.path.exists(args.tflite):
+            size = export_tflite(classifiers["float32"].model, args.tflite, pixel_scale=pixel_scale)
+            print("exported %s, %.0f kB" % (args.tflite, size / 1024))
+        classifiers["int8"] = TFLiteClassifier(args.tflite, pixel_scale, args.batch_size)
+
+    _, (testX, testy) = load_data()
+    if not args.benchmark:
+        for name, classifier in classifiers.items():
+            predicted, _ = classifier.classify(testX)
+            print("%-8s test accuracy %.2f%%" % (name, 100 * np.mean(predicted == testy)))
+        return
+
+    print("%-14s %12s %14s %9s" % ("", "latency ms", "images/s", "accuracy"))
+    for name, result in benchmark(classifiers, testX, testy).items():
+        print("%-14s %12.3f %14.0f %8.2f%%" % (name, result["latency_ms"], result["images_per_second"],
+                                              100 * result["accuracy"]))
+
+
+if __name__ == "__main__":
+    main()
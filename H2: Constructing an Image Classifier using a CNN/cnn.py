@@ -0,0 +1,122 @@
+# the notebook's Fashion-MNIST CNN, trained through the tf.data pipeline in pipeline.py
+#
+# (trainX, trainy), (testX, testy) = load_data()        # uint8, shape (n, 28, 28, 1), scaled in the pipeline
+# model, history = train(epochs=30)                     # early stopping, checkpoints, samples/s
+#
+# python cnn.py --epochs 30 -o model.weights.h5
+#
+# the notebook fitted raw 0-255 pixels cast to float32, for a fixed 10 epochs of 100 steps.
+# here pixels are scaled to [0, 1] inside the pipeline and training runs until the
+# validation loss stops improving. weights trained either way only suit inputs scaled
+# the same way, see PIXEL_SCALE
+import argparse
+
+import numpy as np
+from tensorflow import keras
+from tensorflow.keras.layers import Conv2D, Dense, Flatten, MaxPooling2D
+from tensorflow.keras.models import Sequential
+from tensorflow.keras.optimizers import Adam
+
+import pipeline
+
+LABELS = ['t_shirt', 'trouser', 'pullover',
+          'dress', 'coat', 'sandal', 'shirt',
+          'sneaker', 'bag', 'ankle_boots']
+
+# the factor train() scales pixels by; the notebook's own model.h5 was trained with 1
+PIXEL_SCALE = 1 / 255
+
+# share of the training images held out for validation, the last ones like Keras' validation_split
+VALIDATION_SPLIT = 0.33
+
+# batch sizes tried when train() is not given one, small enough to still generalise
+BATCH_SIZES = (32, 64, 128, 256)
+
+
+def model_arch():
+    models = Sequential()
+
+    # learning 28 filters with kernal size of 3x3
+    models.add(Conv2D(28, (3, 3),
+                      padding="same",
+                      activation="relu",
+                      input_shape=(28, 28, 1)))
+
+    # max pooling reduces size with kernal size of 2x2
+    models.add(MaxPooling2D(pool_size=(2, 2)))
+    models.add(Conv2D(112, (3, 3), padding="same",
+                      activation="relu"))
+
+    models.add(MaxPooling2D(pool_size=(2, 2)))
+    models.add(Conv2D(224, (3, 3), padding="same",
+                      activation="relu"))
+
+    models.add(MaxPooling2D(pool_size=(2, 2)))
+
+    # when convolutional and pooling operations are done layers is flattened and fully connected layers are added
+    models.add(Flatten())
+    models.add(Dense(224, activation="relu"))
+
+    # with total 10 classes to add a FCC layer of 10 is created with softmax activation function
+    models.add(Dense(10, activation="softmax"))
+    return models
+
+
+def build_model() -> keras.Model:
+    model = model_arch()
+    model.compile(optimizer=Adam(learning_rate=1e-3),
+                  loss='sparse_categorical_crossentropy',
+                  metrics=['sparse_categorical_accuracy'])
+    return model
+
+
+# Fashion-MNIST as uint8 images with a channel axis, (trainX, trainy), (testX, testy)
+def load_data():
+    (trainX, trainy), (testX, testy) = keras.datasets.fashion_mnist.load_data()
+    return (trainX[..., np.newaxis], trainy), (testX[..., np.newaxis], testy)
+
+
+def train(epochs: int = 30, batch_size: int = None, checkpoint: str = "checkpoints/cnn.weights.h5",
+          patience: int = pipeline.PATIENCE, seed: int = None):
+    """Train model_arch() on Fashion-MNIST, returns (model, history).
+
+    Pixels are scaled by PIXEL_SCALE in the pipeline. epochs is an upper bound,
+    training stops once the validation loss has not improved for patience epochs and
+    keeps the best weights. Without a batch_size the fastest of BATCH_SIZES is used.
+    history.history["samples_per_second"] has the throughput of each epoch.
+    """
+    (trainX, trainy), _ = load_data()
+    split = int(len(trainX) * (1 - VALIDATION_SPLIT))
+    options = {"scale": PIXEL_SCALE, "seed": seed}
+
+    if batch_size is None:
+        batch_size = pipeline.tune_batch_size(build_model, trainX[:split], trainy[:split], BATCH_SIZES,
+                                              shuffle=True, **options)
+    model = build_model()
+    train_set = pipeline.make_dataset(trainX[:split], trainy[:split], batch_size, shuffle=True, **options)
+    validation_set = pipeline.make_dataset(trainX[split:], trainy[split:], batch_size, **options)
+    history = pipeline.fit(model, train_set, validation_set, epochs, split, checkpoint, patience)
+    return model, history
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train the Fashion-MNIST CNN.")
+    parser.add_argument("--epochs", type=int, default=30, help="at most, training stops early")
+    parser.add_argument("--batch-size", type=int, default=None, help="default: the fastest on this machine")
+    parser.add_argument("--patience", type=int, default=pipeline.PATIENCE)
+    parser.add_argument("--checkpoint", default="checkpoints/cnn.weights.h5")
+    parser.add_argument("-o", "--output", default="model.weights.h5")
+    args = parser.parse_args(argv)
+
+    model, history = train(args.epochs, args.batch_size, args.checkpoint, args.patience)
+    model.save_weights(args.output)
+
+    _, (testX, testy) = load_data()
+    _, accuracy = model.evaluate(pipeline.make_dataset(testX, testy, 256, scale=PIXEL_SCALE), verbose=0)
+    rates = history.history["samples_per_second"]
+    print("%d epochs, %.0f samples/s on average, test accuracy %.2f%%, weights saved to %s" % (
+        len(rates), sum(rates) / len(rates), 100 * accuracy, args.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+# tf.data training pipeline of the Fashion-MNIST CNN (cnn.py)
+#
+# train = make_dataset(x, y, batch_size=64, shuffle=True, scale=1 / 255)
+# history = fit(model, train, val, epochs=30, samples=len(x), checkpoint="checkpoints/cnn.weights.h5")
+# history.history["samples_per_second"]
+#
+# the images are scaled once inside the pipeline and cached as float32 tensors, then
+# shuffled, batched and prefetched so the host prepares the next batches while the model
+# trains. training stops once the validation loss has not improved for patience epochs,
+# keeping the best weights, which are also checkpointed as they improve
+import os
+import time
+
+import numpy as np
+import tensorflow as tf
+from tensorflow import keras
+
+SHUFFLE_BUFFER = 16384
+
+# epochs without a better validation loss before training stops
+PATIENCE = 5
+
+
+def make_dataset(x, y, batch_size: int = 256, shuffle: bool = False, scale: float = None,
+                 seed: int = None) -> tf.data.Dataset:
+    """Batched, prefetched (images, labels) dataset of in-memory arrays.
+
+    Parameters
+    ----------
+    x : array
+        The images, any numeric dtype; they are cast to float32.
+
+    y : array
+        The labels.
+
+    batch_size : int, optional
+        The default is 256.
+
+    shuffle : bool, optional
+        Reshuffle every epoch, for training sets. The default is False.
+
+    scale : float, optional
+        The images are multiplied by it, e.g. 1 / 255 for pixels. Computed once,
+        before the cache.
+    """
+    x = np.asarray(x)
+    dataset = tf.data.Dataset.from_tensor_slices((x, np.asarray(y)))
+
+    def normalise(images, labels):
+        images = tf.cast(images, tf.float32)
+        if scale is not None:
+            images = images * scale
+        return images, labels
+
+    dataset = dataset.map(normalise, num_parallel_calls=tf.data.AUTOTUNE).cache()
+    if shuffle:
+        dataset = dataset.shuffle(min(len(x), SHUFFLE_BUFFER), seed=seed, reshuffle_each_iteration=True)
+    return dataset.batch(batch_size).prefetch(tf.data.AUTOTUNE)
+
+
+class Throughput(keras.callbacks.Callback):
+    """Records the training samples per second of each epoch.
+
+    The rate is added to the epoch's logs as samples_per_second, so it lands in the
+    History next to the losses, and kept in self.rates.
+
+    Parameters
+    ----------
+    samples : int
+        Training samples in an epoch.
+    """
+
+    def __init__(self, samples: int):
+        super().__init__()
+        self.samples = samples
+        self.rates = []
+        self._started = None
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._started = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        rate = self.samples / (time.perf_counter() - self._started)
+        self.rates.append(rate)
+        if logs is not None:
+            logs["samples_per_second"] = rate
+
+
+def fit(model: keras.Model, train: tf.data.Dataset, validation: tf.data.Dataset, epochs: int, samples: int,
+        checkpoint: str = None, patience: int = PATIENCE, verbose: int = 2) -> keras.callbacks.History:
+    """model.fit with early stopping, checkpoints and per epoch throughput.
+
+    samples is the number of training samples in an epoch. epochs is an upper bound,
+    training usually stops earlier. The best weights are restored at the end and, with
+    a checkpoint path, saved there as they improve.
+    """
+    callbacks = [keras.callbacks.EarlyStopping(monitor="val_loss", patience=patience, restore_best_weights=True),
+                 Throughput(samples)]
+    if checkpoint is not None:
+        os.makedirs(os.path.dirname(checkpoint) or ".", exist_ok=True)
+        callbacks.append(keras.callbacks.ModelCheckpoint(checkpoint, monitor="val_loss", save_best_only=True,
+                                                         save_weights_only=True))
+    return model.fit(train, validation_data=validation, epochs=epochs, verbose=verbose, callbacks=callbacks)
+
+
+def tune_batch_size(build: callable, x, y, candidates, steps: int = 20, **dataset_options) -> int:
+    """The batch size in candidates that trains fastest on this machine, in samples per second.
+
+    build() returns a fresh compiled model. Each candidate trains for steps batches
+    after one warm-up batch, which pays for tracing; keyword arguments go to make_dataset.
+    Larger batches are faster per sample on CPUs up to a point, but generalise worse,
+    so only sizes that suit the model should be offered.
+    """
+    rates = {}
+    for batch_size in candidates:
+        if batch_size * (steps + 1) > len(x):
+            continue
+        dataset = make_dataset(x, y, batch_size, **dataset_options)
+        model = build()
+        model.fit(dataset.take(1), verbose=0)
+        started = time.perf_counter()
+        model.fit(dataset.skip(1).take(steps), verbose=0)
+        rates[batch_size] = batch_size * steps / (time.perf_counter() - started)
+    if not rates:
+        return min(candidates)
+    return max(rates, key=rates.get)